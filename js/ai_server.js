@@ -2,7 +2,8 @@ const express = require('express');
 const cors = require('cors');
 const fs = require('fs');
 const path = require('path');
-const { execSync } = require('child_process');
+const readline = require('readline');
+const { spawn } = require('child_process');
 
 const app = express();
 const PORT = 3001;
@@ -16,20 +17,290 @@ app.use(express.urlencoded({ extended: true }));
 const PYTHON_PATH = '/Volumes/600g/app1/okx-py/bin/python3';
 const OCR_SCRIPT = '/Volumes/600g/app1/doubao获取/python/doubao_ocr_all.py';
 const BROWSER_SERVER_URL = 'http://localhost:3000';
+const OCR_WORKERS = Math.max(1, parseInt(process.env.OCR_WORKERS, 10) || 2); // 常驻Python工作进程数
+const OCR_TIMEOUT = Math.max(1000, parseInt(process.env.OCR_TIMEOUT, 10) || 180000); // 单个请求的超时时间（毫秒）
+
+// 常驻Python工作进程池：每个进程运行 doubao_ocr_all.py worker，通过标准输入输出逐行交换JSON，
+// 每个进程同时处理一个请求，请求在所有进程忙碌时排队，进程退出或超时后自动重启
+class PythonWorkerPool {
+    constructor(pythonPath, scriptPath, size, scriptArgs = [], timeoutMs = 180000) {
+        this.pythonPath = pythonPath;
+        this.scriptPath = scriptPath;
+        this.size = size;
+        this.scriptArgs = scriptArgs;
+        this.timeoutMs = timeoutMs;
+        this.restartDelay = 1000; // 进程异常退出后的重启间隔
+        this.workers = [];
+        this.queue = []; // 等待空闲进程的请求
+        this.nextId = 1;
+        this.running = false;
+        this.stats = { completed: 0, failed: 0, restarts: 0 };
+    }
+
+    // 启动所有工作进程
+    start() {
+        this.running = true;
+        for (let i = 0; i < this.size; i++) {
+            const worker = { index: i, process: null, current: null, timer: null };
+            this.workers.push(worker);
+            this.spawnWorker(worker);
+        }
+    }
+
+    // 启动单个工作进程
+    spawnWorker(worker) {
+        const child = spawn(this.pythonPath, [this.scriptPath, 'worker', ...this.scriptArgs], {
+            stdio: ['pipe', 'pipe', 'pipe']
+        });
+        worker.process = child;
+
+        readline.createInterface({ input: child.stdout }).on('line', line => this.handleLine(worker, line));
+        readline.createInterface({ input: child.stderr }).on('line', line => {
+            console.log(`[OCR工作进程 ${worker.index}] ${line}`);
+        });
+
+        // 进程退出后写入标准输入会产生EPIPE错误，由退出事件统一处理
+        child.stdin.on('error', () => {});
+        child.on('error', error => {
+            console.error(`OCR工作进程 ${worker.index} 启动失败:`, error.message);
+            // 进程未能启动时不会触发退出事件
+            if (child.pid === undefined) {
+                this.handleExit(worker, child, `启动失败: ${error.message}`);
+            }
+        });
+        child.on('exit', (code, signal) => {
+            this.handleExit(worker, child, `code=${code}, signal=${signal}`);
+        });
+    }
+
+    // 工作进程退出：当前请求返回失败，并在进程池运行时重启进程
+    handleExit(worker, child, reason) {
+        if (worker.process !== child) {
+            return;
+        }
+        worker.process = null;
+        this.finish(worker, new Error(`OCR工作进程已退出 (${reason})`));
+        if (this.running) {
+            this.stats.restarts++;
+            console.warn(`OCR工作进程 ${worker.index} 已退出，${this.restartDelay / 1000} 秒后重启`);
+            setTimeout(() => {
+                if (this.running) {
+                    this.spawnWorker(worker);
+                    this.dispatch();
+                }
+            }, this.restartDelay);
+        }
+    }
+
+    // 处理工作进程输出的一行响应
+    handleLine(worker, line) {
+        let response;
+        try {
+            response = JSON.parse(line);
+        } catch (error) {
+            console.warn(`OCR工作进程 ${worker.index} 输出无法解析: ${line}`);
+            return;
+        }
+        if (!worker.current || response.id !== worker.current.id) {
+            return;
+        }
+        if (response.ok) {
+            this.finish(worker, null, response.result);
+        } else {
+            this.finish(worker, new Error(response.error || 'OCR工作进程处理失败'));
+        }
+        this.dispatch();
+    }
+
+    // 结束工作进程当前的请求
+    finish(worker, error, result) {
+        const job = worker.current;
+        if (!job) {
+            return;
+        }
+        worker.current = null;
+        clearTimeout(worker.timer);
+        worker.timer = null;
+        if (error) {
+            this.stats.failed++;
+            job.reject(error);
+        } else {
+            this.stats.completed++;
+            job.resolve(result);
+        }
+    }
+
+    // 提交请求，返回工作进程的处理结果
+    request(op, params = {}) {
+        return new Promise((resolve, reject) => {
+            this.queue.push({ id: this.nextId++, op, params, resolve, reject });
+            this.dispatch();
+        });
+    }
+
+    // 把排队的请求分配给空闲的工作进程
+    dispatch() {
+        for (const worker of this.workers) {
+            if (this.queue.length === 0) {
+                break;
+            }
+            if (!worker.process || worker.current) {
+                continue;
+            }
+            const job = this.queue.shift();
+            worker.current = job;
+            // 超时的进程可能卡在浏览器服务器请求上，直接结束进程，由退出事件负责重启
+            worker.timer = setTimeout(() => {
+                console.warn(`OCR工作进程 ${worker.index} 处理请求超时，重启进程`);
+                this.finish(worker, new Error(`OCR请求超时（${this.timeoutMs / 1000} 秒）`));
+                worker.process.kill();
+            }, this.timeoutMs);
+            worker.process.stdin.write(JSON.stringify({ id: job.id, op: job.op, ...job.params }) + '\n');
+        }
+    }
+
+    // 进程池状态
+    getStatus() {
+        return {
+            size: this.size,
+            alive: this.workers.filter(worker => worker.process).length,
+            busy: this.workers.filter(worker => worker.current).length,
+            queued: this.queue.length,
+            ...this.stats
+        };
+    }
+
+    // 停止所有工作进程，排队中的请求返回失败
+    stop() {
+        this.running = false;
+        for (const job of this.queue.splice(0)) {
+            job.reject(new Error('OCR工作进程池已停止'));
+        }
+        for (const worker of this.workers) {
+            if (worker.process) {
+                worker.process.stdin.end();
+                worker.process.kill();
+            }
+        }
+    }
+}
+
+const ocrWorkers = new PythonWorkerPool(PYTHON_PATH, OCR_SCRIPT, OCR_WORKERS,
+    ['--server', BROWSER_SERVER_URL], OCR_TIMEOUT);
+
+// 调用浏览器服务器接口
+async function callBrowserServer(method, route, data = null) {
+    const response = await fetch(`${BROWSER_SERVER_URL}${route}`, {
+        method,
+        headers: { 'Content-Type': 'application/json' },
+        body: data ? JSON.stringify(data) : undefined
+    });
+    return response.json();
+}
+
+// 流式聊天补全：读取浏览器服务器 /textChatStream 的NDJSON事件，以SSE格式转发为 chat.completion.chunk
+async function streamChatCompletion(res, pageId, userMessage, model) {
+    const id = `chatcmpl-${Date.now()}`;
+    const created = Math.floor(Date.now() / 1000);
+    const chunk = (delta, finishReason = null) => ({
+        id,
+        object: "chat.completion.chunk",
+        created,
+        model: model || "doubao-1.0",
+        choices: [{ index: 0, delta, finish_reason: finishReason }]
+    });
+    const writeEvent = data => {
+        if (!res.writableEnded) {
+            res.write(`data: ${typeof data === 'string' ? data : JSON.stringify(data)}\n\n`);
+        }
+    };
+
+    // 客户端断开连接时中止上游请求，浏览器服务器随之中止处理
+    const controller = new AbortController();
+    res.on('close', () => controller.abort());
+
+    res.writeHead(200, {
+        'Content-Type': 'text/event-stream; charset=utf-8',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive'
+    });
+    writeEvent(chunk({ role: "assistant", content: "" }));
+
+    let completionLength = 0;
+    try {
+        const response = await fetch(`${BROWSER_SERVER_URL}/textChatStream`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ pageId, message: userMessage }),
+            signal: controller.signal
+        });
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            throw new Error(data.error || `HTTP ${response.status}`);
+        }
+
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finished = false;
+        for await (const bytes of response.body) {
+            buffer += decoder.decode(bytes, { stream: true });
+            let newline;
+            while ((newline = buffer.indexOf('\n')) !== -1) {
+                const line = buffer.slice(0, newline).trim();
+                buffer = buffer.slice(newline + 1);
+                if (!line) {
+                    continue;
+                }
+                const event = JSON.parse(line);
+                if (event.type === 'delta' && event.text) {
+                    completionLength += event.text.length;
+                    writeEvent(chunk({ content: event.text }));
+                } else if (event.type === 'error') {
+                    throw new Error(event.error);
+                } else if (event.type === 'done') {
+                    if (!event.success) {
+                        throw new Error('Chat failed');
+                    }
+                    finished = true;
+                }
+            }
+        }
+        if (!finished) {
+            throw new Error('Chat stream ended unexpectedly');
+        }
+
+        const final = chunk({}, "stop");
+        final.usage = {
+            prompt_tokens: userMessage.length,
+            completion_tokens: completionLength,
+            total_tokens: userMessage.length + completionLength
+        };
+        writeEvent(final);
+        writeEvent('[DONE]');
+    } catch (error) {
+        if (!controller.signal.aborted) {
+            console.error('Chat completion stream error:', error);
+            writeEvent({ error: { message: error.message, type: "server_error" } });
+        }
+    } finally {
+        res.end();
+    }
+}
 
 // 健康检查
 app.get('/health', (req, res) => {
     res.json({
         status: 'ok',
         timestamp: new Date().toISOString(),
-        service: 'doubao-ai-api'
+        service: 'doubao-ai-api',
+        ocrWorkers: ocrWorkers.getStatus()
     });
 });
 
 // 标准AI接口：聊天补全
-app.post('/v1/chat/completions', (req, res) => {
+app.post('/v1/chat/completions', async (req, res) => {
     try {
-        const { messages, model, max_tokens, temperature } = req.body;
+        const { messages, model, max_tokens, temperature, stream } = req.body;
         
         // 验证请求
         if (!messages || !Array.isArray(messages) || messages.length === 0) {
@@ -56,10 +327,8 @@ app.post('/v1/chat/completions', (req, res) => {
         
         const userMessage = lastMessage.content;
         
-        // 使用curl调用现有的browser_server
-        let cmd = `curl -X GET ${BROWSER_SERVER_URL}/createPage`;
-        const pageIdResult = execSync(cmd).toString();
-        const pageIdData = JSON.parse(pageIdResult);
+        // 调用现有的browser_server
+        const pageIdData = await callBrowserServer('GET', '/createPage');
         
         if (!pageIdData.success) {
             throw new Error('Failed to create page');
@@ -67,11 +336,18 @@ app.post('/v1/chat/completions', (req, res) => {
         
         const pageId = pageIdData.pageId;
         
+        if (stream) {
+            try {
+                await streamChatCompletion(res, pageId, userMessage, model);
+            } finally {
+                await callBrowserServer('GET', `/closePage?pageId=${pageId}`).catch(() => {});
+            }
+            return;
+        }
+        
         try {
             // 发送消息
-            cmd = `curl -X POST ${BROWSER_SERVER_URL}/textChat -H "Content-Type: application/json" -d '{"pageId": ${pageId}, "message": "${userMessage}"}'`;
-            const chatResult = execSync(cmd).toString();
-            const chatData = JSON.parse(chatResult);
+            const chatData = await callBrowserServer('POST', '/textChat', { pageId, message: userMessage });
             
             if (!chatData.success) {
                 throw new Error('Chat failed');
@@ -99,8 +375,7 @@ app.post('/v1/chat/completions', (req, res) => {
             });
         } finally {
             // 关闭页面
-            cmd = `curl -X GET ${BROWSER_SERVER_URL}/closePage?pageId=${pageId}`;
-            execSync(cmd, { stdio: 'ignore' });
+            await callBrowserServer('GET', `/closePage?pageId=${pageId}`).catch(() => {});
         }
         
     } catch (error) {
@@ -115,7 +390,8 @@ app.post('/v1/chat/completions', (req, res) => {
 });
 
 // 标准AI接口：OCR识别
-app.post('/v1/ocr/recognize', (req, res) => {
+app.post('/v1/ocr/recognize', async (req, res) => {
+    let imagePath = '';
     try {
         const { image_url, image_base64, question, type } = req.body;
         
@@ -129,54 +405,32 @@ app.post('/v1/ocr/recognize', (req, res) => {
             });
         }
         
-        let imagePath = '';
-        let cmd = '';
+        // 临时文件名加入随机后缀，避免并发请求互相覆盖
+        const tempName = `${Date.now()}_${Math.random().toString(36).slice(2, 8)}`;
+        let ocrData;
         
         if (type === 'screenshot') {
             // 屏幕截图OCR
-            cmd = `${PYTHON_PATH} ${OCR_SCRIPT} screenshot`;
-            if (question) {
-                cmd += ` --question "${question}"`;
-            }
-        } else if (image_url) {
-            // 图片URL（需要先下载）
-            const tempPath = `/tmp/${Date.now()}_ocr_image`;
-            execSync(`curl -o ${tempPath} ${image_url}`);
-            imagePath = tempPath;
-            
-            cmd = `${PYTHON_PATH} ${OCR_SCRIPT} ocr ${imagePath}`;
-            if (question) {
-                cmd += ` --question "${question}"`;
+            ocrData = await ocrWorkers.request('screenshot', { question });
+        } else {
+            if (image_url) {
+                // 图片URL（需要先下载）
+                const download = await fetch(image_url);
+                if (!download.ok) {
+                    throw new Error(`Failed to download image: HTTP ${download.status}`);
+                }
+                imagePath = `/tmp/${tempName}_ocr_image`;
+                await fs.promises.writeFile(imagePath, Buffer.from(await download.arrayBuffer()));
+            } else {
+                // 图片base64
+                imagePath = `/tmp/${tempName}_ocr_image.png`;
+                const base64Data = image_base64.replace(/^data:image\/\w+;base64,/, '');
+                await fs.promises.writeFile(imagePath, base64Data, { encoding: 'base64' });
             }
-        } else if (image_base64) {
-            // 图片base64
-            const tempPath = `/tmp/${Date.now()}_ocr_image.png`;
-            const base64Data = image_base64.replace(/^data:image\/\w+;base64,/, '');
-            fs.writeFileSync(tempPath, base64Data, { encoding: 'base64' });
-            imagePath = tempPath;
             
-            cmd = `${PYTHON_PATH} ${OCR_SCRIPT} ocr ${imagePath}`;
-            if (question) {
-                cmd += ` --question "${question}"`;
-            }
+            ocrData = await ocrWorkers.request('ocr', { image_path: imagePath, question });
         }
         
-        // 执行命令
-        const result = execSync(cmd).toString();
-        
-        // 清理临时文件
-        if (imagePath && fs.existsSync(imagePath)) {
-            fs.unlinkSync(imagePath);
-        }
-        
-        // 解析结果
-        const jsonMatch = result.match(/\{[\s\S]*\}/);
-        if (!jsonMatch) {
-            throw new Error('Failed to parse OCR result');
-        }
-        
-        const ocrData = JSON.parse(jsonMatch[0]);
-        
         // 返回标准格式
         res.json({
             id: `ocr-${Date.now()}`,
@@ -198,11 +452,16 @@ app.post('/v1/ocr/recognize', (req, res) => {
                 type: "server_error"
             }
         });
+    } finally {
+        // 清理临时文件
+        if (imagePath) {
+            fs.promises.unlink(imagePath).catch(() => {});
+        }
     }
 });
 
 // 标准AI接口：是/否判断
-app.post('/v1/moderations', (req, res) => {
+app.post('/v1/moderations', async (req, res) => {
     try {
         const { input, question } = req.body;
         
@@ -216,27 +475,24 @@ app.post('/v1/moderations', (req, res) => {
             });
         }
         
-        let cmd = `${PYTHON_PATH} ${OCR_SCRIPT} yesno`;
-        
-        if (question) {
-            cmd += ` --question "${question}"`;
-        }
+        const params = { question };
         
         if (typeof input === 'string') {
             // 文本输入，直接使用question
             if (!question) {
-                cmd += ` --question "Is this content acceptable?"`;
+                params.question = "Is this content acceptable?";
             }
         } else if (input?.image) {
             // 图片输入
-            cmd += ` --image "${input.image}"`;
+            params.image = input.image;
         } else if (input?.file) {
             // 文件输入
-            cmd += ` --file "${input.file}"`;
+            params.file = input.file;
         }
         
-        // 执行命令
-        const result = execSync(cmd).toString().trim();
+        // 交给工作进程判断，无法判断时与命令行输出一致
+        const { answer } = await ocrWorkers.request('yesno', params);
+        const result = answer || '无法判断';
         
         // 转换为标准格式
         const isPositive = result.toLowerCase() === 'yes';
@@ -313,20 +569,23 @@ app.post('/v1/files/upload', (req, res) => {
 });
 
 // 启动服务器
+ocrWorkers.start();
 app.listen(PORT, () => {
     console.log(`=== 豆包AI标准接口服务已启动 ===`);
     console.log(`服务地址: http://localhost:${PORT}`);
     console.log(`\n可用API:`);
     console.log(`GET  /health                     - 健康检查`);
-    console.log(`POST /v1/chat/completions        - 聊天补全`);
+    console.log(`POST /v1/chat/completions        - 聊天补全（stream: true 时以SSE流式返回）`);
     console.log(`POST /v1/ocr/recognize           - OCR识别`);
     console.log(`POST /v1/moderations             - 是/否判断`);
     console.log(`POST /v1/files/upload            - 文件上传`);
+    console.log(`\nOCR工作进程数: ${OCR_WORKERS}（环境变量 OCR_WORKERS）`);
     console.log(`\n按 Ctrl+C 停止服务`);
 });
 
 // 优雅关闭
 process.on('SIGINT', () => {
     console.log('\n正在关闭服务器...');
+    ocrWorkers.stop();
     process.exit(0);
 });
@@ -5,10 +5,496 @@ const http = require('http');
 const url = require('url');
 const querystring = require('querystring');
 
+// 请求被取消或超过截止时间时抛出的错误
+class RequestAbortedError extends Error {
+    constructor(reason) {
+        super(reason === 'deadline' ? '请求已超过截止时间' : '请求已被取消');
+        this.reason = reason; // 'deadline' 或 'cancelled'
+    }
+}
+
+// 单次请求的上下文，记录各阶段耗时，并负责截止时间和取消
+class RequestContext {
+    // requestId 请求ID（用于取消），timeoutMs 请求的剩余时间预算（毫秒），为空时不限制
+    constructor(route = '', { requestId = null, timeoutMs = null } = {}) {
+        this.route = route;
+        this.requestId = requestId;
+        this.deadline = timeoutMs ? Date.now() + timeoutMs : null;
+        this.abortReason = null;
+        this.abortListeners = new Set();
+        this.startTime = process.hrtime.bigint();
+        this.timings = {};
+    }
+
+    // 取消请求，正在等待的 sleep 立即结束，下一个阶段开始前抛出 RequestAbortedError
+    abort(reason = 'cancelled') {
+        if (this.abortReason) {
+            return;
+        }
+        this.abortReason = reason;
+        for (const listener of this.abortListeners) {
+            listener();
+        }
+        this.abortListeners.clear();
+    }
+
+    // 请求已被取消或超过截止时间时抛出 RequestAbortedError
+    check() {
+        if (!this.abortReason && this.deadline !== null && Date.now() >= this.deadline) {
+            this.abort('deadline');
+        }
+        if (this.abortReason) {
+            throw new RequestAbortedError(this.abortReason);
+        }
+    }
+
+    // 等待指定毫秒数，请求被取消或到达截止时间时提前结束并抛出 RequestAbortedError
+    sleep(ms) {
+        this.check();
+        return new Promise((resolve, reject) => {
+            const remaining = this.deadline === null ? ms : Math.min(ms, this.deadline - Date.now());
+            const onAbort = () => {
+                clearTimeout(timer);
+                reject(new RequestAbortedError(this.abortReason));
+            };
+            const timer = setTimeout(() => {
+                this.abortListeners.delete(onAbort);
+                try {
+                    if (remaining < ms) {
+                        this.check();
+                    }
+                    resolve();
+                } catch (error) {
+                    reject(error);
+                }
+            }, Math.max(0, remaining));
+            this.abortListeners.add(onAbort);
+        });
+    }
+
+    // 执行一个阶段并累计耗时（同名阶段多次执行时累加），阶段开始前和结束后检查是否已取消
+    async stage(name, fn) {
+        this.check();
+        const start = process.hrtime.bigint();
+        let result;
+        try {
+            result = await fn();
+        } finally {
+            this.addTiming(name, Number(process.hrtime.bigint() - start) / 1e6);
+        }
+        this.check();
+        return result;
+    }
+
+    // 累计阶段耗时（毫秒）
+    addTiming(name, ms) {
+        this.timings[name] = Math.round(((this.timings[name] || 0) + ms) * 100) / 100;
+    }
+
+    // 包含总耗时的阶段耗时
+    getTimings() {
+        const total = Number(process.hrtime.bigint() - this.startTime) / 1e6;
+        return { ...this.timings, total: Math.round(total * 100) / 100 };
+    }
+
+    // 生成 Server-Timing 响应头
+    serverTimingHeader() {
+        return Object.entries(this.getTimings())
+            .map(([name, ms]) => `${name};dur=${ms}`)
+            .join(', ');
+    }
+}
+
+// 请求队列已满时抛出的错误
+class QueueFullError extends Error {
+    constructor(queueDepth, retryAfter) {
+        super('请求队列已满，请稍后重试');
+        this.queueDepth = queueDepth;
+        this.retryAfter = retryAfter;
+    }
+}
+
+// 请求调度器：同一页面的请求按到达顺序串行执行，所有请求共享全局并发上限
+class RequestScheduler {
+    constructor(maxConcurrent = 4, maxQueue = 64) {
+        this.maxConcurrent = maxConcurrent;
+        this.maxQueue = maxQueue;
+        this.active = 0; // 正在执行的请求数
+        this.waiting = 0; // 排队中的请求数（等待页面锁或全局并发名额）
+        this.slotWaiters = []; // 等待全局并发名额的请求
+        this.pageLocks = new Map(); // 页面ID到该页面最后一个排队请求的映射
+        this.stats = {
+            completed: 0,
+            rejected: 0,
+            totalWaitMs: 0,
+            avgServiceMs: null
+        };
+    }
+
+    // 按页面串行、全局限制并发地执行任务，队列已满时抛出 QueueFullError
+    async run(pageId, ctx, task) {
+        const start = Date.now();
+        const pageBusy = pageId !== null && this.pageLocks.has(pageId);
+        const mustWait = pageBusy || this.active >= this.maxConcurrent || this.slotWaiters.length > 0;
+        if (mustWait && this.waiting >= this.maxQueue) {
+            this.stats.rejected++;
+            throw new QueueFullError(this.waiting, this.estimateRetryAfter());
+        }
+
+        let releasePage = null;
+        if (!mustWait) {
+            // 页面空闲且有并发名额，同步占用名额，立即执行
+            this.active++;
+            releasePage = pageId === null ? null : await this.lockPage(pageId);
+        } else {
+            this.waiting++;
+            releasePage = pageId === null ? null : await this.lockPage(pageId);
+            await this.acquireSlot();
+            this.waiting--;
+        }
+        const waited = Date.now() - start;
+        this.stats.totalWaitMs += waited;
+        ctx.addTiming('queueWait', waited);
+
+        let serviceStart = null;
+        try {
+            // 排队期间已被取消或超过截止时间的请求不再执行
+            ctx.check();
+            serviceStart = Date.now();
+            return await task();
+        } finally {
+            if (serviceStart !== null) {
+                this.recordService(Date.now() - serviceStart);
+            }
+            this.releaseSlot();
+            if (releasePage) {
+                releasePage();
+            }
+        }
+    }
+
+    // 获取页面锁，返回释放函数；同一页面的请求按FIFO顺序获得锁
+    lockPage(pageId) {
+        const previous = this.pageLocks.get(pageId) || Promise.resolve();
+        let release;
+        const current = new Promise(resolve => { release = resolve; });
+        const tail = previous.then(() => current);
+        this.pageLocks.set(pageId, tail);
+        return previous.then(() => () => {
+            release();
+            if (this.pageLocks.get(pageId) === tail) {
+                this.pageLocks.delete(pageId);
+            }
+        });
+    }
+
+    // 获取全局并发名额
+    acquireSlot() {
+        if (this.active < this.maxConcurrent) {
+            this.active++;
+            return Promise.resolve();
+        }
+        return new Promise(resolve => this.slotWaiters.push(resolve));
+    }
+
+    // 释放全局并发名额，直接交给下一个等待的请求
+    releaseSlot() {
+        const next = this.slotWaiters.shift();
+        if (next) {
+            next();
+        } else {
+            this.active--;
+        }
+    }
+
+    // 记录请求处理耗时（指数加权平均）
+    recordService(ms) {
+        const stats = this.stats;
+        stats.completed++;
+        stats.avgServiceMs = stats.avgServiceMs === null ? ms : Math.round(stats.avgServiceMs * 0.8 + ms * 0.2);
+    }
+
+    // 估算排队请求全部开始执行所需的秒数，作为重试等待时间提示
+    estimateRetryAfter() {
+        const serviceMs = this.stats.avgServiceMs || 1000;
+        return Math.max(1, Math.ceil((this.waiting + 1) * serviceMs / this.maxConcurrent / 1000));
+    }
+
+    // 调度器状态
+    getStatus() {
+        return {
+            maxConcurrent: this.maxConcurrent,
+            maxQueue: this.maxQueue,
+            active: this.active,
+            queueDepth: this.waiting,
+            completed: this.stats.completed,
+            rejected: this.stats.rejected,
+            avgWaitMs: this.stats.completed > 0 ? Math.round(this.stats.totalWaitMs / this.stats.completed) : null,
+            avgServiceMs: this.stats.avgServiceMs
+        };
+    }
+}
+
+// 按资源类型拦截时始终放行的类型，它们承载页面本身和聊天流程
+const PROTECTED_RESOURCE_TYPES = new Set(['document', 'xhr', 'fetch', 'eventsource', 'websocket']);
+
+// 将URL规则转换为正则表达式，支持 * 通配符，不含通配符时按子串匹配
+function compileUrlPattern(pattern) {
+    const escaped = pattern.replace(/[.+?^${}()|[\]\\]/g, '\\$&').replace(/\*/g, '.*');
+    return new RegExp(pattern.includes('*') ? `^${escaped}$` : escaped);
+}
+
+// 网络请求过滤规则：按资源类型和URL规则拦截，放行规则优先
+class NetworkFilter {
+    constructor({ blockTypes = [], blockUrls = [], allowUrls = [] } = {}) {
+        this.blockTypes = new Set(blockTypes.filter(type => !PROTECTED_RESOURCE_TYPES.has(type)));
+        this.blockUrls = blockUrls.map(compileUrlPattern);
+        this.allowUrls = allowUrls.map(compileUrlPattern);
+        this.ignoredTypes = blockTypes.filter(type => PROTECTED_RESOURCE_TYPES.has(type));
+    }
+
+    // 是否启用了任何拦截规则
+    isEnabled() {
+        return this.blockTypes.size > 0 || this.blockUrls.length > 0;
+    }
+
+    // 判断请求是否应被拦截
+    shouldBlock(resourceType, requestUrl) {
+        if (this.allowUrls.some(pattern => pattern.test(requestUrl))) {
+            return false;
+        }
+        return this.blockTypes.has(resourceType) ||
+               this.blockUrls.some(pattern => pattern.test(requestUrl));
+    }
+
+    // 规则描述
+    describe() {
+        return {
+            blockTypes: Array.from(this.blockTypes),
+            blockUrls: this.blockUrls.map(pattern => pattern.source),
+            allowUrls: this.allowUrls.map(pattern => pattern.source)
+        };
+    }
+}
+
+// 从聊天接口流式响应的单个事件中提取文本
+function extractStreamChunk(payload) {
+    if (!payload || typeof payload !== 'object') {
+        return '';
+    }
+    // 豆包格式：event_data 为JSON字符串，其中 message.content 也是JSON字符串
+    if (typeof payload.event_data === 'string') {
+        try {
+            return extractStreamChunk(JSON.parse(payload.event_data));
+        } catch (error) {
+            return '';
+        }
+    }
+    if (payload.message && typeof payload.message.content === 'string') {
+        const content = payload.message.content;
+        try {
+            const parsed = JSON.parse(content);
+            return parsed && typeof parsed.text === 'string' ? parsed.text : '';
+        } catch (error) {
+            return content;
+        }
+    }
+    // OpenAI兼容格式
+    if (Array.isArray(payload.choices) && payload.choices.length > 0) {
+        const choice = payload.choices[0];
+        const delta = choice.delta || choice.message || {};
+        return typeof delta.content === 'string' ? delta.content : '';
+    }
+    return typeof payload.text === 'string' ? payload.text : '';
+}
+
+// 聊天接口流式响应（SSE）的增量解析器：按到达顺序输入响应片段，返回新增的回复文本
+class ChatStreamParser {
+    constructor() {
+        this.buffer = ''; // 未读完的半行
+        this.text = ''; // 已拼接的回复文本
+        this.sse = false; // 是否已出现SSE格式的 data: 行
+        this.mode = null; // 'cumulative'（每次返回累计的全文）或 'delta'（只返回增量），整个响应只判断一次
+    }
+
+    // 输入一段响应内容，返回新增的回复文本
+    feed(chunk) {
+        this.buffer += chunk;
+        const lines = this.buffer.split('\n');
+        this.buffer = lines.pop();
+        return lines.map(line => this.parseLine(line)).join('');
+    }
+
+    // 响应结束，处理最后一行，返回新增的回复文本
+    end() {
+        const line = this.buffer;
+        this.buffer = '';
+        return this.parseLine(line);
+    }
+
+    parseLine(line) {
+        line = line.trim();
+        let data = line;
+        if (line.startsWith('data:')) {
+            this.sse = true;
+            data = line.slice(5).trim();
+        } else if (this.sse || !line.startsWith('{')) {
+            // SSE的 event:/id: 等行，或不是SSE格式时的非JSON行
+            return '';
+        }
+        if (!data || data === '[DONE]') {
+            return '';
+        }
+        let payload;
+        try {
+            payload = JSON.parse(data);
+        } catch (error) {
+            return '';
+        }
+        const chunk = extractStreamChunk(payload);
+        if (!chunk) {
+            return '';
+        }
+        // 有的接口每次返回累计的全文，有的只返回增量（包括豆包格式，响应中没有标明是哪一种）：
+        // 只有第二段文本严格更长且以已有文本开头时才按累计全文处理，
+        // 否则一律追加，连续相同的增量（如 "哈"、"哈"）不会被当作累计全文丢掉
+        if (this.mode === null && this.text) {
+            this.mode = chunk.length > this.text.length && chunk.startsWith(this.text) ? 'cumulative' : 'delta';
+        }
+        if (this.mode === 'cumulative' && chunk.startsWith(this.text)) {
+            const delta = chunk.slice(this.text.length);
+            this.text = chunk;
+            return delta;
+        }
+        this.text += chunk;
+        return chunk;
+    }
+}
+
+// 从聊天接口的流式响应（SSE）中拼接完整回复文本
+function parseChatStream(body) {
+    const parser = new ChatStreamParser();
+    parser.feed(body);
+    parser.end();
+    return parser.text;
+}
+
+// 调试截图模式
+const DEBUG_CAPTURE_MODES = new Set(['off', 'sampled', 'on-error', 'on']);
+
+// 调试截图：按模式决定是否截图，截图在后台写入目录并只保留最近的若干个文件，不占用请求耗时
+class DebugCapture {
+    constructor({ mode = 'on-error', sampleRate = 0.05, dir = 'debug_captures', maxFiles = 50, maxPending = 2 } = {}) {
+        if (!DEBUG_CAPTURE_MODES.has(mode)) {
+            throw new Error(`不支持的调试截图模式: ${mode}`);
+        }
+        this.mode = mode;
+        this.sampleRate = sampleRate;
+        this.dir = dir;
+        this.maxFiles = maxFiles;
+        this.maxPending = maxPending; // 同时进行中的截图数上限，超过时丢弃新的截图
+        this.pending = 0;
+        this.files = null; // 目录中已有的截图文件（按时间排序），首次写入时读取
+        this.stats = { captured: 0, skipped: 0, dropped: 0, failed: 0 };
+    }
+
+    // 判断是否需要截图，isError 表示验证码、异常等需要排查的情况
+    shouldCapture(isError) {
+        switch (this.mode) {
+            case 'on':
+                return true;
+            case 'on-error':
+                return isError;
+            case 'sampled':
+                return isError || Math.random() < this.sampleRate;
+            default:
+                return false;
+        }
+    }
+
+    // 在后台截图，不等待截图完成；label 和 reason 用于生成文件名
+    capture(page, label, reason, isError = false) {
+        if (!page || page.isClosed() || !this.shouldCapture(isError)) {
+            this.stats.skipped++;
+            return;
+        }
+        if (this.pending >= this.maxPending) {
+            this.stats.dropped++;
+            return;
+        }
+        this.pending++;
+        const fileName = `${Date.now()}_${label}_${reason}.png`;
+        this.write(page, fileName)
+            .then(() => {
+                this.stats.captured++;
+                console.log(`调试截图已保存: ${path.join(this.dir, fileName)}`);
+            })
+            .catch(error => {
+                this.stats.failed++;
+                console.error(`调试截图失败 (${fileName}):`, error.message);
+            })
+            .finally(() => {
+                this.pending--;
+            });
+    }
+
+    // 截图写入目录，并删除超出数量上限的旧文件
+    async write(page, fileName) {
+        const image = await page.screenshot({ type: 'png' });
+        if (!this.files) {
+            this.files = fs.promises.mkdir(this.dir, { recursive: true })
+                .then(() => fs.promises.readdir(this.dir))
+                .then(names => names.filter(name => name.endsWith('.png')).sort());
+        }
+        this.files = await this.files;
+        await fs.promises.writeFile(path.join(this.dir, fileName), image);
+        this.files.push(fileName);
+        while (this.files.length > this.maxFiles) {
+            const oldest = this.files.shift();
+            await fs.promises.unlink(path.join(this.dir, oldest)).catch(() => {});
+        }
+    }
+
+    // 截图配置和统计
+    getStatus() {
+        return {
+            mode: this.mode,
+            sampleRate: this.sampleRate,
+            dir: this.dir,
+            maxFiles: this.maxFiles,
+            pending: this.pending,
+            ...this.stats
+        };
+    }
+}
+
+// 需要经过请求调度器的接口（会操作浏览器页面）
+const SCHEDULED_ROUTES = new Set([
+    '/createPage', '/closePage', '/sendMessage', '/uploadFile', '/sendMessageWithFile',
+    '/getAIResponse', '/resetConversation', '/extractChatHistory', '/ocr', '/textChat', '/textChatStream'
+]);
+
 class DoubaoBrowserServer {
     constructor() {
-        this.browser = null;
+        this.browser = null; // 第一个浏览器实例，兼容单实例用法
+        this.instances = []; // 浏览器实例列表，页面按负载分配到各实例
+        this.pageInstances = new WeakMap(); // 页面实例到所属浏览器实例的映射
+        this.instanceRestartDelay = 5000; // 浏览器实例断开后的重启间隔
         this.pages = new Map(); // 页面ID到页面实例的映射
+        this.debugCapture = new DebugCapture({ dir: path.join(__dirname, 'debug_captures') });
+        this.pageMeta = new Map(); // 页面ID到租约信息（所有者、创建时间、最后使用时间、请求数、内存）的映射
+        this.pageLeaseMs = 10 * 60 * 1000; // 页面租约：超过该时间未使用也未续约的页面会被关闭
+        this.pageMaxLifetimeMs = 60 * 60 * 1000; // 页面最长使用时间，超过后替换为新页面
+        this.pageMaxRequests = 200; // 页面最多处理的请求数，超过后替换为新页面
+        this.pageHeapLimitMb = 512; // 页面JS堆内存上限（MB），超过后替换为新页面
+        this.reaperIntervalMs = 30 * 1000; // 回收检查间隔
+        this.reaperTimer = null;
+        this.reaping = false;
+        this.networkFilter = new NetworkFilter(); // 网络请求过滤规则，默认不拦截
+        this.networkStats = new WeakMap(); // 页面实例到网络请求统计的映射
+        this.chatStreamPattern = compileUrlPattern('chat/completion'); // 聊天接口URL规则，null表示不监听
+        this.chatCaptures = new WeakMap(); // 页面实例到聊天接口响应捕获状态的映射
+        this.chatStreamTimeout = 45000; // 等待聊天接口响应结束的最长时间
         this.pageCounter = 0;
         this.server = null;
         this.port = 3000;
@@ -18,10 +504,29 @@ class DoubaoBrowserServer {
         this.loginStatusFile = path.join(__dirname, 'login_status.json');
         this.loginStatus = null;
         this.loginExpireTime = 24 * 60 * 60 * 1000; // 登录状态有效期：24小时
+        this.sessionStates = new WeakMap(); // 页面实例到缓存的登录/验证码状态的映射
+        this.sessionStateTtl = 2000; // 缓存的登录/验证码状态有效期：2秒
+        this.poolSize = 0; // 预热页面池大小，0表示不预热
+        this.idlePages = []; // 预热好的空闲页面
+        this.poolRefilling = 0; // 正在后台创建的预热页面数
+        this.poolRetryDelay = 5000; // 预热失败后的重试间隔
+        this.scheduler = new RequestScheduler();
+        this.activeRequests = new Map(); // 请求ID到请求上下文集合的映射，用于取消请求
+        this.cancelledRequests = new Map(); // 已取消的请求ID到取消时间的映射
+        this.cancelledRequestTtl = 10 * 60 * 1000; // 已取消的请求ID保留时间
+        this.poolStats = {
+            hits: 0,
+            misses: 0,
+            refills: 0,
+            refillFailures: 0,
+            lastRefillMs: null,
+            totalRefillMs: 0
+        };
     }
 
     // 初始化浏览器
-    async init(headless = false) {
+    // instanceCount 大于1时启动多个浏览器实例，第一个实例使用原用户数据目录，其余实例使用其副本
+    async init(headless = false, instanceCount = 1) {
         console.log('正在启动浏览器...');
         
         // 检查并创建用户数据目录（如果不存在）
@@ -32,8 +537,40 @@ class DoubaoBrowserServer {
             console.log('使用已有的用户数据目录:', this.userDataDir);
         }
         
+        this.headless = headless;
+        // 先复制完所有副本再启动浏览器，避免复制正在被Chromium写入的数据库文件
+        const userDataDirs = [this.userDataDir];
+        for (let i = 1; i < instanceCount; i++) {
+            userDataDirs.push(this.copyUserDataDir(i));
+        }
+        for (let i = 0; i < instanceCount; i++) {
+            const instance = {
+                id: i,
+                userDataDir: userDataDirs[i],
+                browser: null,
+                connected: false,
+                openPages: 0,
+                launchedAt: null,
+                restarts: 0,
+                lastError: null
+            };
+            this.instances.push(instance);
+            await this.launchInstance(instance);
+        }
+        this.browser = this.instances[0].browser;
+
+        console.log(`浏览器启动成功！实例数: ${this.instances.length}`);
+        console.log('浏览器模式:', headless ? '无头模式' : '有头模式');
+        this.isRunning = true;
+        
+        // 加载登录状态
+        this.loadLoginStatus();
+    }
+    
+    // 启动浏览器进程
+    async launchBrowser(userDataDir, headless) {
         // 重写浏览器启动配置，避免窗口自动置顶
-        this.browser = await puppeteer.launch({
+        return puppeteer.launch({
             headless: headless,
             defaultViewport: null,
             // slowMo: 100, // 加快操作速度，移除调试延迟
@@ -70,20 +607,119 @@ class DoubaoBrowserServer {
                 '--start-maximized',
                 '--app'
             ],
-            userDataDir: this.userDataDir,
+            userDataDir: userDataDir,
             ignoreHTTPSErrors: true,
             dumpio: true // 输出浏览器进程的控制台日志
         });
+    }
 
-        console.log('浏览器启动成功！');
-        console.log('浏览器模式:', headless ? '无头模式' : '有头模式');
-        this.isRunning = true;
-        this.headless = headless;
-        
-        // 加载登录状态
-        this.loadLoginStatus();
+    // 复制主用户数据目录给其他浏览器实例使用，每次启动服务器时刷新以同步登录状态；
+    // 实例重启时主目录正被实例0使用，沿用已有的副本
+    copyUserDataDir(index) {
+        const target = `${this.userDataDir}_${index}`;
+        fs.rmSync(target, { recursive: true, force: true });
+        fs.cpSync(this.userDataDir, target, {
+            recursive: true,
+            // 跳过Chromium的进程锁文件，否则副本会被认为正在被其他进程使用
+            filter: source => !/^Singleton(Lock|Socket|Cookie)$/.test(path.basename(source))
+        });
+        console.log(`浏览器实例 ${index} 使用用户数据目录副本:`, target);
+        return target;
     }
-    
+
+    // 启动浏览器实例，断开连接时清理其页面并在延迟后重启
+    async launchInstance(instance) {
+        const browser = await this.launchBrowser(instance.userDataDir, this.headless);
+        instance.browser = browser;
+        instance.connected = true;
+        instance.openPages = 0;
+        instance.launchedAt = Date.now();
+        console.log(`浏览器实例 ${instance.id} 启动成功`);
+
+        browser.on('disconnected', () => {
+            if (instance.browser !== browser) {
+                return;
+            }
+            instance.connected = false;
+            instance.openPages = 0;
+            console.error(`浏览器实例 ${instance.id} 已断开连接`);
+
+            // 移除该实例上的页面
+            for (const [pageId, page] of this.pages) {
+                if (this.pageInstances.get(page) === instance) {
+                    this.pages.delete(pageId);
+                    this.pageMeta.delete(pageId);
+                }
+            }
+            this.idlePages = this.idlePages.filter(page => this.pageInstances.get(page) !== instance);
+
+            if (this.isRunning) {
+                setTimeout(() => this.restartInstance(instance), this.instanceRestartDelay);
+            }
+        });
+    }
+
+    // 重启断开连接的浏览器实例
+    async restartInstance(instance) {
+        if (!this.isRunning || instance.connected) {
+            return;
+        }
+        instance.restarts++;
+        try {
+            await this.launchInstance(instance);
+            if (instance.id === 0) {
+                this.browser = instance.browser;
+            }
+            this.refillPool();
+        } catch (error) {
+            instance.lastError = error.message;
+            console.error(`浏览器实例 ${instance.id} 重启失败:`, error.message);
+            setTimeout(() => this.restartInstance(instance), this.instanceRestartDelay);
+        }
+    }
+
+    // 选择打开页面数最少的可用浏览器实例
+    pickInstance() {
+        let best = null;
+        for (const instance of this.instances) {
+            if (instance.connected && (!best || instance.openPages < best.openPages)) {
+                best = instance;
+            }
+        }
+        if (!best) {
+            throw new Error('没有可用的浏览器实例');
+        }
+        return best;
+    }
+
+    // 浏览器实例状态
+    getInstanceStatus() {
+        const activePages = new Map();
+        for (const [pageId, page] of this.pages) {
+            const instance = this.pageInstances.get(page);
+            if (instance) {
+                if (!activePages.has(instance)) {
+                    activePages.set(instance, []);
+                }
+                activePages.get(instance).push(pageId);
+            }
+        }
+        return this.instances.map(instance => {
+            const browserProcess = instance.browser && instance.browser.process();
+            return {
+                id: instance.id,
+                healthy: instance.connected,
+                pid: browserProcess ? browserProcess.pid : null,
+                userDataDir: instance.userDataDir,
+                openPages: instance.openPages,
+                pages: activePages.get(instance) || [],
+                uptimeMs: instance.connected ? Date.now() - instance.launchedAt : 0,
+                restarts: instance.restarts,
+                lastError: instance.lastError
+            };
+        });
+    }
+
     // 加载登录状态
     loadLoginStatus() {
         try {
@@ -513,16 +1149,364 @@ class DoubaoBrowserServer {
                 originalNeedLogin: needLogin,
                 loginStatus: this.loginStatus ? '有效' : '无效'
             });
-            
-            return { needLogin: finalNeedLogin, hasCaptcha, hasSlider };
-            
+            
+            return { needLogin: finalNeedLogin, hasCaptcha, hasSlider };
+            
+        } catch (error) {
+            console.error('检查登录和验证码失败:', error.message);
+            // 失败时，默认需要登录，确保安全
+            return { needLogin: true, hasCaptcha: false, hasSlider: false };
+        }
+    }
+    
+    // 在页面中注入登录/验证码状态观察器
+    // 观察器只在DOM变化时检查新增节点和少量选择器，结果保存在 window.__doubaoSessionState 中，
+    // 避免每次请求都扫描整个页面文本
+    async installSessionStateObserver(page) {
+        await page.evaluateOnNewDocument(() => {
+            const captchaSelector = [
+                '[class*="captcha"]', '[id*="captcha"]', 'img[src*="captcha"]', 'iframe[src*="captcha"]',
+                '[class*="security-verify"]', '[class*="human-verify"]', '[id*="security-verify"]', '[id*="human-verify"]',
+                '[class*="image-verify"]', '[class*="img-verify"]', '[class*="drag-to-select"]', '[class*="drag-to-bottom"]'
+            ].join(', ');
+            const sliderSelector = [
+                '[class*="slider-captcha"]', '[class*="verify-slider"]', '[class*="captcha-slider"]',
+                '[id*="slider-captcha"]', '[id*="verify-slider"]', '[id*="captcha-slider"]', '[class*="slider-verify"]'
+            ].join(', ');
+            const captchaInputSelector = 'input[type="text"][name*="captcha"], input[type="text"][id*="captcha"], input[type="text"][class*="captcha"]';
+            const loginSelector = [
+                '[class*="login-modal"]', '[class*="login-dialog"]', '[class*="login-popup"]',
+                'form[action*="login"]', 'input[type="password"]'
+            ].join(', ');
+            const captchaKeywords = ['验证码', 'captcha', '安全验证', '人机验证', '滑块验证', '请选择所有符合上文描述的图片', '拖拽到下方'];
+
+            const state = { needLogin: false, hasCaptcha: false, hasSlider: false, updatedAt: 0, checks: 0 };
+            window.__doubaoSessionState = state;
+
+            const isVisible = el => {
+                const rect = el.getBoundingClientRect();
+                if (rect.width === 0 || rect.height === 0) {
+                    return false;
+                }
+                const style = window.getComputedStyle(el);
+                return style.display !== 'none' && style.visibility !== 'hidden' && style.opacity !== '0';
+            };
+            const anyVisible = selector => Array.from(document.querySelectorAll(selector)).some(isVisible);
+
+            // 包含验证码关键词的浮层节点（聊天消息中的文字不计入）
+            const flaggedNodes = new Set();
+            let pendingNodes = [];
+            let scheduled = false;
+
+            const evaluate = () => {
+                scheduled = false;
+                const nodes = pendingNodes;
+                pendingNodes = [];
+                for (const node of nodes) {
+                    if (node.nodeType !== 1 || !node.isConnected || node.closest('[class*="message"]')) {
+                        continue;
+                    }
+                    const text = node.textContent || '';
+                    if (text.length < 2000 && captchaKeywords.some(keyword => text.includes(keyword))) {
+                        flaggedNodes.add(node);
+                    }
+                }
+                for (const node of flaggedNodes) {
+                    if (!node.isConnected || !isVisible(node)) {
+                        flaggedNodes.delete(node);
+                    }
+                }
+
+                // 与完整检查的判断逻辑一致：验证码文本，或验证码元素配合滑块/输入框
+                const hasSlider = anyVisible(sliderSelector);
+                const hasCaptchaInput = anyVisible(captchaInputSelector);
+                const hasCaptchaElements = anyVisible(captchaSelector);
+                state.hasSlider = hasSlider;
+                state.hasCaptcha = flaggedNodes.size > 0 ||
+                    (hasCaptchaElements && (hasSlider || hasCaptchaInput)) ||
+                    (hasSlider && hasCaptchaInput);
+                state.needLogin = /login|signin/i.test(window.location.href) || anyVisible(loginSelector);
+                state.updatedAt = Date.now();
+                state.checks++;
+            };
+
+            // DOM频繁变化时（如AI回复逐字输出）合并检查，最多每100毫秒一次
+            const schedule = () => {
+                if (!scheduled) {
+                    scheduled = true;
+                    setTimeout(evaluate, 100);
+                }
+            };
+
+            const start = () => {
+                const observer = new MutationObserver(mutations => {
+                    for (const mutation of mutations) {
+                        if (mutation.type === 'childList') {
+                            pendingNodes.push(...mutation.addedNodes);
+                        } else {
+                            pendingNodes.push(mutation.target);
+                        }
+                    }
+                    schedule();
+                });
+                observer.observe(document.documentElement, {
+                    childList: true,
+                    subtree: true,
+                    attributes: true,
+                    attributeFilter: ['class', 'style']
+                });
+                pendingNodes.push(...document.body.children);
+                schedule();
+            };
+
+            if (document.body) {
+                start();
+            } else {
+                document.addEventListener('DOMContentLoaded', start);
+            }
+        });
+    }
+
+    // 在页面上启用网络请求拦截，并统计拦截的请求数和实际传输的字节数
+    async installNetworkFilter(page) {
+        const stats = {
+            allowedRequests: 0,
+            blockedRequests: 0,
+            blockedByType: {},
+            transferredBytes: 0
+        };
+        this.networkStats.set(page, stats);
+
+        await page.setRequestInterception(true);
+        page.on('request', request => {
+            const resourceType = request.resourceType();
+            try {
+                if (this.networkFilter.shouldBlock(resourceType, request.url())) {
+                    stats.blockedRequests++;
+                    stats.blockedByType[resourceType] = (stats.blockedByType[resourceType] || 0) + 1;
+                    request.abort('blockedbyclient');
+                } else {
+                    stats.allowedRequests++;
+                    request.continue();
+                }
+            } catch (error) {
+                // 请求已被处理（如页面已关闭），忽略
+            }
+        });
+
+        // 通过CDP统计实际传输的字节数（被拦截的请求不会下载，无法得知其大小）
+        const client = await page.target().createCDPSession();
+        await client.send('Network.enable');
+        client.on('Network.loadingFinished', event => {
+            stats.transferredBytes += event.encodedDataLength || 0;
+        });
+    }
+
+    // 监听页面上聊天接口的响应，从流式响应中拼接回复文本
+    // 优先通过CDP逐段读取响应内容，回复文本随到达实时通知 capture.listeners；CDP不可用时在响应结束后整体读取
+    async installChatStreamCapture(page) {
+        // started/finished 为已开始/已结束的聊天接口响应序号，exchangeSeq 为发送当前消息时的 started
+        const capture = { started: 0, finished: 0, exchangeSeq: 0, text: null, listeners: new Set() };
+        this.chatCaptures.set(page, capture);
+
+        try {
+            await this.installChatStreamCdp(page, capture);
+            return;
+        } catch (error) {
+            console.log('无法通过CDP逐段读取聊天接口响应，改为在响应结束后读取:', error.message);
+        }
+
+        page.on('response', async response => {
+            if (response.request().method() !== 'POST' || !this.chatStreamPattern.test(response.url())) {
+                return;
+            }
+            const seq = ++capture.started;
+            let text = null;
+            try {
+                // 流式响应结束后才能读取到完整内容
+                text = parseChatStream(await response.text());
+            } catch (error) {
+                console.log('读取聊天接口响应失败:', error.message);
+            }
+            if (seq > capture.finished) {
+                capture.finished = seq;
+                capture.text = text;
+            }
+        });
+    }
+
+    // 通过CDP的 Network.streamResourceContent 逐段读取聊天接口响应
+    async installChatStreamCdp(page, capture) {
+        const client = await page.target().createCDPSession();
+        await client.send('Network.enable');
+        const chatRequests = new Set(); // 聊天接口请求的ID
+        const streams = new Map(); // 请求ID到 { seq, parser, decoder, streaming } 的映射
+
+        const emit = (stream, delta) => {
+            if (!delta) {
+                return;
+            }
+            for (const listener of capture.listeners) {
+                listener(delta, stream.seq);
+            }
+        };
+        const feed = (stream, base64Data) => {
+            if (base64Data) {
+                emit(stream, stream.parser.feed(stream.decoder.decode(Buffer.from(base64Data, 'base64'), { stream: true })));
+            }
+        };
+        const finish = (requestId, text) => {
+            const stream = streams.get(requestId);
+            streams.delete(requestId);
+            chatRequests.delete(requestId);
+            if (stream && stream.seq > capture.finished) {
+                capture.finished = stream.seq;
+                capture.text = text;
+            }
+        };
+
+        client.on('Network.requestWillBeSent', ({ requestId, request }) => {
+            if (request.method === 'POST' && this.chatStreamPattern.test(request.url)) {
+                chatRequests.add(requestId);
+            }
+        });
+        client.on('Network.responseReceived', async ({ requestId }) => {
+            if (!chatRequests.has(requestId)) {
+                return;
+            }
+            const stream = { seq: ++capture.started, parser: new ChatStreamParser(), decoder: new TextDecoder(), streaming: false };
+            streams.set(requestId, stream);
+            try {
+                // 返回此前已缓冲的内容，之后的内容通过 Network.dataReceived 事件的 data 字段到达
+                const { bufferedData } = await client.send('Network.streamResourceContent', { requestId });
+                stream.streaming = true;
+                feed(stream, bufferedData);
+            } catch (error) {
+                // 浏览器不支持逐段读取，响应结束后整体读取
+            }
+        });
+        client.on('Network.dataReceived', ({ requestId, data }) => {
+            const stream = streams.get(requestId);
+            if (stream && stream.streaming) {
+                feed(stream, data);
+            }
+        });
+        client.on('Network.loadingFinished', async ({ requestId }) => {
+            const stream = streams.get(requestId);
+            if (!stream) {
+                chatRequests.delete(requestId);
+                return;
+            }
+            try {
+                if (!stream.streaming) {
+                    const { body, base64Encoded } = await client.send('Network.getResponseBody', { requestId });
+                    feed(stream, base64Encoded ? body : Buffer.from(body).toString('base64'));
+                }
+                emit(stream, stream.parser.feed(stream.decoder.decode()) + stream.parser.end());
+            } catch (error) {
+                console.log('读取聊天接口响应失败:', error.message);
+            }
+            finish(requestId, stream.parser.text || null);
+        });
+        client.on('Network.loadingFailed', ({ requestId }) => {
+            const stream = streams.get(requestId);
+            finish(requestId, stream ? stream.parser.text || null : null);
+        });
+    }
+
+    // 订阅本轮对话回复文本的增量，返回取消订阅的函数
+    onChatDelta(page, listener) {
+        const capture = this.chatCaptures.get(page);
+        if (!capture) {
+            return () => {};
+        }
+        const wrapped = (delta, seq) => {
+            if (seq > capture.exchangeSeq) {
+                listener(delta);
+            }
+        };
+        capture.listeners.add(wrapped);
+        return () => capture.listeners.delete(wrapped);
+    }
+
+    // 标记开始新一轮对话，之后的聊天接口响应属于这一轮
+    markChatExchange(page) {
+        const capture = this.chatCaptures.get(page);
+        if (capture) {
+            capture.exchangeSeq = capture.started;
+        }
+    }
+
+    // 等待本轮对话的聊天接口响应开始，未监听聊天接口时等待固定时间
+    async waitForChatStreamStart(page, timeoutMs, ctx = new RequestContext()) {
+        const capture = this.chatCaptures.get(page);
+        const deadline = Date.now() + timeoutMs;
+        while (Date.now() < deadline) {
+            if (capture && capture.started > capture.exchangeSeq) {
+                return true;
+            }
+            await ctx.sleep(capture ? 50 : deadline - Date.now());
+        }
+        return false;
+    }
+
+    // 等待本轮对话的聊天接口响应结束并返回回复文本
+    // startTimeoutMs 内响应未开始、或 finishTimeoutMs 内未结束时返回null
+    async waitForChatStream(page, startTimeoutMs, finishTimeoutMs, ctx = new RequestContext()) {
+        const capture = this.chatCaptures.get(page);
+        if (!capture) {
+            return null;
+        }
+        const start = Date.now();
+        while (true) {
+            if (capture.finished > capture.exchangeSeq) {
+                return capture.text || null;
+            }
+            const elapsed = Date.now() - start;
+            const begun = capture.started > capture.exchangeSeq;
+            if ((!begun && elapsed >= startTimeoutMs) || elapsed >= finishTimeoutMs) {
+                return null;
+            }
+            await ctx.sleep(50);
+        }
+    }
+
+    // 页面的网络请求统计，未启用过滤时返回null
+    getNetworkStats(page) {
+        const stats = page && this.networkStats.get(page);
+        return stats ? { ...stats, blockedByType: { ...stats.blockedByType } } : null;
+    }
+
+    // 获取页面的登录/验证码状态
+    // 优先使用有效期内的缓存，其次读取页面内观察器的结果，观察器不可用时回退到完整检查
+    async probeSessionState(page) {
+        const cached = this.sessionStates.get(page);
+        if (cached && Date.now() - cached.checkedAt < this.sessionStateTtl) {
+            return cached.state;
+        }
+
+        let state = null;
+        try {
+            state = await page.evaluate(() => {
+                const observed = window.__doubaoSessionState;
+                return observed && observed.checks > 0 ? { ...observed } : null;
+            });
         } catch (error) {
-            console.error('检查登录和验证码失败:', error.message);
-            // 失败时，默认需要登录，确保安全
-            return { needLogin: true, hasCaptcha: false, hasSlider: false };
+            console.error('读取页面状态失败:', error.message);
         }
+        if (!state) {
+            state = await this.checkLoginOrCaptcha(page);
+        }
+
+        const result = {
+            needLogin: !!state.needLogin,
+            hasCaptcha: !!state.hasCaptcha,
+            hasSlider: !!state.hasSlider
+        };
+        this.sessionStates.set(page, { state: result, checkedAt: Date.now() });
+        return result;
     }
-    
+
     // 处理登录和验证码
     async handleLoginAndCaptcha(page) {
         try {
@@ -546,71 +1530,352 @@ class DoubaoBrowserServer {
     }
 
     // 创建新页面
-    async createPage() {
+    // 页面池中有预热好的空闲页面时直接取用，否则当场创建
+    // owner 为页面所有者标识，leaseMs 为页面租约时长（毫秒），客户端需在租约内使用页面或发送心跳
+    async createPage(ctx = new RequestContext(), owner = null, leaseMs = null) {
         if (!this.browser) {
             throw new Error('浏览器未初始化');
         }
 
         const pageId = ++this.pageCounter;
-        let page = await this.browser.newPage();
+        let page = null;
+        while (this.idlePages.length > 0) {
+            const idlePage = this.idlePages.shift();
+            if (!idlePage.isClosed()) {
+                page = idlePage;
+                break;
+            }
+        }
+
+        if (page) {
+            this.poolStats.hits++;
+            ctx.fromPool = true;
+            console.log(`页面 ${pageId} 从页面池取用，剩余空闲页面 ${this.idlePages.length} 个`);
+        } else {
+            if (this.poolSize > 0) {
+                this.poolStats.misses++;
+            }
+            ctx.fromPool = false;
+            page = await this.preparePage(`页面 ${pageId}`, ctx);
+        }
+        this.refillPool();
+
+        if (!page) {
+            return null;
+        }
+        this.pages.set(pageId, page);
+        const now = Date.now();
+        this.pageMeta.set(pageId, {
+            owner,
+            leaseMs: leaseMs || this.pageLeaseMs,
+            createdAt: now,
+            lastUsed: now,
+            requestCount: 0,
+            recycles: 0,
+            heapUsedMb: null
+        });
+        return pageId;
+    }
+
+    // 记录页面被使用，countRequest 为真时计入请求数
+    touchPage(pageId, countRequest = false) {
+        const meta = this.pageMeta.get(pageId);
+        if (meta) {
+            meta.lastUsed = Date.now();
+            if (countRequest) {
+                meta.requestCount++;
+            }
+        }
+    }
+
+    // 续约页面，owner 不为空时需与创建时的所有者一致
+    heartbeat(pageId, owner = null) {
+        const meta = this.pageMeta.get(pageId);
+        if (!meta || (owner && meta.owner && owner !== meta.owner)) {
+            return false;
+        }
+        meta.lastUsed = Date.now();
+        return true;
+    }
+
+    // 启动后台回收任务
+    startReaper() {
+        if (this.reaperTimer) {
+            return;
+        }
+        this.reaperTimer = setInterval(() => this.reapPages(), this.reaperIntervalMs);
+        this.reaperTimer.unref();
+    }
+
+    // 关闭租约过期的页面，替换超过使用时间、请求数或内存上限的页面
+    async reapPages() {
+        if (this.reaping) {
+            return;
+        }
+        this.reaping = true;
+        try {
+            for (const [pageId, page] of Array.from(this.pages)) {
+                const meta = this.pageMeta.get(pageId);
+                // 跳过正在处理请求或排队中的页面
+                if (!meta || this.scheduler.pageLocks.has(pageId)) {
+                    continue;
+                }
+
+                const now = Date.now();
+                if (now - meta.lastUsed > meta.leaseMs) {
+                    console.log(`页面 ${pageId} 租约已过期（所有者: ${meta.owner || '未知'}，空闲 ${Math.round((now - meta.lastUsed) / 1000)} 秒），关闭页面`);
+                    await this.scheduler.run(pageId, new RequestContext('reaper'), () => this.closePage(pageId))
+                        .catch(error => console.error(`页面 ${pageId} 关闭失败:`, error.message));
+                    continue;
+                }
+
+                try {
+                    const metrics = await page.metrics();
+                    meta.heapUsedMb = Math.round(metrics.JSHeapUsedSize / 1024 / 1024 * 10) / 10;
+                } catch (error) {
+                    meta.heapUsedMb = null;
+                }
+
+                let reason = null;
+                if (now - meta.createdAt > this.pageMaxLifetimeMs) {
+                    reason = '超过最长使用时间';
+                } else if (meta.requestCount >= this.pageMaxRequests) {
+                    reason = `已处理 ${meta.requestCount} 个请求`;
+                } else if (meta.heapUsedMb !== null && meta.heapUsedMb > this.pageHeapLimitMb) {
+                    reason = `JS堆内存 ${meta.heapUsedMb} MB 超过上限`;
+                }
+                if (reason) {
+                    console.log(`页面 ${pageId} ${reason}，替换为新页面`);
+                    await this.scheduler.run(pageId, new RequestContext('reaper'), () => this.recyclePage(pageId))
+                        .catch(error => console.error(`页面 ${pageId} 替换失败:`, error.message));
+                }
+            }
+        } finally {
+            this.reaping = false;
+        }
+    }
+
+    // 用新页面替换指定页面，页面ID和所有者不变，聊天记录会被清空
+    async recyclePage(pageId) {
+        const oldPage = this.pages.get(pageId);
+        const meta = this.pageMeta.get(pageId);
+        if (!oldPage || !meta) {
+            return false;
+        }
+
+        let page = null;
+        while (this.idlePages.length > 0 && !page) {
+            const idlePage = this.idlePages.shift();
+            if (!idlePage.isClosed()) {
+                page = idlePage;
+            }
+        }
+        if (!page) {
+            page = await this.preparePage(`页面 ${pageId}`);
+        }
+        this.refillPool();
+        if (!page) {
+            return false;
+        }
+
+        this.pages.set(pageId, page);
+        await oldPage.close().catch(() => {});
+        meta.createdAt = Date.now();
+        meta.requestCount = 0;
+        meta.heapUsedMb = null;
+        meta.recycles++;
+        console.log(`页面 ${pageId} 已替换为新页面`);
+        return true;
+    }
+
+    // 各页面的租约和内存信息
+    getPageDetails() {
+        const now = Date.now();
+        return Array.from(this.pageMeta, ([pageId, meta]) => ({
+            pageId,
+            owner: meta.owner,
+            ageMs: now - meta.createdAt,
+            idleMs: now - meta.lastUsed,
+            leaseMs: meta.leaseMs,
+            requestCount: meta.requestCount,
+            heapUsedMb: meta.heapUsedMb,
+            recycles: meta.recycles
+        }));
+    }
+
+    // 在后台补充页面池，直到空闲页面数（含正在创建的）达到页面池大小
+    refillPool() {
+        if (!this.browser) {
+            return;
+        }
+        while (this.idlePages.length + this.poolRefilling < this.poolSize) {
+            this.poolRefilling++;
+            const start = Date.now();
+            this.preparePage('预热页面', new RequestContext('pool'))
+                .then(page => {
+                    const stats = this.poolStats;
+                    if (!page) {
+                        stats.refillFailures++;
+                        return false;
+                    }
+                    const elapsed = Date.now() - start;
+                    stats.refills++;
+                    stats.lastRefillMs = elapsed;
+                    stats.totalRefillMs += elapsed;
+                    if (this.browser && this.idlePages.length < this.poolSize) {
+                        this.idlePages.push(page);
+                    } else {
+                        // 页面池已缩小或服务正在停止
+                        page.close().catch(() => {});
+                    }
+                    return true;
+                })
+                .catch(error => {
+                    this.poolStats.refillFailures++;
+                    console.error('预热页面失败:', error.message);
+                    return false;
+                })
+                .then(success => {
+                    this.poolRefilling--;
+                    if (success) {
+                        this.refillPool();
+                    } else if (this.browser) {
+                        // 创建失败时延迟重试，避免连续失败占满CPU
+                        setTimeout(() => this.refillPool(), this.poolRetryDelay);
+                    }
+                });
+        }
+    }
+
+    // 关闭页面池中的空闲页面
+    async drainPool() {
+        this.poolSize = 0;
+        const idlePages = this.idlePages.splice(0);
+        for (const page of idlePages) {
+            await page.close().catch(() => {});
+        }
+    }
+
+    // 页面池统计信息
+    getPoolStatus() {
+        const stats = this.poolStats;
+        const requests = stats.hits + stats.misses;
+        return {
+            size: this.poolSize,
+            idle: this.idlePages.length,
+            refilling: this.poolRefilling,
+            hits: stats.hits,
+            misses: stats.misses,
+            hitRatio: requests > 0 ? Math.round(stats.hits / requests * 1000) / 1000 : null,
+            refills: stats.refills,
+            refillFailures: stats.refillFailures,
+            lastRefillMs: stats.lastRefillMs,
+            avgRefillMs: stats.refills > 0 ? Math.round(stats.totalRefillMs / stats.refills) : null
+        };
+    }
+
+    // 打开新标签页并导航到豆包聊天页面，等待输入框就绪
+    // label 用于日志，返回就绪的页面实例，失败返回null
+    async preparePage(label, ctx = new RequestContext()) {
+        if (!this.browser) {
+            throw new Error('浏览器未初始化');
+        }
+
+        // 先计入负载，避免并发创建的页面都分配到同一个实例
+        const instance = this.pickInstance();
+        instance.openPages++;
+        let page;
+        try {
+            page = await ctx.stage('newPage', () => instance.browser.newPage());
+        } catch (error) {
+            instance.openPages--;
+            throw error;
+        }
+        this.pageInstances.set(page, instance);
+        page.once('close', () => {
+            if (instance.connected && instance.openPages > 0) {
+                instance.openPages--;
+            }
+        });
         
-        // 添加反检测措施
-        await this.addAntiDetection(page);
+        try {
+            // 添加反检测措施
+            await ctx.stage('antiDetection', () => this.addAntiDetection(page));
         
-        // 设置真实的用户代理
-        await page.setUserAgent('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36');
+            // 注入登录/验证码状态观察器
+            await ctx.stage('stateObserver', () => this.installSessionStateObserver(page));
         
-        // 尝试获取浏览器窗口并调整其行为，避免自动置顶
-        if (!this.headless) {
-            try {
-                // 获取当前页面的浏览器窗口
-                const browserContext = page.browserContext();
-                const pages = await browserContext.pages();
-                if (pages.length > 0) {
-                    // 尝试通过浏览器上下文来控制窗口行为
-                    // 这里我们不使用任何可能导致窗口置顶的操作
-                    console.log(`页面 ${pageId} 创建，已配置窗口行为`);
+            // 监听聊天接口的响应
+            if (this.chatStreamPattern) {
+                await this.installChatStreamCapture(page);
+            }
+        
+            // 启用网络请求过滤
+            if (this.networkFilter.isEnabled()) {
+                await ctx.stage('networkFilter', () => this.installNetworkFilter(page));
+            }
+        
+            // 设置真实的用户代理
+            await page.setUserAgent('Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36');
+        
+            // 尝试获取浏览器窗口并调整其行为，避免自动置顶
+            if (!this.headless) {
+                try {
+                    // 获取当前页面的浏览器窗口
+                    const browserContext = page.browserContext();
+                    const pages = await browserContext.pages();
+                    if (pages.length > 0) {
+                        // 尝试通过浏览器上下文来控制窗口行为
+                        // 这里我们不使用任何可能导致窗口置顶的操作
+                        console.log(`${label} 创建，已配置窗口行为`);
+                    }
+                } catch (error) {
+                    console.log(`${label} 窗口行为配置失败:`, error.message);
                 }
-            } catch (error) {
-                console.log(`页面 ${pageId} 窗口行为配置失败:`, error.message);
             }
-        }
         
-        // 导航到豆包聊天页面
-        console.log(`页面 ${pageId} 导航到豆包聊天页面...`);
-        await page.goto(this.baseUrl, {
-            waitUntil: 'networkidle2',
-            timeout: 60000
-        });
+            // 导航到豆包聊天页面
+            console.log(`${label} 导航到豆包聊天页面...`);
+            await ctx.stage('navigate', () => page.goto(this.baseUrl, {
+                waitUntil: 'networkidle2',
+                timeout: 60000
+            }));
 
-        // 检查并处理登录和验证码
-        const result = await this.handleLoginAndCaptcha(page);
+            // 检查并处理登录和验证码
+            const result = await ctx.stage('loginCheck', () => this.handleLoginAndCaptcha(page));
         
-        // 如果返回的是新页面（无头模式切换到有头模式），使用新页面
-        if (result !== true && result !== false) {
-            // 关闭旧页面
-            await page.close();
-            // 使用新页面
-            page = result;
-        } else if (result === false) {
-            // 登录或验证码检测失败，但仍继续创建页面
-            // 这样用户可以手动处理登录或验证码
-            console.warn(`页面 ${pageId} 检测到需要登录或验证码，但仍继续创建页面`);
-        }
+            // 如果返回的是新页面（无头模式切换到有头模式），使用新页面
+            if (result !== true && result !== false) {
+                // 关闭旧页面
+                await page.close();
+                // 使用新页面
+                page = result;
+            } else if (result === false) {
+                // 登录或验证码检测失败，但仍继续创建页面
+                // 这样用户可以手动处理登录或验证码
+                console.warn(`${label} 检测到需要登录或验证码，但仍继续创建页面`);
+            }
 
-        try {
-            // 等待页面加载完成
-            await page.waitForSelector('textarea.semi-input-textarea', {
-                timeout: 30000
-            });
+            // 等待页面加载完成，输入框超时（而不是请求被取消或超时）时返回null
+            try {
+                await ctx.stage('waitInput', () => page.waitForSelector('textarea.semi-input-textarea', {
+                    timeout: 30000
+                }));
+            } catch (error) {
+                if (error instanceof RequestAbortedError) {
+                    throw error;
+                }
+                console.error(`${label} 等待输入框失败:`, error.message);
+                await page.close().catch(() => {});
+                return null;
+            }
 
-            this.pages.set(pageId, page);
-            console.log(`页面 ${pageId} 创建成功！`);
-            return pageId;
+            console.log(`${label} 创建成功！`);
+            return page;
         } catch (error) {
-            console.error(`页面 ${pageId} 等待输入框失败:`, error.message);
-            await page.close();
-            return null;
+            // 页面尚未加入 this.pages，回收任务找不到它，必须在这里关闭
+            await page.close().catch(() => {});
+            throw error;
         }
     }
 
@@ -657,24 +1922,94 @@ class DoubaoBrowserServer {
         if (page) {
             await page.close();
             this.pages.delete(pageId);
+            this.pageMeta.delete(pageId);
             console.log(`页面 ${pageId} 已关闭`);
             return true;
         }
         return false;
     }
 
+    // 在当前页面开始新对话，清空聊天记录以便复用页面
+    // 优先点击页面上的"新对话"按钮，失败时重新导航到聊天首页
+    async resetConversation(pageId, ctx = new RequestContext()) {
+        const page = this.pages.get(pageId);
+        if (!page) {
+            throw new Error(`页面 ${pageId} 不存在`);
+        }
+
+        const messageSelector = '[class*="message-item"], [class*="message-box"]';
+        let method = 'newChat';
+        const clicked = await ctx.stage('newChat', async () => {
+            try {
+                const found = await page.evaluate(() => {
+                    const candidates = Array.from(document.querySelectorAll(
+                        '[data-testid*="create_conversation"], [aria-label*="新对话"], button, a, [role="button"]'
+                    ));
+                    const target = candidates.find(el => {
+                        const testId = el.getAttribute('data-testid') || '';
+                        const ariaLabel = el.getAttribute('aria-label') || '';
+                        return testId.includes('create_conversation') ||
+                               ariaLabel.includes('新对话') ||
+                               (el.textContent || '').trim() === '新对话';
+                    });
+                    if (!target) {
+                        return false;
+                    }
+                    target.click();
+                    return true;
+                });
+                if (!found) {
+                    return false;
+                }
+                // 等待旧消息清空且输入框可用
+                await page.waitForFunction(
+                    selector => document.querySelectorAll(selector).length === 0 &&
+                                !!document.querySelector('textarea.semi-input-textarea'),
+                    { timeout: 5000 },
+                    messageSelector
+                );
+                return true;
+            } catch (error) {
+                if (error instanceof RequestAbortedError) {
+                    throw error;
+                }
+                console.log(`页面 ${pageId} 点击新对话失败:`, error.message);
+                return false;
+            }
+        });
+
+        if (!clicked) {
+            method = 'navigate';
+            await ctx.stage('navigate', async () => {
+                await page.goto(this.baseUrl, {
+                    waitUntil: 'domcontentloaded',
+                    timeout: 60000
+                });
+                await page.waitForSelector('textarea.semi-input-textarea', {
+                    timeout: 30000
+                });
+            });
+        }
+
+        // 页面内容已变化，丢弃缓存的登录/验证码状态
+        this.sessionStates.delete(page);
+        console.log(`页面 ${pageId} 已开始新对话（${method === 'newChat' ? '点击新对话' : '重新导航'}）`);
+        return method;
+    }
+
     // 关闭所有页面
     async closeAllPages() {
         for (const [pageId, page] of this.pages) {
             await page.close();
         }
         this.pages.clear();
+        this.pageMeta.clear();
         this.pageCounter = 0;
         console.log('所有页面已关闭');
     }
 
     // 发送文本消息
-    async sendMessage(pageId, message) {
+    async sendMessage(pageId, message, ctx = new RequestContext()) {
         const page = this.pages.get(pageId);
         if (!page) {
             throw new Error(`页面 ${pageId} 不存在`);
@@ -682,7 +2017,7 @@ class DoubaoBrowserServer {
 
         try {
             // 在发送消息前检查验证码
-            const captchaResult = await this.checkLoginOrCaptcha(page);
+            const captchaResult = await ctx.stage('captchaCheck', () => this.probeSessionState(page));
             if (captchaResult.hasCaptcha) {
                 console.log(`页面 ${pageId} 检测到验证码，消息发送失败`);
                 return false;
@@ -708,12 +2043,18 @@ class DoubaoBrowserServer {
             }
 
             // 输入消息，加快速度
-            await inputBox.type(message, { delay: 5 }); // 减少字符输入延迟
+            await ctx.stage('typeMessage', async () => {
+                await inputBox.type(message, { delay: 5 }); // 减少字符输入延迟
+                
+                // 优化：等待输入框内容更新，减少等待时间
+                await ctx.sleep(100);
+            });
             
-            // 优化：等待输入框内容更新，减少等待时间
-            await new Promise(resolve => setTimeout(resolve, 100));
+            // 之后的聊天接口响应属于本条消息
+            this.markChatExchange(page);
             
             // 优化：尝试多种方式点击发送按钮
+            const clickStart = process.hrtime.bigint();
             let sendSuccess = false;
             let attempt = 1;
             const maxAttempts = 3;
@@ -754,16 +2095,19 @@ class DoubaoBrowserServer {
                 attempt++;
                 if (attempt <= maxAttempts) {
                     console.log(`页面 ${pageId} 等待1秒后重试...`);
-                    await new Promise(resolve => setTimeout(resolve, 1000));
+                    await ctx.sleep(1000);
                 }
             }
             
+            ctx.addTiming('clickSend', Number(process.hrtime.bigint() - clickStart) / 1e6);
+            
             if (!sendSuccess) {
                 throw new Error(`所有发送方式均失败，共尝试了 ${maxAttempts} 次`);
             }
 
             // 等待消息发送完成
-            await new Promise(resolve => setTimeout(resolve, 2000));
+            // 监听聊天接口时，接口响应开始即表示发送完成
+            await ctx.stage('sendWait', () => this.waitForChatStreamStart(page, 2000, ctx));
             
             console.log(`页面 ${pageId} 消息发送成功！`);
             return true;
@@ -774,7 +2118,7 @@ class DoubaoBrowserServer {
     }
 
     // 文件上传功能
-    async uploadFile(pageId, filePath) {
+    async uploadFile(pageId, filePath, ctx = new RequestContext()) {
         const page = this.pages.get(pageId);
         if (!page) {
             throw new Error(`页面 ${pageId} 不存在`);
@@ -782,7 +2126,7 @@ class DoubaoBrowserServer {
 
         try {
             // 在上传文件前检查验证码
-            const captchaResult = await this.checkLoginOrCaptcha(page);
+            const captchaResult = await ctx.stage('captchaCheck', () => this.probeSessionState(page));
             if (captchaResult.hasCaptcha) {
                 throw new Error('检测到验证码，请手动处理后重试');
             }
@@ -813,7 +2157,7 @@ class DoubaoBrowserServer {
                 const uploadBtn = await page.$('[class*="upload"], [class*="file"], [class*="image"]');
                 if (uploadBtn) {
                     await uploadBtn.click();
-                    await new Promise(resolve => setTimeout(resolve, 1000));
+                    await ctx.sleep(1000);
                     fileInput = await page.$('input[type="file"]');
                 }
                 
@@ -822,8 +2166,8 @@ class DoubaoBrowserServer {
                     const inputBox = await page.$('textarea.semi-input-textarea');
                     if (inputBox) {
                         // 模拟拖拽文件到输入框
-                        await inputBox.uploadFile(filePath);
-                        await new Promise(resolve => setTimeout(resolve, 3000));
+                        await ctx.stage('upload', () => inputBox.uploadFile(filePath));
+                        await ctx.stage('uploadWait', () => ctx.sleep(3000));
                         return true;
                     }
                 }
@@ -834,10 +2178,10 @@ class DoubaoBrowserServer {
             }
 
             // 上传文件
-            await fileInput.uploadFile(filePath);
+            await ctx.stage('upload', () => fileInput.uploadFile(filePath));
             
             // 等待上传完成
-            await new Promise(resolve => setTimeout(resolve, 3000));
+            await ctx.stage('uploadWait', () => ctx.sleep(3000));
             
             console.log(`页面 ${pageId} 文件上传成功！`);
             return true;
@@ -848,7 +2192,7 @@ class DoubaoBrowserServer {
     }
 
     // 发送包含文件的消息
-    async sendMessageWithFile(pageId, message, filePath) {
+    async sendMessageWithFile(pageId, message, filePath, ctx = new RequestContext()) {
         const page = this.pages.get(pageId);
         if (!page) {
             throw new Error(`页面 ${pageId} 不存在`);
@@ -856,26 +2200,26 @@ class DoubaoBrowserServer {
 
         try {
             // 在发送带文件的消息前检查验证码
-            const captchaResult = await this.checkLoginOrCaptcha(page);
+            const captchaResult = await ctx.stage('captchaCheck', () => this.probeSessionState(page));
             if (captchaResult.hasCaptcha) {
                 throw new Error('检测到验证码，请手动处理后重试');
             }
             
             // 先上传文件
-            const uploadSuccess = await this.uploadFile(pageId, filePath);
+            const uploadSuccess = await this.uploadFile(pageId, filePath, ctx);
             if (!uploadSuccess) {
                 throw new Error('文件上传失败');
             }
             console.log(`页面 ${pageId} 文件上传成功，等待2秒后发送消息...`);
-            await new Promise(resolve => setTimeout(resolve, 500));
+            await ctx.stage('uploadWait', () => ctx.sleep(500));
 
             // 然后发送消息
-            const sendSuccess = await this.sendMessage(pageId, message);
+            const sendSuccess = await this.sendMessage(pageId, message, ctx);
             if (!sendSuccess) {
                 throw new Error('消息发送失败');
             }
             console.log(`页面 ${pageId} 消息发送成功，等待5秒获取回复...`);
-            await new Promise(resolve => setTimeout(resolve, 5000));
+            await ctx.stage('sendWait', () => this.waitForChatStreamStart(page, 5000, ctx));
             
             return true;
         } catch (error) {
@@ -884,8 +2228,69 @@ class DoubaoBrowserServer {
         }
     }
 
+    // 纯文本聊天，以NDJSON逐行返回回复：回复文本增量 {type: 'delta', text}，
+    // 结束时 {type: 'done', success, response, responseSource, timings}，出错时 {type: 'error', error}
+    async textChatStream(pageId, message, res, ctx = new RequestContext()) {
+        const page = this.pages.get(pageId);
+        if (!page) {
+            throw new Error(`页面 ${pageId} 不存在`);
+        }
+
+        res.writeHead(200, {
+            'Content-Type': 'application/x-ndjson; charset=utf-8',
+            'Cache-Control': 'no-cache'
+        });
+        const writeEvent = event => {
+            if (!res.writableEnded) {
+                res.write(JSON.stringify(event) + '\n');
+            }
+        };
+        // 客户端断开连接时中止请求，尽快释放页面
+        res.on('close', () => {
+            if (!res.writableEnded) {
+                ctx.abort('cancelled');
+            }
+        });
+
+        let streamed = '';
+        const unsubscribe = this.onChatDelta(page, delta => {
+            streamed += delta;
+            writeEvent({ type: 'delta', text: delta });
+        });
+        try {
+            const sendSuccess = await this.sendMessage(pageId, message, ctx);
+            const response = sendSuccess ? await this.getAIResponse(pageId, ctx) : null;
+            unsubscribe();
+            // 未捕获到流式响应、从页面提取回复时，一次性发送剩余的文本
+            if (response && response !== '[CAPTCHA_DETECTED]' &&
+                response.startsWith(streamed) && response.length > streamed.length) {
+                writeEvent({ type: 'delta', text: response.slice(streamed.length) });
+            }
+            writeEvent({
+                type: 'done',
+                success: sendSuccess,
+                message,
+                response,
+                responseSource: ctx.responseSource || null,
+                timestamp: new Date().toISOString(),
+                timings: ctx.getTimings()
+            });
+        } catch (error) {
+            console.error(`页面 ${pageId} 流式聊天失败:`, error.message);
+            writeEvent({
+                type: 'error',
+                error: error.message,
+                aborted: error instanceof RequestAbortedError ? error.reason : null,
+                timings: ctx.getTimings()
+            });
+        } finally {
+            unsubscribe();
+            res.end();
+        }
+    }
+
     // 等待并获取AI回复
-    async getAIResponse(pageId) {
+    async getAIResponse(pageId, ctx = new RequestContext()) {
         const page = this.pages.get(pageId);
         if (!page) {
             throw new Error(`页面 ${pageId} 不存在`);
@@ -893,28 +2298,41 @@ class DoubaoBrowserServer {
 
         try {
             // 在获取AI回复前检查验证码
-            const captchaResult = await this.checkLoginOrCaptcha(page);
+            const captchaResult = await ctx.stage('captchaCheck', () => this.probeSessionState(page));
             if (captchaResult.hasCaptcha) {
                 console.log(`页面 ${pageId} 检测到验证码，返回验证码信息`);
                 // 截取当前页面状态，用于调试
-                await page.screenshot({ path: `page_${pageId}_captcha.png` });
-                console.log(`页面 ${pageId} 已截图，保存为 page_${pageId}_captcha.png`);
+                this.debugCapture.capture(page, `page${pageId}`, 'captcha', true);
                 // 返回特殊标记，表示检测到验证码
                 return '[CAPTCHA_DETECTED]';
             }
             
             console.log(`页面 ${pageId} 等待AI回复...`);
             
-            // 等待回复完成，最多等待60秒
-            await new Promise(resolve => setTimeout(resolve, 8000));
+            // 优先使用聊天接口响应中的回复文本：8秒内未开始响应或响应结束后仍无文本时，回退到从页面提取
+            if (this.chatCaptures.has(page)) {
+                const captured = await ctx.stage('replyWait',
+                    () => this.waitForChatStream(page, 8000, this.chatStreamTimeout, ctx));
+                if (captured) {
+                    ctx.responseSource = 'network';
+                    console.log(`页面 ${pageId} 从聊天接口响应中获取AI回复: ${captured}`);
+                    return captured;
+                }
+                console.log(`页面 ${pageId} 未从聊天接口响应中获取到回复，改为从页面提取`);
+                this.debugCapture.capture(page, `page${pageId}`, 'domFallback', true);
+            } else {
+                // 等待回复完成
+                await ctx.stage('replyWait', () => ctx.sleep(8000));
+            }
+            ctx.responseSource = 'dom';
             
             // 截取当前页面状态，用于调试
-            await page.screenshot({ path: `page_${pageId}_debug.png` });
-            console.log(`页面 ${pageId} 已截图，保存为 page_${pageId}_debug.png`);
+            this.debugCapture.capture(page, `page${pageId}`, 'response');
             
             // 先尝试提取聊天记录，然后从中获取AI回复
+            // 只提取最新一轮回复：多轮对话时不会取到之前更长的回复，提取开销也不随对话变长而增加
             console.log(`页面 ${pageId} 尝试先提取聊天记录，再获取AI回复`);
-            const chatHistory = await this.extractChatHistory(pageId);
+            const chatHistory = await this.extractChatHistory(pageId, ctx, { latestOnly: true });
             
             // 从聊天记录中查找最新的AI回复
             if (chatHistory && chatHistory.length > 0) {
@@ -999,15 +2417,18 @@ class DoubaoBrowserServer {
     }
 
     // 提取完整聊天记录
-    async extractChatHistory(pageId) {
+    // options.since: 只提取该序号之后的消息元素（上次响应中的 historyIndex），
+    // options.latestOnly: 从最后一条消息向前提取，遇到用户消息即停止，只返回最新一轮回复
+    async extractChatHistory(pageId, ctx = new RequestContext(), { since = 0, latestOnly = false } = {}) {
         const page = this.pages.get(pageId);
         if (!page) {
             throw new Error(`页面 ${pageId} 不存在`);
         }
 
+        let extractStart = null;
         try {
             // 在提取聊天记录前检查验证码
-            const captchaResult = await this.checkLoginOrCaptcha(page);
+            const captchaResult = await ctx.stage('captchaCheck', () => this.probeSessionState(page));
             if (captchaResult.hasCaptcha) {
                 console.log(`页面 ${pageId} 检测到验证码`);
                 return [{ 
@@ -1018,6 +2439,7 @@ class DoubaoBrowserServer {
             }
             
             console.log(`页面 ${pageId} 提取聊天记录...`);
+            extractStart = process.hrtime.bigint();
             
             // 获取聊天记录容器，增加更多选择器
             const messageList = await page.$('[class*="message-list"]') || 
@@ -1030,10 +2452,14 @@ class DoubaoBrowserServer {
             }
 
             // 获取所有消息元素，增加更多选择器
-            const messages = await messageList.$$('[class*="message-item"], [class*="message-box"], [class*="message"], [class*="ant-list-item"], [role="listitem"]');
+            const allMessages = await messageList.$$('[class*="message-item"], [class*="message-box"], [class*="message"], [class*="ant-list-item"], [role="listitem"]');
+            ctx.historyIndex = allMessages.length;
+            // 多轮对话时跳过已经提取过的消息，逐条读取元素的开销与消息数成正比
+            const start = Math.min(Math.max(parseInt(since, 10) || 0, 0), allMessages.length);
+            const messages = latestOnly ? allMessages.slice(start).reverse() : allMessages.slice(start);
             
             // 如果没有找到消息元素，尝试获取整个页面的文本内容作为备选
-            if (messages.length === 0) {
+            if (allMessages.length === 0) {
                 console.log(`页面 ${pageId} 未找到消息元素，尝试获取页面文本`);
                 const pageText = await page.evaluate(el => el.textContent.trim(), messageList);
                 
@@ -1068,6 +2494,7 @@ class DoubaoBrowserServer {
             const history = [];
             
             for (const message of messages) {
+                ctx.check();
                 try {
                     const content = await message.evaluate(el => {
                         return el.textContent.trim();
@@ -1110,6 +2537,11 @@ class DoubaoBrowserServer {
                         type = 'ai';
                     }
 
+                    // 只提取最新一轮时，倒序遇到用户消息说明已经越过最新回复
+                    if (latestOnly && type === 'user') {
+                        break;
+                    }
+
                     history.push({
                         type,
                         content,
@@ -1120,9 +2552,15 @@ class DoubaoBrowserServer {
                 }
             }
 
+            if (latestOnly) {
+                history.reverse();
+            }
             console.log(`页面 ${pageId} 提取到 ${history.length} 条消息`);
             return history;
         } catch (error) {
+            if (error instanceof RequestAbortedError) {
+                throw error;
+            }
             console.error(`页面 ${pageId} 提取聊天记录失败:`, error.message);
             // 失败时返回更友好的错误信息
             return [{ 
@@ -1130,6 +2568,10 @@ class DoubaoBrowserServer {
                 content: `提取聊天记录失败: ${error.message}`, 
                 timestamp: new Date().toISOString() 
             }];
+        } finally {
+            if (extractStart !== null) {
+                ctx.addTiming('extractHistory', Number(process.hrtime.bigint() - extractStart) / 1e6);
+            }
         }
     }
 
@@ -1138,7 +2580,7 @@ class DoubaoBrowserServer {
         // 设置CORS头
         res.setHeader('Access-Control-Allow-Origin', '*');
         res.setHeader('Access-Control-Allow-Methods', 'GET, POST, OPTIONS');
-        res.setHeader('Access-Control-Allow-Headers', 'Content-Type');
+        res.setHeader('Access-Control-Allow-Headers', 'Content-Type, X-Request-Id, X-Request-Timeout');
 
         // 处理OPTIONS请求
         if (req.method === 'OPTIONS') {
@@ -1154,7 +2596,13 @@ class DoubaoBrowserServer {
         // 处理GET请求
         if (req.method === 'GET') {
             const query = querystring.parse(parsedUrl.query);
-            await this.handleGetRequest(pathname, query, res);
+            const ctx = this.createContext(req, pathname);
+            try {
+                await this.schedule(pathname, query.pageId, res, ctx,
+                    () => this.handleGetRequest(pathname, query, res, ctx));
+            } finally {
+                this.releaseContext(ctx);
+            }
         }
         // 处理POST请求
         else if (req.method === 'POST') {
@@ -1162,156 +2610,326 @@ class DoubaoBrowserServer {
             req.on('data', chunk => {
                 body += chunk.toString();
             });
+            const ctx = this.createContext(req, pathname);
             req.on('end', async () => {
                 const postData = JSON.parse(body);
-                await this.handlePostRequest(pathname, postData, res);
+                try {
+                    await this.schedule(pathname, postData.pageId, res, ctx,
+                        () => this.handlePostRequest(pathname, postData, res, ctx));
+                } finally {
+                    this.releaseContext(ctx);
+                }
             });
         }
         else {
-            res.writeHead(405, { 'Content-Type': 'application/json' });
-            res.end(JSON.stringify({ success: false, error: 'Method Not Allowed' }));
+            this.sendJson(res, 405, { success: false, error: 'Method Not Allowed' });
+        }
+    }
+
+    // 经请求调度器执行请求处理函数，队列已满时返回429，排队期间被取消或超时返回499/504
+    async schedule(pathname, pageId, res, ctx, handler) {
+        if (!SCHEDULED_ROUTES.has(pathname)) {
+            return handler();
+        }
+        const schedulePageId = pageId === undefined || pageId === null || pageId === '' ? null : Number(pageId);
+        try {
+            return await this.scheduler.run(schedulePageId, ctx, async () => {
+                // 请求开始和结束时都刷新页面的最后使用时间，避免长请求后被误判为空闲
+                this.touchPage(schedulePageId, pathname !== '/closePage');
+                try {
+                    return await handler();
+                } catch (error) {
+                    this.debugCapture.capture(this.pages.get(schedulePageId), `page${schedulePageId}`, 'error', true);
+                    throw error;
+                } finally {
+                    this.touchPage(schedulePageId);
+                }
+            });
+        } catch (error) {
+            if (error instanceof RequestAbortedError) {
+                // 排队期间被取消或超过截止时间
+                this.sendError(res, error, ctx);
+                return;
+            }
+            if (!(error instanceof QueueFullError)) {
+                throw error;
+            }
+            console.warn(`请求队列已满，拒绝请求 ${pathname}，排队请求数: ${error.queueDepth}`);
+            this.sendJson(res, 429, {
+                success: false,
+                error: error.message,
+                queueDepth: error.queueDepth,
+                retryAfter: error.retryAfter
+            }, ctx, { 'Retry-After': String(error.retryAfter) });
+        }
+    }
+
+    // 发送错误响应：超过截止时间返回504，被取消返回499，其他错误返回500
+    sendError(res, error, ctx) {
+        if (error instanceof RequestAbortedError) {
+            console.warn(`请求 ${ctx.route}${ctx.requestId ? ` (${ctx.requestId})` : ''} 已中止: ${error.message}`);
+            this.sendJson(res, error.reason === 'deadline' ? 504 : 499, {
+                success: false,
+                error: error.message,
+                aborted: error.reason,
+                timings: ctx.getTimings()
+            }, ctx);
+            return;
+        }
+        this.sendJson(res, 500, { success: false, error: error.message, timings: ctx.getTimings() }, ctx);
+    }
+
+    // 创建请求上下文，请求ID和剩余时间预算（毫秒）来自 X-Request-Id 和 X-Request-Timeout 请求头
+    createContext(req, pathname) {
+        const requestId = req.headers['x-request-id'] || null;
+        const timeoutMs = parseInt(req.headers['x-request-timeout'], 10);
+        const ctx = new RequestContext(pathname, {
+            requestId,
+            timeoutMs: Number.isNaN(timeoutMs) ? null : Math.max(1, timeoutMs)
+        });
+        if (requestId) {
+            // 已取消的请求ID不再接受新请求
+            if (this.cancelledRequests.has(requestId)) {
+                ctx.abort('cancelled');
+            }
+            if (!this.activeRequests.has(requestId)) {
+                this.activeRequests.set(requestId, new Set());
+            }
+            this.activeRequests.get(requestId).add(ctx);
+        }
+        return ctx;
+    }
+
+    // 请求结束后注销请求上下文
+    releaseContext(ctx) {
+        const contexts = ctx.requestId && this.activeRequests.get(ctx.requestId);
+        if (contexts) {
+            contexts.delete(ctx);
+            if (contexts.size === 0) {
+                this.activeRequests.delete(ctx.requestId);
+            }
         }
     }
 
+    // 取消指定请求ID的所有请求（包括排队中的请求），之后使用该ID的请求也会被拒绝
+    cancelRequest(requestId) {
+        const now = Date.now();
+        for (const [id, cancelledAt] of this.cancelledRequests) {
+            if (now - cancelledAt > this.cancelledRequestTtl) {
+                this.cancelledRequests.delete(id);
+            }
+        }
+        this.cancelledRequests.set(requestId, now);
+        const contexts = this.activeRequests.get(requestId);
+        if (!contexts) {
+            return 0;
+        }
+        for (const ctx of contexts) {
+            ctx.abort('cancelled');
+        }
+        console.log(`已取消请求 ${requestId}（${contexts.size} 个）`);
+        return contexts.size;
+    }
+
+    // 发送JSON响应，附带各阶段耗时的 Server-Timing 头
+    sendJson(res, statusCode, data, ctx = null, extraHeaders = {}) {
+        const headers = { 'Content-Type': 'application/json', ...extraHeaders };
+        if (ctx) {
+            headers['Server-Timing'] = ctx.serverTimingHeader();
+        }
+        res.writeHead(statusCode, headers);
+        res.end(JSON.stringify(data));
+    }
+
     // 处理GET请求
-    async handleGetRequest(pathname, query, res) {
+    async handleGetRequest(pathname, query, res, ctx = new RequestContext(pathname)) {
         try {
             switch (pathname) {
                 case '/status':
                     // 返回服务状态
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify({
+                    this.sendJson(res, 200, {
                         success: true,
                         running: this.isRunning,
-                        browserOpen: !!this.browser,
+                        browserOpen: this.instances.some(instance => instance.connected),
                         pageCount: this.pages.size,
-                        pages: Array.from(this.pages.keys())
-                    }));
+                        pages: Array.from(this.pages.keys()),
+                        pageDetails: this.getPageDetails(),
+                        debugCapture: this.debugCapture.getStatus(),
+                        pool: this.getPoolStatus(),
+                        queue: this.scheduler.getStatus(),
+                        browsers: this.getInstanceStatus(),
+                        networkFilter: this.networkFilter.isEnabled() ? {
+                            rules: this.networkFilter.describe(),
+                            pages: Object.fromEntries(Array.from(this.pages, ([id, page]) => [id, this.getNetworkStats(page)]))
+                        } : null
+                    }, ctx);
                     break;
 
                 case '/createPage':
                     // 创建新页面
-                    const pageId = await this.createPage();
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify({
+                    const leaseMs = query.leaseMs ? Math.max(1000, parseInt(query.leaseMs, 10) || 0) : null;
+                    const pageId = await this.createPage(ctx, query.owner || null, leaseMs);
+                    this.sendJson(res, 200, {
                         success: true,
-                        pageId: pageId
-                    }));
+                        pageId: pageId,
+                        fromPool: ctx.fromPool,
+                        network: this.getNetworkStats(this.pages.get(pageId)),
+                        timings: ctx.getTimings()
+                    }, ctx);
                     break;
 
                 case '/closePage':
                     // 关闭指定页面
                     const pageIdToClose = parseInt(query.pageId);
                     const closed = await this.closePage(pageIdToClose);
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify({
+                    this.sendJson(res, 200, {
                         success: closed
-                    }));
+                    }, ctx);
+                    break;
+
+                case '/cancel':
+                    // 取消请求
+                    if (!query.requestId) {
+                        this.sendJson(res, 400, { success: false, error: '缺少 requestId 参数' }, ctx);
+                        break;
+                    }
+                    const cancelled = this.cancelRequest(query.requestId);
+                    this.sendJson(res, 200, {
+                        success: true,
+                        cancelled
+                    }, ctx);
+                    break;
+
+                case '/heartbeat':
+                    // 续约页面
+                    const heartbeatOk = this.heartbeat(parseInt(query.pageId), query.owner || null);
+                    this.sendJson(res, 200, {
+                        success: heartbeatOk
+                    }, ctx);
                     break;
 
                 case '/closeAllPages':
                     // 关闭所有页面
                     await this.closeAllPages();
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify({
+                    this.sendJson(res, 200, {
                         success: true
-                    }));
+                    }, ctx);
                     break;
 
                 default:
-                    res.writeHead(404, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify({ success: false, error: 'Not Found' }));
+                    this.sendJson(res, 404, { success: false, error: 'Not Found' }, ctx);
             }
         } catch (error) {
-            res.writeHead(500, { 'Content-Type': 'application/json' });
-            res.end(JSON.stringify({ success: false, error: error.message }));
+            this.sendError(res, error, ctx);
         }
     }
 
     // 处理POST请求
-    async handlePostRequest(pathname, postData, res) {
+    async handlePostRequest(pathname, postData, res, ctx = new RequestContext(pathname)) {
         try {
             switch (pathname) {
+                case '/textChatStream':
+                    // 流式纯文本聊天，响应由 textChatStream 逐行写出
+                    await this.textChatStream(postData.pageId, postData.message, res, ctx);
+                    break;
+
                 case '/sendMessage':
                     // 发送文本消息
                     const { pageId: msgPageId, message } = postData;
-                    const sendSuccess = await this.sendMessage(msgPageId, message);
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify({
-                        success: sendSuccess
-                    }));
+                    const sendSuccess = await this.sendMessage(msgPageId, message, ctx);
+                    this.sendJson(res, 200, {
+                        success: sendSuccess,
+                        timings: ctx.getTimings()
+                    }, ctx);
                     break;
 
                 case '/uploadFile':
                     // 上传文件
                     const { pageId: uploadPageId, filePath } = postData;
-                    const uploadSuccess = await this.uploadFile(uploadPageId, filePath);
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify({
-                        success: uploadSuccess
-                    }));
+                    const uploadSuccess = await this.uploadFile(uploadPageId, filePath, ctx);
+                    this.sendJson(res, 200, {
+                        success: uploadSuccess,
+                        timings: ctx.getTimings()
+                    }, ctx);
                     break;
 
                 case '/sendMessageWithFile':
                     // 发送包含文件的消息
                     const { pageId: fileMsgPageId, message: fileMsg, filePath: fileMsgPath } = postData;
-                    const fileSendSuccess = await this.sendMessageWithFile(fileMsgPageId, fileMsg, fileMsgPath);
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify({
-                        success: fileSendSuccess
-                    }));
+                    const fileSendSuccess = await this.sendMessageWithFile(fileMsgPageId, fileMsg, fileMsgPath, ctx);
+                    this.sendJson(res, 200, {
+                        success: fileSendSuccess,
+                        timings: ctx.getTimings()
+                    }, ctx);
                     break;
 
                 case '/getAIResponse':
                     // 获取AI回复
                     const { pageId: responsePageId } = postData;
-                    const response = await this.getAIResponse(responsePageId);
+                    const response = await this.getAIResponse(responsePageId, ctx);
                     const aiResponseData = {
                         success: true,
-                        response: response
+                        response: response,
+                        responseSource: ctx.responseSource || null,
+                        timings: ctx.getTimings()
                     };
                     // 记录完整API响应日志
                     console.log('=== API响应日志 - /getAIResponse ===');
                     console.log('请求数据:', postData);
                     console.log('响应数据:', JSON.stringify(aiResponseData, null, 2));
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify(aiResponseData));
+                    this.sendJson(res, 200, aiResponseData, ctx);
+                    break;
+
+                case '/resetConversation':
+                    // 开始新对话
+                    const { pageId: resetPageId } = postData;
+                    const resetMethod = await this.resetConversation(resetPageId, ctx);
+                    this.sendJson(res, 200, {
+                        success: true,
+                        method: resetMethod,
+                        timings: ctx.getTimings()
+                    }, ctx);
                     break;
 
                 case '/extractChatHistory':
                     // 提取聊天记录
-                    const { pageId: historyPageId } = postData;
-                    const history = await this.extractChatHistory(historyPageId);
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify({
+                    const { pageId: historyPageId, since: historySince, latestOnly: historyLatestOnly } = postData;
+                    const history = await this.extractChatHistory(historyPageId, ctx,
+                        { since: historySince, latestOnly: historyLatestOnly });
+                    this.sendJson(res, 200, {
                         success: true,
-                        chatHistory: history
-                    }));
+                        chatHistory: history,
+                        historyIndex: ctx.historyIndex ?? null,
+                        timings: ctx.getTimings()
+                    }, ctx);
                     break;
 
                 case '/ocr':
                     // 执行OCR识别
-                    const { pageId: ocrPageId, imagePath, question } = postData;
+                    const { pageId: ocrPageId, imagePath, question, latestOnly: ocrLatestOnly } = postData;
                     
                     // 发送包含图片的消息
-                    const ocrSendSuccess = await this.sendMessageWithFile(ocrPageId, question, imagePath);
+                    const ocrSendSuccess = await this.sendMessageWithFile(ocrPageId, question, imagePath, ctx);
                     let ocrResponse = null;
                     let chatHistory = [];
                     
                     if (ocrSendSuccess) {
                         // 获取AI回复
-                        ocrResponse = await this.getAIResponse(ocrPageId);
+                        ocrResponse = await this.getAIResponse(ocrPageId, ctx);
                         
                         // 提取聊天记录
-                        chatHistory = await this.extractChatHistory(ocrPageId);
+                        chatHistory = await this.extractChatHistory(ocrPageId, ctx, { latestOnly: ocrLatestOnly });
                     }
                     
                     const ocrResponseData = {
                         success: ocrSendSuccess,
                         message: question,
                         response: ocrResponse,
+                        responseSource: ctx.responseSource || null,
                         chatHistory: chatHistory,
-                        timestamp: new Date().toISOString()
+                        historyIndex: ctx.historyIndex ?? null,
+                        timestamp: new Date().toISOString(),
+                        timings: ctx.getTimings()
                     };
                     
                     // 记录完整API响应日志
@@ -1319,33 +2937,35 @@ class DoubaoBrowserServer {
                     console.log('请求数据:', JSON.stringify(postData, null, 2));
                     console.log('响应数据:', JSON.stringify(ocrResponseData, null, 2));
                     
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify(ocrResponseData));
+                    this.sendJson(res, 200, ocrResponseData, ctx);
                     break;
 
                 case '/textChat':
                     // 纯文本聊天
-                    const { pageId: textChatPageId, message: textMsg } = postData;
+                    const { pageId: textChatPageId, message: textMsg, latestOnly: textLatestOnly } = postData;
                     
                     // 发送文本消息
-                    const textSendSuccess = await this.sendMessage(textChatPageId, textMsg);
+                    const textSendSuccess = await this.sendMessage(textChatPageId, textMsg, ctx);
                     let textResponse = null;
                     let textChatHistory = [];
                     
                     if (textSendSuccess) {
                         // 获取AI回复
-                        textResponse = await this.getAIResponse(textChatPageId);
+                        textResponse = await this.getAIResponse(textChatPageId, ctx);
                         
                         // 提取聊天记录
-                        textChatHistory = await this.extractChatHistory(textChatPageId);
+                        textChatHistory = await this.extractChatHistory(textChatPageId, ctx, { latestOnly: textLatestOnly });
                     }
                     
                     const textChatResponseData = {
                         success: textSendSuccess,
                         message: textMsg,
                         response: textResponse,
+                        responseSource: ctx.responseSource || null,
                         chatHistory: textChatHistory,
-                        timestamp: new Date().toISOString()
+                        historyIndex: ctx.historyIndex ?? null,
+                        timestamp: new Date().toISOString(),
+                        timings: ctx.getTimings()
                     };
                     
                     // 记录完整API响应日志
@@ -1353,26 +2973,70 @@ class DoubaoBrowserServer {
                     console.log('请求数据:', JSON.stringify(postData, null, 2));
                     console.log('响应数据:', JSON.stringify(textChatResponseData, null, 2));
                     
-                    res.writeHead(200, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify(textChatResponseData));
+                    this.sendJson(res, 200, textChatResponseData, ctx);
                     break;
 
                 default:
-                    res.writeHead(404, { 'Content-Type': 'application/json' });
-                    res.end(JSON.stringify({ success: false, error: 'Not Found' }));
+                    this.sendJson(res, 404, { success: false, error: 'Not Found' }, ctx);
             }
         } catch (error) {
-            res.writeHead(500, { 'Content-Type': 'application/json' });
-            res.end(JSON.stringify({ success: false, error: error.message }));
+            this.sendError(res, error, ctx);
         }
     }
 
     // 启动HTTP服务器
-    async startServer(port = 3000, headless = true) {
+    // options: poolSize 预热页面数，maxConcurrent/maxQueue 并发和排队上限，
+    // instanceCount 浏览器实例数，networkFilter 网络请求过滤规则，
+    // chatStreamPattern 聊天接口URL规则（为空时不监听，从页面提取回复），
+    // pageLeaseMs/pageMaxLifetimeMs/pageMaxRequests/pageHeapLimitMb 页面回收条件，
+    // debugCapture 调试截图配置 { mode, sampleRate, dir, maxFiles }
+    async startServer(port = 3000, headless = true, options = {}) {
+        const {
+            poolSize = 0,
+            maxConcurrent = 4,
+            maxQueue = 64,
+            instanceCount = 1,
+            networkFilter = new NetworkFilter(),
+            chatStreamPattern = 'chat/completion',
+            pageLeaseMs = this.pageLeaseMs,
+            pageMaxLifetimeMs = this.pageMaxLifetimeMs,
+            pageMaxRequests = this.pageMaxRequests,
+            pageHeapLimitMb = this.pageHeapLimitMb,
+            debugCapture = null
+        } = options;
         this.port = port;
+        this.poolSize = poolSize;
+        this.scheduler.maxConcurrent = maxConcurrent;
+        this.scheduler.maxQueue = maxQueue;
+        this.networkFilter = networkFilter;
+        this.pageLeaseMs = pageLeaseMs;
+        this.pageMaxLifetimeMs = pageMaxLifetimeMs;
+        this.pageMaxRequests = pageMaxRequests;
+        this.pageHeapLimitMb = pageHeapLimitMb;
+        if (debugCapture) {
+            this.debugCapture = new DebugCapture({ dir: this.debugCapture.dir, ...debugCapture });
+        }
+        console.log(`调试截图模式: ${this.debugCapture.mode}，目录: ${this.debugCapture.dir}`);
+        this.chatStreamPattern = chatStreamPattern ? compileUrlPattern(chatStreamPattern) : null;
+        console.log(chatStreamPattern ? `监听聊天接口: ${chatStreamPattern}` : '不监听聊天接口，从页面提取AI回复');
+        if (networkFilter.ignoredTypes.length > 0) {
+            console.warn(`资源类型 ${networkFilter.ignoredTypes.join(', ')} 承载聊天流程，不按类型拦截，如需拦截请使用 --block-urls`);
+        }
+        if (networkFilter.isEnabled()) {
+            console.log('网络请求过滤规则:', JSON.stringify(networkFilter.describe()));
+        }
         
         // 初始化浏览器
-        await this.init(headless); // 根据参数决定是否使用无头模式
+        await this.init(headless, instanceCount); // 根据参数决定是否使用无头模式
+        
+        // 启动页面回收任务
+        this.startReaper();
+        
+        // 在后台预热页面池
+        if (this.poolSize > 0) {
+            console.log(`预热页面池大小: ${this.poolSize}`);
+            this.refillPool();
+        }
         
         // 创建HTTP服务器
         this.server = http.createServer((req, res) => {
@@ -1388,14 +3052,18 @@ class DoubaoBrowserServer {
             console.log(`GET  /status            - 获取服务状态`);
             console.log(`GET  /createPage        - 创建新页面`);
             console.log(`GET  /closePage?pageId=1 - 关闭指定页面`);
+            console.log(`GET  /heartbeat?pageId=1 - 续约页面`);
+            console.log(`GET  /cancel?requestId=x - 取消请求`);
             console.log(`GET  /closeAllPages     - 关闭所有页面`);
             console.log(`POST /sendMessage       - 发送文本消息`);
             console.log(`POST /uploadFile        - 上传文件`);
             console.log(`POST /sendMessageWithFile - 发送包含文件的消息`);
             console.log(`POST /getAIResponse     - 获取AI回复`);
+            console.log(`POST /resetConversation - 开始新对话`);
             console.log(`POST /extractChatHistory - 提取聊天记录`);
             console.log(`POST /ocr               - 执行OCR识别`);
             console.log(`POST /textChat          - 纯文本聊天`);
+            console.log(`POST /textChatStream    - 流式纯文本聊天（NDJSON）`);
             console.log(`\n按 Ctrl+C 停止服务`);
         });
         
@@ -1417,11 +3085,24 @@ class DoubaoBrowserServer {
         console.log('正在停止服务...');
         
         // 关闭所有页面
+        if (this.reaperTimer) {
+            clearInterval(this.reaperTimer);
+            this.reaperTimer = null;
+        }
+        await this.drainPool();
         await this.closeAllPages();
         
         // 关闭浏览器
+        this.isRunning = false;
+        for (const instance of this.instances) {
+            if (instance.browser) {
+                const browser = instance.browser;
+                instance.browser = null;
+                instance.connected = false;
+                await browser.close().catch(() => {});
+            }
+        }
         if (this.browser) {
-            await this.browser.close();
             this.browser = null;
             console.log('浏览器已关闭');
         }
@@ -1456,10 +3137,94 @@ async function main() {
         headless = true;
     }
     
+    // 读取整数参数
+    const intArg = (name, defaultValue, minValue) => {
+        const index = args.indexOf(name);
+        if (index === -1) {
+            return defaultValue;
+        }
+        const value = parseInt(args[index + 1], 10);
+        return Number.isNaN(value) ? defaultValue : Math.max(minValue, value);
+    };
+    
+    // 预热页面池大小
+    const poolSize = intArg('--pool-size', 0, 0);
+    // 同时操作浏览器的最大请求数和最大排队请求数
+    const maxConcurrent = intArg('--max-concurrency', 4, 1);
+    const maxQueue = intArg('--max-queue', 64, 0);
+    // 浏览器实例数
+    const instanceCount = intArg('--browsers', 1, 1);
+    // 页面回收条件
+    const pageLeaseMs = intArg('--page-lease', 600, 1) * 1000;
+    const pageMaxLifetimeMs = intArg('--page-max-lifetime', 3600, 1) * 1000;
+    const pageMaxRequests = intArg('--page-max-requests', 200, 1);
+    const pageHeapLimitMb = intArg('--page-heap-limit', 512, 1);
+    
+    // 调试截图：off 不截图，sampled 按比例抽样并在出错时截图，on-error 仅在验证码、异常等情况截图，on 每次请求都截图
+    const stringArg = name => {
+        const index = args.indexOf(name);
+        return index === -1 ? undefined : args[index + 1];
+    };
+    const debugCapture = {
+        mode: stringArg('--debug-capture') || 'on-error',
+        maxFiles: intArg('--debug-max-files', 50, 1)
+    };
+    if (stringArg('--debug-sample-rate') !== undefined) {
+        const sampleRate = parseFloat(stringArg('--debug-sample-rate'));
+        debugCapture.sampleRate = Number.isNaN(sampleRate) ? 0.05 : Math.min(1, Math.max(0, sampleRate));
+    }
+    if (stringArg('--debug-dir')) {
+        debugCapture.dir = path.resolve(stringArg('--debug-dir'));
+    }
+    if (!DEBUG_CAPTURE_MODES.has(debugCapture.mode)) {
+        console.error(`不支持的调试截图模式: ${debugCapture.mode}，可选: ${Array.from(DEBUG_CAPTURE_MODES).join(', ')}`);
+        process.exit(1);
+    }
+    
+    // 读取逗号分隔的列表参数
+    const listArg = name => {
+        const index = args.indexOf(name);
+        if (index === -1 || !args[index + 1]) {
+            return [];
+        }
+        return args[index + 1].split(',').map(item => item.trim()).filter(Boolean);
+    };
+    
+    // 网络请求过滤规则
+    const networkFilter = new NetworkFilter({
+        blockTypes: listArg('--block-types'),
+        blockUrls: listArg('--block-urls'),
+        allowUrls: listArg('--allow-urls')
+    });
+    
+    // 聊天接口URL规则，off 表示不监听
+    const chatStreamIndex = args.indexOf('--chat-stream-pattern');
+    let chatStreamPattern = 'chat/completion';
+    if (chatStreamIndex !== -1 && args[chatStreamIndex + 1]) {
+        chatStreamPattern = args[chatStreamIndex + 1] === 'off' ? null : args[chatStreamIndex + 1];
+    }
+    
     console.log(`浏览器模式: ${headless ? '无头模式' : '有头模式'}`);
+    console.log(`最大并发请求数: ${maxConcurrent}，最大排队请求数: ${maxQueue}，浏览器实例数: ${instanceCount}`);
     
     const server = new DoubaoBrowserServer();
-    await server.startServer(3000, headless);
+    await server.startServer(3000, headless, {
+        poolSize,
+        maxConcurrent,
+        maxQueue,
+        instanceCount,
+        networkFilter,
+        chatStreamPattern,
+        pageLeaseMs,
+        pageMaxLifetimeMs,
+        pageMaxRequests,
+        pageHeapLimitMb,
+        debugCapture
+    });
+}
+
+if (require.main === module) {
+    main();
 }
 
-main();
+module.exports = { ChatStreamParser, parseChatStream, RequestContext, RequestAbortedError };
@@ -0,0 +1,39 @@
+// 聊天接口流式响应解析器的测试：node js/test_chat_stream_parser.js
+const assert = require('assert');
+const { ChatStreamParser, parseChatStream } = require('./browser_server');
+
+// 把多段文本按SSE格式编码
+function sse(payloads) {
+    return payloads.map(payload => `data: ${JSON.stringify(payload)}\n\n`).join('') + 'data: [DONE]\n\n';
+}
+
+function openaiDeltas(texts) {
+    return sse(texts.map(text => ({ choices: [{ delta: { content: text } }] })));
+}
+
+function doubaoEvents(texts) {
+    return sse(texts.map(text => ({
+        event_data: JSON.stringify({ message: { content: JSON.stringify({ text }) } })
+    })));
+}
+
+// 连续相同或以已有文本开头的增量都要追加，豆包格式也一样
+assert.strictEqual(parseChatStream(openaiDeltas(['哈', '哈', '哈'])), '哈哈哈');
+assert.strictEqual(parseChatStream(openaiDeltas(['1', '1', '1', '2'])), '1112');
+assert.strictEqual(parseChatStream(openaiDeltas(['你好', '，', '世界'])), '你好，世界');
+assert.strictEqual(parseChatStream(doubaoEvents(['哈', '哈', '哈'])), '哈哈哈');
+assert.strictEqual(parseChatStream(doubaoEvents(['你好', '你', '好'])), '你好你好');
+
+// 累计全文：第二段严格更长且以第一段开头
+assert.strictEqual(parseChatStream(doubaoEvents(['你', '你好', '你好，世界'])), '你好，世界');
+assert.strictEqual(parseChatStream(doubaoEvents(['哈', '哈哈', '哈哈哈'])), '哈哈哈');
+assert.strictEqual(parseChatStream(sse([{ text: '今天' }, { text: '今天天气' }, { text: '今天天气不错' }])), '今天天气不错');
+
+// 增量解析：按片段返回新增文本，片段可以在行中间断开
+const parser = new ChatStreamParser();
+const body = openaiDeltas(['哈', '哈']);
+const deltas = [parser.feed(body.slice(0, 10)), parser.feed(body.slice(10)), parser.end()];
+assert.strictEqual(deltas.join(''), '哈哈');
+assert.strictEqual(parser.text, '哈哈');
+
+console.log('ChatStreamParser 测试通过');
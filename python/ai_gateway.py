@@ -0,0 +1,717 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+豆包AI标准接口网关（Python进程内实现）
+与 js/ai_server.js 提供相同的接口和响应格式（见 mcp_config.json），
+但在同一进程内直接调用 DoubaoTextChat、DoubaoOCR、DoubaoYesNo 和 GeminiOCR：
+1. 基于 asyncio 处理HTTP连接，可同时保持数百个客户端连接
+2. 阻塞的包装器调用在线程池中执行，每个线程复用自己的包装器实例和HTTP连接
+3. 不启动子进程，不调用curl
+4. model 以 gemini/gemma 开头时使用 GeminiOCR，未安装 google-genai 或缺少配置时返回503
+5. /v1/batches 接受OpenAI Batch格式的JSONL请求，在后台执行（见 doubao_batch.py）
+"""
+
+import os
+import sys
+import re
+import json
+import time
+import base64
+import asyncio
+import argparse
+import inspect
+import itertools
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http import HTTPStatus
+from urllib.parse import urlparse, parse_qs
+
+import requests
+from doubao_batch import BATCH_ENDPOINTS, DEFAULT_BATCH_DIR, BatchManager
+from doubao_ocr import DoubaoOCR
+from doubao_text_chat import DoubaoTextChat
+from doubao_yes_no import DoubaoYesNo
+
+# 请求体大小上限，与 ai_server.js 的 express.json({ limit: '50mb' }) 一致
+MAX_BODY_SIZE = 50 * 1024 * 1024
+
+# 使用 GeminiOCR 的模型名前缀
+GEMINI_MODEL_PREFIXES = ("gemini", "gemma")
+
+# 单个批量任务的接口：/v1/batches/{id}、/v1/batches/{id}/cancel、/v1/batches/{id}/output、/v1/batches/{id}/errors
+BATCH_ROUTE = re.compile(r"^/v1/batches/([\w-]+)(?:/(cancel|output|errors))?$")
+
+
+class GatewayError(Exception):
+    """
+    返回给客户端的错误，响应体为 {"error": {"message": ..., "type": ...}}
+    """
+
+    def __init__(self, status, message, error_type="server_error", param=None):
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+        self.param = param
+
+    def to_dict(self):
+        error = {"message": str(self), "type": self.error_type}
+        if self.param:
+            error["param"] = self.param
+        return {"error": error}
+
+
+def _now_iso():
+    """
+    获取与Node.js toISOString一致格式的当前时间
+    :return: ISO格式时间字符串
+    """
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+def _is_gemini_model(model):
+    return bool(model) and model.lower().startswith(GEMINI_MODEL_PREFIXES)
+
+
+class AIGateway:
+    """
+    OpenAI风格的HTTP网关
+    """
+
+    def __init__(self, host="127.0.0.1", port=3001, server_url="http://localhost:3000",
+                 max_workers=32, enable_gemini=True, batch_dir=DEFAULT_BATCH_DIR, batch_concurrency=4):
+        """
+        初始化网关
+        :param host: 监听地址
+        :param port: 监听端口，0表示自动分配
+        :param server_url: 豆包浏览器服务器地址
+        :param max_workers: 同时执行的包装器调用数（线程数），超过时请求在网关内排队
+        :param enable_gemini: 是否允许使用 GeminiOCR
+        :param batch_dir: 批量任务保存目录
+        :param batch_concurrency: 批量任务同时执行的请求数，与实时请求的线程池相互独立
+        """
+        self.host = host
+        self.port = port
+        self.server_url = server_url
+        self.max_workers = max_workers
+        self.enable_gemini = enable_gemini
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-gateway")
+        # 每个线程独立的包装器实例，各自复用HTTP连接
+        self._local = threading.local()
+        self._gemini_error = None
+        # 各线程的 GeminiOCR 实例依次使用不同的API密钥
+        self._gemini_keys = itertools.count()
+        self.batches = BatchManager(self.execute_batch_request, batch_dir, batch_concurrency)
+        self.stats = {"requests": 0, "active": 0, "errors": 0}
+
+        self.loop = None
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # ========== 包装器实例 ==========
+
+    def _tools(self):
+        """
+        获取当前线程的豆包包装器实例
+        """
+        tools = getattr(self._local, "tools", None)
+        if tools is None:
+            tools = {
+                "text_chat": DoubaoTextChat(self.server_url),
+                "ocr": DoubaoOCR(self.server_url),
+                "yes_no": DoubaoYesNo(self.server_url),
+                "session": requests.Session()
+            }
+            self._local.tools = tools
+        return tools
+
+    def _gemini(self):
+        """
+        获取当前线程的 GeminiOCR 实例，首次使用时才导入
+        :raises GatewayError: Gemini 不可用时返回503
+        """
+        if not self.enable_gemini:
+            raise GatewayError(503, "Gemini models are disabled on this gateway", "service_unavailable")
+        gemini = getattr(self._local, "gemini", None)
+        if gemini is not None:
+            return gemini
+        if self._gemini_error:
+            raise GatewayError(503, self._gemini_error, "service_unavailable")
+        try:
+            from gemini_ocr import GeminiOCR
+        except ImportError as e:
+            self._gemini_error = f"Gemini is not available: {e}"
+            raise GatewayError(503, self._gemini_error, "service_unavailable")
+        gemini = GeminiOCR(key_index=next(self._gemini_keys))
+        self._local.gemini = gemini
+        return gemini
+
+    # ========== 接口实现（在线程池中执行） ==========
+
+    def chat_completions(self, body):
+        """
+        聊天补全，响应格式与 ai_server.js 的 /v1/chat/completions 一致
+        stream 为 true 时返回 chat.completion.chunk 字典的生成器，由 handle_connection 以SSE格式写出
+        """
+        messages = body.get("messages")
+        model = body.get("model")
+        if not messages or not isinstance(messages, list):
+            raise GatewayError(400, "Messages array is required", "invalid_request_error", "messages")
+        last_message = messages[-1]
+        if not isinstance(last_message, dict) or last_message.get("role") != "user":
+            raise GatewayError(400, "Last message must be from user", "invalid_request_error", "messages")
+        user_message = last_message.get("content") or ""
+
+        if body.get("stream"):
+            return self._chat_completion_chunks(model, user_message)
+
+        if _is_gemini_model(model):
+            result = self._gemini().ask_question(user_message)
+        else:
+            result = self._tools()["text_chat"].send_message(user_message)
+        if not result or not result.get("success"):
+            raise GatewayError(500, "Chat failed")
+
+        response = result.get("response") or ""
+        return {
+            "id": f"chatcmpl-{int(time.time() * 1000)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model or "doubao-1.0",
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": response
+                },
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": len(user_message),
+                "completion_tokens": len(response),
+                "total_tokens": len(user_message) + len(response)
+            }
+        }
+
+    def _chat_completion_chunks(self, model, user_message):
+        """
+        流式聊天补全，依次生成角色、内容增量和带 finish_reason、usage 的结束片段
+        """
+        completion_id = f"chatcmpl-{int(time.time() * 1000)}"
+        created = int(time.time())
+        model_name = model or "doubao-1.0"
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model_name,
+                "choices": [{
+                    "index": 0,
+                    "delta": delta,
+                    "finish_reason": finish_reason
+                }]
+            }
+
+        yield chunk({"role": "assistant", "content": ""})
+        if _is_gemini_model(model):
+            deltas = self._gemini().ask_question_stream(user_message)
+        else:
+            deltas = self._tools()["text_chat"].stream_message(user_message)
+        completion_tokens = 0
+        for text in deltas:
+            if text:
+                completion_tokens += len(text)
+                yield chunk({"content": text})
+
+        final = chunk({}, "stop")
+        final["usage"] = {
+            "prompt_tokens": len(user_message),
+            "completion_tokens": completion_tokens,
+            "total_tokens": len(user_message) + completion_tokens
+        }
+        yield final
+
+    def ocr_recognize(self, body):
+        """
+        OCR识别，响应格式与 ai_server.js 的 /v1/ocr/recognize 一致
+        """
+        image_url = body.get("image_url")
+        image_base64 = body.get("image_base64")
+        question = body.get("question") or "图里有什么内容？"
+        model = body.get("model")
+        if not image_url and not image_base64 and body.get("type") != "screenshot":
+            raise GatewayError(400, "Either image_url, image_base64, or type=screenshot is required",
+                               "invalid_request_error")
+
+        if body.get("type") == "screenshot":
+            # 屏幕截图OCR，截图模块依赖较多，使用时才导入
+            from screenshot_ocr import ScreenshotOCR
+            screenshot_ocr = getattr(self._local, "screenshot_ocr", None)
+            if screenshot_ocr is None:
+                screenshot_ocr = self._local.screenshot_ocr = ScreenshotOCR(self.server_url)
+            result = screenshot_ocr.recognize_screen(question=question)
+        else:
+            image_path = self._save_image(image_url, image_base64)
+            try:
+                if _is_gemini_model(model):
+                    result = self._gemini().recognize_image(image_path, question)
+                else:
+                    result = self._tools()["ocr"].recognize_image(image_path, question)
+            finally:
+                os.remove(image_path)
+        if result is None:
+            raise GatewayError(500, "识别失败")
+
+        return {
+            "id": f"ocr-{int(time.time() * 1000)}",
+            "object": "ocr.recognize",
+            "created": int(time.time()),
+            "model": model or "doubao-ocr-1.0",
+            "result": {
+                "text": result.get("response"),
+                "success": result.get("success"),
+                "original_result": result
+            }
+        }
+
+    def _save_image(self, image_url, image_base64):
+        """
+        将图片URL或base64内容保存为临时文件
+        :return: 临时文件路径
+        """
+        if image_url:
+            response = self._tools()["session"].get(image_url, timeout=60)
+            if not response.ok:
+                raise GatewayError(500, f"Failed to download image: HTTP {response.status_code}")
+            data = response.content
+            suffix = os.path.splitext(urlparse(image_url).path)[1] or ".png"
+        else:
+            if "," in image_base64 and image_base64.startswith("data:"):
+                image_base64 = image_base64.split(",", 1)[1]
+            try:
+                data = base64.b64decode(image_base64)
+            except ValueError:
+                raise GatewayError(400, "image_base64 is not valid base64", "invalid_request_error",
+                                   "image_base64")
+            suffix = ".png"
+        with tempfile.NamedTemporaryFile(suffix=suffix, prefix="ocr_image_", delete=False) as f:
+            f.write(data)
+        return f.name
+
+    def moderations(self, body):
+        """
+        是/否判断，响应格式与 ai_server.js 的 /v1/moderations 一致
+        """
+        input_value = body.get("input")
+        question = body.get("question")
+        if not input_value and not question:
+            raise GatewayError(400, "Either input or question is required", "invalid_request_error")
+
+        file_path = None
+        image_path = None
+        if isinstance(input_value, str):
+            # 文本输入，直接使用question
+            question = question or "Is this content acceptable?"
+        elif isinstance(input_value, dict):
+            image_path = input_value.get("image")
+            file_path = None if image_path else input_value.get("file")
+
+        try:
+            answer = self._tools()["yes_no"].judge(question=question, file_path=file_path,
+                                                   image_path=image_path)
+        except ValueError as e:
+            raise GatewayError(400, str(e), "invalid_request_error")
+        result = answer or "无法判断"
+        is_positive = result.lower() == "yes"
+
+        return {
+            "id": f"mod-{int(time.time() * 1000)}",
+            "object": "moderation",
+            "created": int(time.time()),
+            "model": "doubao-moderation-1.0",
+            "results": [{
+                "flagged": not is_positive,
+                "categories": {
+                    "positive": is_positive,
+                    "negative": not is_positive
+                },
+                "category_scores": {
+                    "positive": 0.99 if is_positive else 0.01,
+                    "negative": 0.99 if not is_positive else 0.01
+                },
+                "original_result": result
+            }]
+        }
+
+    def execute_batch_request(self, url, body):
+        """
+        执行批量任务中的单个请求（在批量任务线程池中调用）
+        :return: (状态码, 响应字典)
+        """
+        handler_name = self.ROUTES.get(("POST", url))
+        if url not in BATCH_ENDPOINTS or handler_name is None:
+            return 400, GatewayError(400, f"Unsupported batch url: {url}", "invalid_request_error").to_dict()
+        try:
+            return 200, getattr(self, handler_name)(dict(body, stream=False))
+        except GatewayError as e:
+            return e.status, e.to_dict()
+
+    def create_batch(self, body):
+        """
+        创建批量任务，input 为JSONL文本或请求对象数组
+        """
+        if not body.get("input"):
+            raise GatewayError(400, "input is required", "invalid_request_error", "input")
+        try:
+            return self.batches.create(body["input"], body.get("endpoint"),
+                                       body.get("completion_window") or "24h", body.get("metadata"))
+        except ValueError as e:
+            raise GatewayError(400, str(e), "invalid_request_error", "input")
+
+    def list_batches(self, query):
+        try:
+            limit = int(query.get("limit") or 20)
+        except ValueError:
+            raise GatewayError(400, "limit must be an integer", "invalid_request_error", "limit")
+        batches = self.batches.list(limit)
+        return {"object": "list", "data": batches, "has_more": False}
+
+    def retrieve_batch(self, query):
+        batch = self.batches.get(query["batch_id"])
+        if batch is None:
+            raise GatewayError(404, f"No batch found with id '{query['batch_id']}'", "invalid_request_error")
+        return batch
+
+    def cancel_batch(self, query):
+        batch = self.batches.cancel(query["batch_id"])
+        if batch is None:
+            raise GatewayError(404, f"No batch found with id '{query['batch_id']}'", "invalid_request_error")
+        return batch
+
+    def batch_results(self, query):
+        """
+        下载批量任务的结果（JSONL），任务执行期间即可下载已完成的部分，offset 为起始字节偏移
+        """
+        try:
+            offset = int(query.get("offset") or 0)
+        except ValueError:
+            raise GatewayError(400, "offset must be an integer", "invalid_request_error", "offset")
+        data = self.batches.read_results(query["batch_id"], query["kind"], offset)
+        if data is None:
+            raise GatewayError(404, f"No batch found with id '{query['batch_id']}'", "invalid_request_error")
+        return data
+
+    def health(self):
+        return {
+            "status": "ok",
+            "timestamp": _now_iso(),
+            "service": "doubao-ai-api",
+            "gateway": {
+                "maxWorkers": self.max_workers,
+                **self.stats
+            },
+            "batches": {
+                "maxConcurrency": self.batches.max_concurrency,
+                "running": len(self.batches.cancel_events)
+            }
+        }
+
+    # ========== HTTP处理 ==========
+
+    ROUTES = {
+        ("POST", "/v1/chat/completions"): "chat_completions",
+        ("POST", "/v1/ocr/recognize"): "ocr_recognize",
+        ("POST", "/v1/moderations"): "moderations",
+        ("POST", "/v1/batches"): "create_batch",
+        ("GET", "/v1/batches"): "list_batches"
+    }
+
+    BATCH_ROUTES = {
+        ("GET", None): "retrieve_batch",
+        ("POST", "cancel"): "cancel_batch",
+        ("GET", "output"): "batch_results",
+        ("GET", "errors"): "batch_results"
+    }
+
+    async def dispatch(self, method, path, body, query=""):
+        """
+        处理一个请求
+        :param query: 查询字符串，GET接口的参数
+        :return: (状态码, 响应字典)，流式请求返回 (200, 生成器)，由 _write_stream 负责计数；
+                 批量任务结果返回 (200, 字节串)
+        """
+        if method == "GET" and path == "/health":
+            return 200, self.health()
+        handler_name = self.ROUTES.get((method, path))
+        params = {name: values[0] for name, values in parse_qs(query).items()}
+        match = BATCH_ROUTE.match(path)
+        if handler_name is None and match:
+            handler_name = self.BATCH_ROUTES.get((method, match.group(2)))
+            params.update(batch_id=match.group(1), kind=match.group(2))
+        if handler_name is None:
+            return 404, GatewayError(404, f"Cannot {method} {path}", "invalid_request_error").to_dict()
+
+        self.stats["requests"] += 1
+        self.stats["active"] += 1
+        streaming = False
+        try:
+            try:
+                data = params if method == "GET" or match else json.loads(body or b"{}")
+            except ValueError:
+                raise GatewayError(400, "Request body must be valid JSON", "invalid_request_error")
+            if not isinstance(data, dict):
+                raise GatewayError(400, "Request body must be a JSON object", "invalid_request_error")
+            handler = getattr(self, handler_name)
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, handler, data)
+            streaming = inspect.isgenerator(result)
+            return 200, result
+        except GatewayError as e:
+            if e.status >= 500:
+                self.stats["errors"] += 1
+                print(f"{path} 处理失败: {e}", file=sys.stderr)
+            return e.status, e.to_dict()
+        except Exception as e:
+            self.stats["errors"] += 1
+            print(f"{path} 处理失败: {e}", file=sys.stderr)
+            return 500, GatewayError(500, str(e)).to_dict()
+        finally:
+            if not streaming:
+                self.stats["active"] -= 1
+
+    async def handle_connection(self, reader, writer):
+        """
+        处理一个HTTP/1.1连接，支持keep-alive
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._write_response(writer, 400, {"error": {"message": "Bad Request",
+                                                                       "type": "invalid_request_error"}}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = (headers.get("connection", "").lower() != "close" and
+                              version.upper() != "HTTP/1.0")
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_SIZE:
+                    await self._write_response(writer, 413, GatewayError(
+                        413, "Request entity too large", "invalid_request_error").to_dict(), False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                if method == "OPTIONS":
+                    await self._write_response(writer, 204, None, keep_alive)
+                else:
+                    url = urlparse(target)
+                    status, data = await self.dispatch(method, url.path, body, url.query)
+                    if inspect.isgenerator(data):
+                        await self._write_stream(writer, data, keep_alive)
+                    else:
+                        await self._write_response(writer, status, data, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _write_response(self, writer, status, data, keep_alive):
+        if isinstance(data, bytes):
+            payload, content_type = data, "application/jsonl; charset=utf-8"
+        else:
+            payload = b"" if data is None else json.dumps(data, ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        headers = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(payload)}",
+            "Access-Control-Allow-Origin: *",
+            "Access-Control-Allow-Methods: GET, POST, OPTIONS",
+            "Access-Control-Allow-Headers: Content-Type, Authorization",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"
+        ]
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+    async def _write_stream(self, writer, chunks, keep_alive):
+        """
+        以SSE格式（text/event-stream，分块传输）写出流式响应
+        生成器在线程池中迭代，片段经队列交给事件循环；客户端断开时停止迭代并关闭生成器，
+        包装器随之关闭页面、中止服务器端的请求
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        disconnected = threading.Event()
+        done = object()
+
+        def pump():
+            try:
+                for item in chunks:
+                    if disconnected.is_set():
+                        break
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                chunks.close()
+                loop.call_soon_threadsafe(queue.put_nowait, done)
+
+        def write_chunk(data):
+            writer.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+        headers = [
+            "HTTP/1.1 200 OK",
+            "Content-Type: text/event-stream; charset=utf-8",
+            "Cache-Control: no-cache",
+            "Transfer-Encoding: chunked",
+            "Access-Control-Allow-Origin: *",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"
+        ]
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+        pumping = loop.run_in_executor(self.executor, pump)
+        try:
+            while True:
+                item = await queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    self.stats["errors"] += 1
+                    print(f"流式聊天失败: {item}", file=sys.stderr)
+                    error = item if isinstance(item, GatewayError) else GatewayError(500, str(item))
+                    item = error.to_dict()
+                write_chunk(f"data: {json.dumps(item, ensure_ascii=False)}\n\n".encode("utf-8"))
+                await writer.drain()
+            write_chunk(b"data: [DONE]\n\n")
+            write_chunk(b"")
+            await writer.drain()
+        finally:
+            disconnected.set()
+            self.stats["active"] -= 1
+            await pumping
+
+    # ========== 启动与停止 ==========
+
+    async def serve(self):
+        """
+        在当前事件循环中启动网关，返回 asyncio 服务器对象
+        """
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port,
+                                                 backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+        # 继续执行上次停止时未完成的批量任务
+        resumed = self.batches.resume()
+        if resumed:
+            print(f"继续执行 {len(resumed)} 个未完成的批量任务", file=sys.stderr)
+        return self.server
+
+    def start(self):
+        """
+        在后台线程中启动网关
+        :return: 网关地址
+        """
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.serve())
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+        return self.url
+
+    def stop(self):
+        """
+        停止后台线程中的网关
+        """
+        if self.loop and self.server:
+            async def shutdown():
+                self.server.close()
+                await self.server.wait_closed()
+
+            asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout=5)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5)
+            self.loop.close()
+            self.loop = None
+            self.server = None
+        self.batches.shutdown()
+        self.executor.shutdown(wait=False)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+
+async def _serve_forever(gateway):
+    server = await gateway.serve()
+    print("=== 豆包AI标准接口网关已启动 ===")
+    print(f"服务地址: {gateway.url}")
+    print(f"浏览器服务器: {gateway.server_url}，工作线程数: {gateway.max_workers}")
+    print("\n可用API:")
+    print("GET  /health                     - 健康检查")
+    print("POST /v1/chat/completions        - 聊天补全")
+    print("POST /v1/ocr/recognize           - OCR识别")
+    print("POST /v1/moderations             - 是/否判断")
+    print("POST /v1/batches                 - 创建批量任务（JSONL）")
+    print("GET  /v1/batches[/{id}]          - 批量任务列表/进度")
+    print("POST /v1/batches/{id}/cancel     - 取消批量任务")
+    print("GET  /v1/batches/{id}/output     - 下载结果（errors 为失败的请求）")
+    print("\n按 Ctrl+C 停止服务")
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    """
+    主函数，用于命令行启动网关
+    """
+    parser = argparse.ArgumentParser(description="豆包AI标准接口网关（Python进程内实现）")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=3001, help="监听端口")
+    parser.add_argument("--server", default="http://localhost:3000", help="浏览器服务器地址")
+    parser.add_argument("--workers", type=int, default=32, help="同时执行的包装器调用数")
+    parser.add_argument("--no-gemini", action="store_true", help="禁用Gemini模型")
+    parser.add_argument("--batch-dir", default=DEFAULT_BATCH_DIR, help="批量任务保存目录")
+    parser.add_argument("--batch-concurrency", type=int, default=4, help="批量任务同时执行的请求数")
+
+    args = parser.parse_args()
+
+    gateway = AIGateway(args.host, args.port, args.server, args.workers, not args.no_gemini,
+                        args.batch_dir, args.batch_concurrency)
+    try:
+        asyncio.run(_serve_forever(gateway))
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+    finally:
+        gateway.batches.shutdown()
+        gateway.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+豆包浏览器客户端基准测试
+默认在进程内启动本地替身服务器（fake_browser_server.py），
+可重复地测量 DoubaoBrowserClient 及各包装器的吞吐量和延迟
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from doubao_browser_client import DoubaoBrowserClient
+from doubao_ocr import DoubaoOCR
+from doubao_text_chat import DoubaoTextChat
+from doubao_yes_no import DoubaoYesNo
+from fake_browser_server import FakeBrowserServer, parse_latency_args
+
+
+def percentile(values, pct):
+    """
+    计算百分位数（线性插值）
+    :param values: 数值列表
+    :param pct: 百分位，0~100
+    :return: 百分位数，列表为空时返回None
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100.0
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize_latencies(latencies_ms):
+    """
+    汇总延迟数据
+    :param latencies_ms: 延迟列表（毫秒）
+    :return: 包含均值和p50/p95/p99的字典
+    """
+    if not latencies_ms:
+        return {"mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+    return {
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 3),
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p95_ms": round(percentile(latencies_ms, 95), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3)
+    }
+
+
+def _client_text_chat(server_url, image_path):
+    client = DoubaoBrowserClient(server_url)
+
+    def run():
+        page_id = client.create_page()
+        if not page_id:
+            return False
+        try:
+            return bool(client.text_chat(page_id, "你好").get("success"))
+        finally:
+            client.close_page(page_id)
+    return run
+
+
+def _text_chat(server_url, image_path):
+    chat = DoubaoTextChat(server_url)
+    return lambda: bool((chat.send_message("你好") or {}).get("success"))
+
+
+# 基准测试的并发请求内容相同，关闭相同请求合并，使每次调用都真正访问服务器
+def _ocr(server_url, image_path):
+    ocr = DoubaoOCR(server_url, coalesce=False)
+    return lambda: bool((ocr.recognize_image(image_path) or {}).get("success"))
+
+
+def _yes_no(server_url, image_path):
+    yes_no = DoubaoYesNo(server_url, coalesce=False)
+    return lambda: yes_no.judge(question="地球是圆的吗？") is not None
+
+
+# 基准测试操作：名称 -> 工厂函数，工厂为每个工作线程创建独立的客户端实例
+OPERATIONS = {
+    "client": _client_text_chat,
+    "text_chat": _text_chat,
+    "ocr": _ocr,
+    "yes_no": _yes_no
+}
+
+
+def run_benchmark(server_url, operation, iterations=100, concurrency=1, image_path=None):
+    """
+    对单个操作进行基准测试
+    :param server_url: 浏览器服务器地址
+    :param operation: 操作名称，见 OPERATIONS
+    :param iterations: 总调用次数
+    :param concurrency: 并发线程数
+    :param image_path: OCR使用的图片路径
+    :return: 结果字典
+    """
+    factory = OPERATIONS[operation]
+    per_worker = [iterations // concurrency + (1 if i < iterations % concurrency else 0)
+                  for i in range(concurrency)]
+
+    def worker(count):
+        run = factory(server_url, image_path)
+        latencies = []
+        errors = 0
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                ok = run()
+            except Exception:
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            if not ok:
+                errors += 1
+        return latencies, errors
+
+    # 包装器会打印大量日志，基准测试期间丢弃标准输出，避免终端输出影响计时
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(worker, per_worker))
+        elapsed = time.perf_counter() - started
+
+    latencies = [latency for worker_latencies, _ in results for latency in worker_latencies]
+    errors = sum(worker_errors for _, worker_errors in results)
+
+    result = {
+        "operation": operation,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(iterations / elapsed, 2) if elapsed > 0 else None
+    }
+    result.update(summarize_latencies(latencies))
+    return result
+
+
+def main():
+    """
+    主函数，用于命令行运行基准测试
+    """
+    parser = argparse.ArgumentParser(description="豆包浏览器客户端基准测试工具")
+    parser.add_argument("--server", help="使用已运行的服务器地址；不提供时在进程内启动本地替身服务器")
+    parser.add_argument("--operations", default=",".join(OPERATIONS), help="参与测试的操作，逗号分隔")
+    parser.add_argument("--iterations", type=int, default=200, help="每个操作的调用次数")
+    parser.add_argument("--concurrency", type=int, default=1, help="并发线程数")
+    parser.add_argument("--latency", action="append", help="替身服务器接口延迟分布，如 /ocr=fixed:5")
+    parser.add_argument("--default-latency", default="fixed:0", help="替身服务器默认延迟分布（毫秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="替身服务器注入失败的比例")
+    parser.add_argument("--seed", type=int, default=0, help="替身服务器随机种子")
+    parser.add_argument("--json", help="测试结果JSON输出路径")
+
+    args = parser.parse_args()
+
+    operations = [name.strip() for name in args.operations.split(",") if name.strip()]
+    for name in operations:
+        if name not in OPERATIONS:
+            parser.error(f"不支持的操作: {name}")
+
+    fake_server = None
+    server_url = args.server
+    if not server_url:
+        fake_server = FakeBrowserServer(
+            latency=parse_latency_args(args.latency),
+            default_latency=args.default_latency,
+            failure_rate=args.failure_rate,
+            seed=args.seed
+        )
+        server_url = fake_server.start()
+        print(f"已启动本地替身服务器: {server_url}")
+
+    # OCR需要一个真实存在的图片文件
+    image_file = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+    image_file.write(b"\x89PNG\r\n\x1a\n")
+    image_file.close()
+
+    results = []
+    try:
+        for name in operations:
+            result = run_benchmark(server_url, name, args.iterations, args.concurrency, image_file.name)
+            results.append(result)
+            print(f"{name:<10} 吞吐量: {result['throughput_rps']} 次/秒  "
+                  f"p50: {result['p50_ms']} ms  p95: {result['p95_ms']} ms  "
+                  f"p99: {result['p99_ms']} ms  错误: {result['errors']}")
+    finally:
+        os.remove(image_file.name)
+        if fake_server:
+            fake_server.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"测试结果已保存到: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
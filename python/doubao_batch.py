@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+OpenAI风格的批量请求
+输入为JSONL文件，每行一个请求：
+    {"custom_id": "req-1", "method": "POST", "url": "/v1/chat/completions", "body": {...}}
+url 可以是 /v1/chat/completions、/v1/ocr/recognize、/v1/moderations。
+BatchManager 在后台线程中执行批量任务，结果逐行追加到输出文件，进度保存在 batch.json 中，
+网关重启后继续执行未完成的任务；命令行工具通过网关的 /v1/batches 接口提交任务、查看进度和下载结果，
+也可以不经过网关直接在本进程中执行。
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# 批量任务支持的接口
+BATCH_ENDPOINTS = ("/v1/chat/completions", "/v1/ocr/recognize", "/v1/moderations")
+
+# 不会再变化的任务状态
+TERMINAL_STATUSES = ("completed", "failed", "cancelled", "expired")
+
+# 批量任务默认保存目录
+DEFAULT_BATCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "batches")
+
+
+def parse_completion_window(window):
+    """
+    解析完成时限
+    :param window: 如 "24h"、"90m"、"3600s"
+    :return: 秒数
+    :raises ValueError: 格式错误
+    """
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    try:
+        value = float(window[:-1])
+        unit = units[window[-1]]
+    except (TypeError, IndexError, KeyError, ValueError):
+        raise ValueError(f"无效的完成时限: {window}")
+    if value <= 0:
+        raise ValueError(f"无效的完成时限: {window}")
+    return value * unit
+
+
+def parse_batch_input(lines, endpoint=None):
+    """
+    解析并校验批量请求
+    :param lines: JSONL文本、文本行列表或请求字典列表
+    :param endpoint: 限定所有请求使用的接口，None表示允许混合
+    :return: 请求字典列表
+    :raises ValueError: 请求格式错误，错误信息包含行号
+    """
+    if isinstance(lines, (str, bytes)):
+        if isinstance(lines, bytes):
+            lines = lines.decode("utf-8")
+        lines = lines.splitlines()
+
+    requests_ = []
+    custom_ids = set()
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, str):
+            if not line.strip():
+                continue
+            try:
+                line = json.loads(line)
+            except ValueError:
+                raise ValueError(f"第 {line_number} 行不是有效的JSON")
+        if not isinstance(line, dict):
+            raise ValueError(f"第 {line_number} 行必须是JSON对象")
+
+        custom_id = line.get("custom_id")
+        url = line.get("url")
+        if not custom_id or not isinstance(custom_id, str):
+            raise ValueError(f"第 {line_number} 行缺少 custom_id")
+        if custom_id in custom_ids:
+            raise ValueError(f"第 {line_number} 行的 custom_id 重复: {custom_id}")
+        if line.get("method", "POST").upper() != "POST":
+            raise ValueError(f"第 {line_number} 行只支持POST请求")
+        if url not in BATCH_ENDPOINTS or (endpoint and url != endpoint):
+            raise ValueError(f"第 {line_number} 行的接口不受支持: {url}")
+        if not isinstance(line.get("body"), dict):
+            raise ValueError(f"第 {line_number} 行缺少请求体 body")
+
+        custom_ids.add(custom_id)
+        requests_.append({"custom_id": custom_id, "method": "POST", "url": url, "body": line["body"]})
+
+    if not requests_:
+        raise ValueError("批量请求为空")
+    return requests_
+
+
+class BatchManager:
+    """
+    批量任务管理器
+    每个任务保存在 <目录>/<任务ID>/ 下：batch.json（任务状态）、input.jsonl、output.jsonl（成功的响应）、
+    errors.jsonl（失败的响应）。所有任务共用一个线程池，按提交顺序执行
+    """
+
+    def __init__(self, execute, directory=DEFAULT_BATCH_DIR, max_concurrency=4):
+        """
+        初始化批量任务管理器
+        :param execute: 执行单个请求的函数 execute(url, body) -> (状态码, 响应字典)
+        :param directory: 任务保存目录，首次创建任务时才创建
+        :param max_concurrency: 同时执行的请求数
+        """
+        self.execute = execute
+        self.directory = directory
+        self.max_concurrency = max_concurrency
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="batch")
+        self.lock = threading.Lock()
+        self.batches = {}
+        self.cancel_events = {}
+        self.shutting_down = False
+
+    def _path(self, batch_id, name):
+        return os.path.join(self.directory, batch_id, name)
+
+    def _save(self, batch):
+        # 先写临时文件再替换，读取方不会看到写了一半的状态
+        path = self._path(batch["id"], "batch.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(batch, f, ensure_ascii=False, indent=2)
+        os.replace(path + ".tmp", path)
+
+    def _load(self, batch_id):
+        with self.lock:
+            batch = self.batches.get(batch_id)
+            if batch is not None:
+                return batch
+        path = self._path(batch_id, "batch.json")
+        if os.path.basename(batch_id) != batch_id or not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            batch = json.load(f)
+        with self.lock:
+            return self.batches.setdefault(batch_id, batch)
+
+    def create(self, requests_, endpoint=None, completion_window="24h", metadata=None):
+        """
+        创建批量任务并在后台开始执行
+        :param requests_: 请求列表，格式见 parse_batch_input
+        :param endpoint: 限定所有请求使用的接口
+        :param completion_window: 完成时限，超过时尚未开始的请求不再执行，任务状态为 expired
+        :param metadata: 附加信息，原样返回
+        :return: 任务字典
+        :raises ValueError: 请求格式错误
+        """
+        requests_ = parse_batch_input(requests_, endpoint)
+        window = parse_completion_window(completion_window)
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        created_at = int(time.time())
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": endpoint or requests_[0]["url"],
+            "input_file_id": f"{batch_id}-input",
+            "completion_window": completion_window,
+            "status": "validating",
+            "output_file_id": f"{batch_id}-output",
+            "error_file_id": f"{batch_id}-errors",
+            "created_at": created_at,
+            "in_progress_at": None,
+            "expires_at": int(created_at + window),
+            "completed_at": None,
+            "cancelled_at": None,
+            "expired_at": None,
+            "request_counts": {"total": len(requests_), "completed": 0, "failed": 0},
+            "metadata": metadata or {}
+        }
+
+        os.makedirs(os.path.join(self.directory, batch_id))
+        with open(self._path(batch_id, "input.jsonl"), "w", encoding="utf-8") as f:
+            for request in requests_:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        self._save(batch)
+        with self.lock:
+            self.batches[batch_id] = batch
+        self._start(batch_id)
+        return self.get(batch_id)
+
+    def get(self, batch_id):
+        """
+        获取任务状态
+        :return: 任务字典，不存在时返回None
+        """
+        batch = self._load(batch_id)
+        if batch is None:
+            return None
+        with self.lock:
+            return json.loads(json.dumps(batch))
+
+    def list(self, limit=20):
+        """
+        列出最近创建的任务
+        :param limit: 最多返回的任务数
+        :return: 任务字典列表，按创建时间倒序
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        batches = [self.get(name) for name in os.listdir(self.directory)]
+        batches = [batch for batch in batches if batch]
+        batches.sort(key=lambda batch: batch["created_at"], reverse=True)
+        return batches[:limit]
+
+    def cancel(self, batch_id):
+        """
+        取消任务：正在执行的请求继续完成，尚未开始的请求不再执行
+        :return: 任务字典，不存在时返回None
+        """
+        batch = self._load(batch_id)
+        if batch is None:
+            return None
+        with self.lock:
+            if batch["status"] not in TERMINAL_STATUSES:
+                batch["status"] = "cancelling"
+                self._save(batch)
+                event = self.cancel_events.get(batch_id)
+                if event is not None:
+                    event.set()
+                else:
+                    # 没有在执行（如网关重启后尚未恢复），直接标记为已取消
+                    batch["status"] = "cancelled"
+                    batch["cancelled_at"] = int(time.time())
+                    self._save(batch)
+        return self.get(batch_id)
+
+    def read_results(self, batch_id, kind="output", offset=0):
+        """
+        读取结果文件中已完整写入的行，任务执行期间即可下载
+        :param batch_id: 任务ID
+        :param kind: output（成功的响应）或 errors（失败的响应）
+        :param offset: 起始字节偏移
+        :return: 结果字节串（以完整的行结束），任务不存在时返回None
+        """
+        if kind not in ("output", "errors") or self._load(batch_id) is None:
+            return None
+        path = self._path(batch_id, f"{kind}.jsonl")
+        if not os.path.exists(path):
+            return b""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        return data[:data.rfind(b"\n") + 1]
+
+    def resume(self):
+        """
+        继续执行未完成的任务（网关启动时调用）
+        :return: 继续执行的任务ID列表
+        """
+        resumed = []
+        for batch in self.list(limit=None):
+            if batch["status"] in TERMINAL_STATUSES:
+                continue
+            if batch["status"] == "cancelling":
+                self.cancel(batch["id"])
+                continue
+            self._start(batch["id"])
+            resumed.append(batch["id"])
+        return resumed
+
+    def shutdown(self):
+        """
+        停止执行：尚未开始的请求在下次 resume() 时继续执行
+        """
+        with self.lock:
+            events = list(self.cancel_events.values())
+            self.shutting_down = True
+        for event in events:
+            event.set()
+        self.executor.shutdown(wait=False)
+
+    def _start(self, batch_id):
+        with self.lock:
+            self.cancel_events[batch_id] = threading.Event()
+        thread = threading.Thread(target=self._run, args=(batch_id,), name=f"{batch_id}-runner", daemon=True)
+        thread.start()
+
+    def _finished_ids(self, batch_id):
+        """
+        已经写入结果的请求ID，用于恢复执行时跳过
+        """
+        finished = set()
+        for kind in ("output", "errors"):
+            for line in self.read_results(batch_id, kind).decode("utf-8").splitlines():
+                finished.add(json.loads(line)["custom_id"])
+        return finished
+
+    def _run(self, batch_id):
+        batch = self._load(batch_id)
+        cancelled = self.cancel_events[batch_id]
+        with open(self._path(batch_id, "input.jsonl"), encoding="utf-8") as f:
+            requests_ = parse_batch_input(f.read())
+        finished = self._finished_ids(batch_id)
+        pending = [request for request in requests_ if request["custom_id"] not in finished]
+
+        with self.lock:
+            # cancel() 可能在 _start() 之后、这里之前已把状态改为 cancelling，不能覆盖
+            if batch["status"] != "cancelling":
+                batch["status"] = "in_progress"
+                batch["in_progress_at"] = batch["in_progress_at"] or int(time.time())
+                self._save(batch)
+
+        futures = [self.executor.submit(self._execute_one, batch, request, cancelled) for request in pending]
+        for future in futures:
+            future.result()
+
+        with self.lock:
+            self.cancel_events.pop(batch_id, None)
+            if self.shutting_down and batch["status"] == "in_progress":
+                # 网关停止，保持 in_progress 状态以便下次恢复
+                return
+            now = int(time.time())
+            counts = batch["request_counts"]
+            if batch["status"] == "cancelling":
+                batch["status"] = "cancelled"
+                batch["cancelled_at"] = now
+            elif counts["completed"] + counts["failed"] < counts["total"]:
+                batch["status"] = "expired"
+                batch["expired_at"] = now
+            elif counts["completed"] == 0:
+                batch["status"] = "failed"
+                batch["completed_at"] = now
+            else:
+                batch["status"] = "completed"
+                batch["completed_at"] = now
+            self._save(batch)
+
+    def _execute_one(self, batch, request, cancelled):
+        """
+        执行单个请求，结果追加到 output.jsonl 或 errors.jsonl
+        """
+        if cancelled.is_set():
+            return
+        if time.time() > batch["expires_at"]:
+            return
+        try:
+            status, body = self.execute(request["url"], request["body"])
+        except Exception as e:
+            status, body = 500, {"error": {"message": str(e), "type": "server_error"}}
+
+        succeeded = 200 <= status < 300
+        record = {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": request["custom_id"],
+            "response": {
+                "status_code": status,
+                "request_id": uuid.uuid4().hex,
+                "body": body
+            },
+            "error": None if succeeded else body.get("error")
+        }
+        with self.lock:
+            with open(self._path(batch["id"], "output.jsonl" if succeeded else "errors.jsonl"),
+                      "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            batch["request_counts"]["completed" if succeeded else "failed"] += 1
+            self._save(batch)
+
+
+class BatchClient:
+    """
+    网关批量接口（/v1/batches）的客户端
+    """
+
+    def __init__(self, gateway_url="http://localhost:3001"):
+        self.gateway_url = gateway_url.rstrip("/")
+        self.session = requests.Session()
+
+    def _call(self, method, route, **kwargs):
+        response = self.session.request(method, f"{self.gateway_url}{route}", timeout=60, **kwargs)
+        if not response.ok:
+            try:
+                message = response.json()["error"]["message"]
+            except (ValueError, KeyError, TypeError):
+                message = response.text
+            raise RuntimeError(f"HTTP {response.status_code}: {message}")
+        return response
+
+    def create(self, input_path, endpoint=None, completion_window="24h", metadata=None):
+        """
+        读取JSONL文件并提交批量任务
+        :return: 任务字典
+        """
+        with open(input_path, encoding="utf-8") as f:
+            lines = f.read()
+        body = {"input": lines, "completion_window": completion_window, "metadata": metadata or {}}
+        if endpoint:
+            body["endpoint"] = endpoint
+        return self._call("POST", "/v1/batches", json=body).json()
+
+    def retrieve(self, batch_id):
+        return self._call("GET", f"/v1/batches/{batch_id}").json()
+
+    def list(self, limit=20):
+        return self._call("GET", "/v1/batches", params={"limit": limit}).json()["data"]
+
+    def cancel(self, batch_id):
+        return self._call("POST", f"/v1/batches/{batch_id}/cancel").json()
+
+    def download(self, batch_id, kind="output", offset=0):
+        """
+        下载结果文件中已完整写入的行
+        :param kind: output 或 errors
+        :param offset: 起始字节偏移
+        :return: 结果字节串
+        """
+        return self._call("GET", f"/v1/batches/{batch_id}/{kind}", params={"offset": offset}).content
+
+    def follow(self, batch_id, output, kind="output", interval=2.0):
+        """
+        持续下载新写入的结果直到任务结束
+        :param output: 二进制输出流
+        :param interval: 轮询间隔（秒）
+        :return: 最终的任务字典
+        """
+        offset = 0
+        while True:
+            batch = self.retrieve(batch_id)
+            data = self.download(batch_id, kind, offset)
+            if data:
+                output.write(data)
+                output.flush()
+                offset += len(data)
+            if batch["status"] in TERMINAL_STATUSES and not data:
+                return batch
+            if not data:
+                time.sleep(interval)
+
+
+def wait_for_batch(manager, batch_id, interval=0.5):
+    """
+    等待本进程中的任务结束
+    :return: 最终的任务字典
+    """
+    while True:
+        batch = manager.get(batch_id)
+        if batch["status"] in TERMINAL_STATUSES:
+            return batch
+        time.sleep(interval)
+
+
+def _print_progress(batch):
+    counts = batch["request_counts"]
+    print(f"{batch['id']}  {batch['status']:<11} 完成: {counts['completed']}  失败: {counts['failed']}  "
+          f"总数: {counts['total']}")
+
+
+def main():
+    """
+    主函数，批量任务命令行工具
+    """
+    parser = argparse.ArgumentParser(description="豆包批量请求工具（OpenAI Batch格式）")
+    parser.add_argument("--gateway", default="http://localhost:3001", help="网关地址（python/ai_gateway.py）")
+    subparsers = parser.add_subparsers(dest="command", required=True, help="可用命令")
+
+    submit_parser = subparsers.add_parser("submit", help="提交批量任务")
+    submit_parser.add_argument("input_path", help="JSONL请求文件")
+    submit_parser.add_argument("--endpoint", choices=BATCH_ENDPOINTS, help="限定所有请求使用的接口")
+    submit_parser.add_argument("--completion-window", default="24h", help="完成时限，如 24h")
+    submit_parser.add_argument("--metadata", action="append", default=[], help="附加信息，格式 key=value")
+
+    status_parser = subparsers.add_parser("status", help="查看任务进度")
+    status_parser.add_argument("batch_id", help="任务ID")
+
+    subparsers.add_parser("list", help="列出最近的任务")
+
+    cancel_parser = subparsers.add_parser("cancel", help="取消任务")
+    cancel_parser.add_argument("batch_id", help="任务ID")
+
+    download_parser = subparsers.add_parser("download", help="下载结果")
+    download_parser.add_argument("batch_id", help="任务ID")
+    download_parser.add_argument("-o", "--output", help="输出文件，默认输出到标准输出")
+    download_parser.add_argument("--errors", action="store_true", help="下载失败的请求")
+    download_parser.add_argument("--follow", action="store_true", help="持续下载直到任务结束")
+
+    run_parser = subparsers.add_parser("run", help="不经过网关，在本进程中执行批量任务")
+    run_parser.add_argument("input_path", help="JSONL请求文件")
+    run_parser.add_argument("-o", "--output", required=True, help="结果输出文件")
+    run_parser.add_argument("--server", default="http://localhost:3000", help="浏览器服务器地址")
+    run_parser.add_argument("--concurrency", type=int, default=4, help="同时执行的请求数")
+    run_parser.add_argument("--no-gemini", action="store_true", help="禁用Gemini模型")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "run":
+            from ai_gateway import AIGateway
+            import tempfile
+            import shutil
+
+            gateway = AIGateway(server_url=args.server, enable_gemini=not args.no_gemini)
+            directory = tempfile.mkdtemp(prefix="doubao_batch_")
+            manager = BatchManager(gateway.execute_batch_request, directory, args.concurrency)
+            try:
+                with open(args.input_path, encoding="utf-8") as f:
+                    batch = manager.create(f.read())
+                batch = wait_for_batch(manager, batch["id"])
+                with open(args.output, "wb") as f:
+                    f.write(manager.read_results(batch["id"], "output"))
+                    f.write(manager.read_results(batch["id"], "errors"))
+            finally:
+                manager.shutdown()
+                gateway.executor.shutdown(wait=False)
+                shutil.rmtree(directory, ignore_errors=True)
+            _print_progress(batch)
+            print(f"结果已保存到: {args.output}")
+            return
+
+        client = BatchClient(args.gateway)
+        if args.command == "submit":
+            metadata = dict(item.split("=", 1) for item in args.metadata)
+            batch = client.create(args.input_path, args.endpoint, args.completion_window, metadata)
+            print(batch["id"])
+        elif args.command == "status":
+            print(json.dumps(client.retrieve(args.batch_id), ensure_ascii=False, indent=2))
+        elif args.command == "list":
+            for batch in client.list():
+                _print_progress(batch)
+        elif args.command == "cancel":
+            _print_progress(client.cancel(args.batch_id))
+        elif args.command == "download":
+            kind = "errors" if args.errors else "output"
+            output = open(args.output, "wb") if args.output else sys.stdout.buffer
+            try:
+                if args.follow:
+                    batch = client.follow(args.batch_id, output, kind)
+                    print(f"任务已结束: {batch['status']}", file=sys.stderr)
+                else:
+                    output.write(client.download(args.batch_id, kind))
+            finally:
+                if args.output:
+                    output.close()
+    except (RuntimeError, ValueError, OSError, requests.RequestException) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,117 @@ import requests
 import json
 import time
 import os
-from typing import Dict, Optional, List
+import random
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, List
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# 当前线程正在计时的请求的各阶段耗时（毫秒），由 DoubaoBrowserClient._request 设置
+_timing_state = threading.local()
+
+
+def _add_phase(phase: str, started: float) -> float:
+    """
+    累计当前请求某一阶段的耗时
+    :param phase: 阶段名称
+    :param started: 阶段开始时间（time.perf_counter）
+    :return: 本次耗时（毫秒）
+    """
+    elapsed = (time.perf_counter() - started) * 1000
+    timings = getattr(_timing_state, "timings", None)
+    if timings is not None:
+        timings[phase] = timings.get(phase, 0.0) + elapsed
+    return elapsed
+
+
+class _TimingConnectionMixin:
+    """
+    记录建立连接、发送请求、等待响应头三个阶段的耗时
+    """
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _add_phase("connect", started)
+
+    def request(self, *args, **kwargs):
+        # 未复用连接时，连接在发送请求时才建立，需从发送耗时中扣除连接耗时
+        timings = getattr(_timing_state, "timings", None)
+        connect_before = timings.get("connect", 0.0) if timings is not None else 0.0
+        started = time.perf_counter()
+        try:
+            return super().request(*args, **kwargs)
+        finally:
+            if timings is not None:
+                elapsed = (time.perf_counter() - started) * 1000
+                connect_elapsed = timings.get("connect", 0.0) - connect_before
+                timings["send"] = timings.get("send", 0.0) + elapsed - connect_elapsed
+
+    def getresponse(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().getresponse(*args, **kwargs)
+        finally:
+            _add_phase("wait", started)
+
+
+class _TimingHTTPConnection(_TimingConnectionMixin, HTTPConnection):
+    pass
+
+
+class _TimingHTTPSConnection(_TimingConnectionMixin, HTTPSConnection):
+    pass
+
+
+class _TimingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimingHTTPConnection
+
+
+class _TimingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimingHTTPSConnection
+
+
+class _TimingHTTPAdapter(HTTPAdapter):
+    """
+    使用带计时功能连接的HTTP适配器
+    """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TimingHTTPConnectionPool,
+            "https": _TimingHTTPSConnectionPool
+        }
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """
+    解析 Server-Timing 响应头
+    :param header: 响应头内容，如 "captchaCheck;dur=12.5, total;dur=30"
+    :return: 阶段名称到耗时（毫秒）的字典
+    """
+    timings = {}
+    if not header:
+        return timings
+    for entry in header.split(","):
+        parts = [part.strip() for part in entry.split(";")]
+        if not parts[0]:
+            continue
+        for param in parts[1:]:
+            key, _, value = param.partition("=")
+            if key.strip() == "dur":
+                try:
+                    timings[parts[0]] = float(value.strip().strip('"'))
+                except ValueError:
+                    pass
+    return timings
+
 
 class DoubaoBrowserClient:
     """
@@ -17,43 +127,259 @@ class DoubaoBrowserClient:
     用于与豆包浏览器服务器通信，实现浏览器复用功能
     """
     
-    def __init__(self, server_url: str = "http://localhost:3000"):
+    def __init__(self, server_url: str = "http://localhost:3000", max_retries: int = 5,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0):
         """
         初始化豆包浏览器客户端
         :param server_url: 浏览器服务器地址，默认为 http://localhost:3000
+        :param max_retries: 服务器请求队列已满（HTTP 429）时的最大重试次数
+        :param backoff_base: 重试等待的初始秒数，每次重试翻倍
+        :param backoff_max: 重试等待的最大秒数
         """
         self.server_url = server_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
         self.session = requests.Session()
         self.session.headers.update({
             'Content-Type': 'application/json'
         })
+        self.session.mount("http://", _TimingHTTPAdapter())
+        self.session.mount("https://", _TimingHTTPAdapter())
+        # 最近一次请求的耗时明细
+        self.last_timings: Optional[Dict] = None
+        self._timing_hooks: List[Callable[[Dict], None]] = []
+        # 最近一次请求的请求ID，可用于 cancel
+        self.last_request_id: Optional[str] = None
+        # 当前线程 deadline() 设置的请求ID和截止时间
+        self._deadline_state = threading.local()
+
+    @contextmanager
+    def deadline(self, seconds: float, request_id: Optional[str] = None):
+        """
+        为代码块内的所有请求设置共同的截止时间和请求ID
+        每个请求的超时时间不超过剩余时间，服务器在剩余时间用完后中止处理并释放页面；
+        其他线程可以用返回的请求ID调用 cancel 提前中止
+        :param seconds: 剩余时间（秒）
+        :param request_id: 请求ID，默认自动生成
+        :return: 请求ID
+        """
+        previous = (getattr(self._deadline_state, "request_id", None),
+                    getattr(self._deadline_state, "deadline", None))
+        request_id = request_id or uuid.uuid4().hex
+        self._deadline_state.request_id = request_id
+        self._deadline_state.deadline = time.monotonic() + seconds
+        try:
+            yield request_id
+        finally:
+            self._deadline_state.request_id, self._deadline_state.deadline = previous
+
+    def cancel(self, request_id: str) -> bool:
+        """
+        取消指定请求ID的请求，服务器会中止正在执行或排队中的请求并释放页面，之后使用该ID的请求也会被拒绝
+        :param request_id: 请求ID
+        :return: 是否有请求被取消
+        """
+        try:
+            response = self.session.get(f"{self.server_url}/cancel",
+                                        params={"requestId": request_id}, timeout=5)
+            response.raise_for_status()
+            return response.json().get("cancelled", 0) > 0
+        except requests.RequestException as e:
+            print(f"取消请求 {request_id} 失败: {str(e)}")
+            return False
+
+    def add_timing_hook(self, hook: Callable[[Dict], None]):
+        """
+        注册耗时回调，每次请求结束后调用
+        回调参数为耗时明细字典：
+        - route: 接口路径
+        - method: 请求方法
+        - page_id: 页面ID（无则为None）
+        - attempt: 第几次尝试，从0开始（服务器返回429后重试时递增）
+        - status: HTTP状态码（请求未完成时为None）
+        - error: 错误信息（成功时为None）
+        - client: 客户端各阶段耗时（毫秒）：connect 建立连接（复用连接时为0）、
+          send 发送请求、wait 等待响应头（包含服务器处理时间）、
+          read 读取响应体及解析、total 总耗时
+        - server: 服务器返回的各阶段耗时（毫秒），如 captchaCheck、typeMessage、replyWait、total
+        :param hook: 回调函数
+        """
+        self._timing_hooks.append(hook)
+
+    def remove_timing_hook(self, hook: Callable[[Dict], None]):
+        """
+        移除耗时回调
+        :param hook: 通过 add_timing_hook 注册的回调函数
+        """
+        if hook in self._timing_hooks:
+            self._timing_hooks.remove(hook)
+
+    def _request(self, method: str, route: str, timeout: float,
+                 params: Optional[Dict] = None, data: Optional[Dict] = None, detached: bool = False) -> Dict:
+        """
+        发送请求并记录耗时明细，服务器请求队列已满（HTTP 429）时按提示退避重试
+        请求携带请求ID和剩余时间（X-Request-Id、X-Request-Timeout 请求头），客户端超时后通知服务器取消该请求
+        :param method: 请求方法
+        :param route: 接口路径
+        :param timeout: 单次请求超时时间（秒），在 deadline() 内时不超过剩余时间
+        :param params: 查询参数
+        :param data: JSON请求体
+        :param detached: 不使用 deadline() 的请求ID和截止时间，用于关闭页面等清理请求，
+                         原请求被取消或超时后仍能执行（服务器会拒绝已取消的请求ID的后续请求）
+        :return: 响应JSON
+        :raises requests.RequestException: 请求失败、响应状态码错误、重试次数用尽或已超过截止时间
+        """
+        request_id = None if detached else getattr(self._deadline_state, "request_id", None)
+        request_id = request_id or uuid.uuid4().hex
+        deadline = None if detached else getattr(self._deadline_state, "deadline", None)
+        self.last_request_id = request_id
+        attempt = 0
+        while True:
+            # 未设置截止时间时，每次尝试各自使用完整的超时时间
+            remaining = deadline - time.monotonic() if deadline is not None else timeout
+            if remaining <= 0:
+                raise requests.Timeout(f"请求 {route} 已超过截止时间")
+            headers = self._deadline_headers(request_id, remaining)
+            try:
+                response, result = self._send(method, route, min(timeout, remaining), params, data,
+                                              attempt, headers)
+            except requests.Timeout:
+                # 客户端已放弃等待，通知服务器停止处理，尽快释放页面
+                self.cancel(request_id)
+                raise
+            if response.status_code != 429:
+                return result
+            delay = self._retry_delay(response, result, attempt)
+            if deadline is not None:
+                delay = min(delay, max(deadline - time.monotonic(), 0.0))
+            print(f"服务器请求队列已满（排队请求数: {(result or {}).get('queueDepth')}），"
+                  f"{delay:.2f} 秒后重试 {route}")
+            time.sleep(delay)
+            attempt += 1
+
+    @staticmethod
+    def _deadline_headers(request_id: str, remaining: float) -> Dict:
+        """
+        生成携带请求ID和剩余时间的请求头
+        :param request_id: 请求ID
+        :param remaining: 剩余时间（秒）
+        :return: 请求头字典
+        """
+        return {
+            "X-Request-Id": request_id,
+            # 服务器的截止时间比客户端略早，以便在客户端超时前收到服务器的504响应
+            "X-Request-Timeout": str(max(int((remaining - 0.1) * 1000), 1))
+        }
+
+    def _send(self, method, route, timeout, params, data, attempt, headers=None):
+        """
+        发送一次请求
+        :return: (响应对象, 响应JSON)，仅在可重试的429响应时返回而不抛出异常
+        """
+        phases = {"connect": 0.0, "send": 0.0, "wait": 0.0}
+        response = None
+        result = None
+        error = None
+        _timing_state.timings = phases
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.server_url}{route}",
+                                            params=params, json=data, headers=headers, timeout=timeout)
+            if response.status_code == 429 and attempt < self.max_retries:
+                result = response.json()
+                error = result.get("error") if isinstance(result, dict) else None
+                return response, result
+            response.raise_for_status()
+            result = response.json()
+            return response, result
+        except requests.RequestException as e:
+            error = str(e)
+            raise
+        finally:
+            total = (time.perf_counter() - started) * 1000
+            _timing_state.timings = None
+            self._record_timings(method, route, params, data, attempt, response, result,
+                                 error, phases, total)
+
+    def _retry_delay(self, response, result, attempt: int) -> float:
+        """
+        计算429响应后的重试等待时间
+        优先使用服务器提示的等待时间，并保证不小于指数退避时间，加入随机抖动避免多个客户端同时重试
+        :return: 等待秒数
+        """
+        hint = None
+        if isinstance(result, dict) and result.get("retryAfter") is not None:
+            hint = result.get("retryAfter")
+        elif response.headers.get("Retry-After"):
+            hint = response.headers.get("Retry-After")
+        try:
+            hint = float(hint) if hint is not None else 0.0
+        except ValueError:
+            hint = 0.0
+        delay = min(max(hint, self.backoff_base * 2 ** attempt), self.backoff_max)
+        return delay * (1 + random.random() * 0.2)
+
+    def _record_timings(self, method, route, params, data, attempt, response, result, error, phases, total):
+        """
+        汇总一次请求的耗时明细，并调用已注册的耗时回调
+        """
+        client_timings = {name: round(ms, 3) for name, ms in phases.items()}
+        client_timings["read"] = round(max(total - sum(phases.values()), 0.0), 3)
+        client_timings["total"] = round(total, 3)
+
+        server_timings = {}
+        if response is not None:
+            server_timings = parse_server_timing(response.headers.get("Server-Timing"))
+        if isinstance(result, dict) and isinstance(result.get("timings"), dict):
+            server_timings = result["timings"]
+
+        page_id = (data or {}).get("pageId", (params or {}).get("pageId"))
+        timings = {
+            "route": route,
+            "method": method,
+            "page_id": page_id,
+            "attempt": attempt,
+            "status": response.status_code if response is not None else None,
+            "error": error,
+            "client": client_timings,
+            "server": server_timings
+        }
+        self.last_timings = timings
+        for hook in list(self._timing_hooks):
+            try:
+                hook(timings)
+            except Exception as e:
+                # 耗时回调出错不影响请求结果
+                print(f"耗时回调执行失败: {str(e)}")
         
     def get_status(self) -> Dict:
         """
         获取服务器状态
         :return: 服务器状态信息
         """
-        url = f"{self.server_url}/status"
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            return response.json()
+            return self._request("GET", "/status", timeout=10)
         except requests.RequestException as e:
             return {
                 "success": False,
                 "error": f"获取服务器状态失败: {str(e)}"
             }
     
-    def create_page(self) -> Optional[int]:
+    def create_page(self, owner: Optional[str] = None, lease: Optional[float] = None) -> Optional[int]:
         """
         创建新页面
+        :param owner: 页面所有者标识，续约时用于校验
+        :param lease: 页面租约时长（秒），超过该时间未使用也未续约的页面会被服务器关闭，默认使用服务器设置
         :return: 页面ID，如果失败返回None
         """
-        url = f"{self.server_url}/createPage"
+        params = {}
+        if owner:
+            params["owner"] = owner
+        if lease:
+            params["leaseMs"] = int(lease * 1000)
         try:
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            result = response.json()
+            result = self._request("GET", "/createPage", timeout=30, params=params or None)
             if result.get("success"):
                 return result.get("pageId")
             return None
@@ -67,26 +393,53 @@ class DoubaoBrowserClient:
         :param page_id: 页面ID
         :return: 是否成功关闭
         """
-        url = f"{self.server_url}/closePage?pageId={page_id}"
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            result = response.json()
+            result = self._request("GET", "/closePage", timeout=10, params={"pageId": page_id}, detached=True)
             return result.get("success", False)
         except requests.RequestException as e:
             print(f"关闭页面 {page_id} 失败: {str(e)}")
             return False
     
+    def heartbeat(self, page_id: int, owner: Optional[str] = None) -> bool:
+        """
+        续约页面，长时间不使用但仍需保留的页面应定期调用
+        :param page_id: 页面ID
+        :param owner: 页面所有者标识，与创建页面时一致
+        :return: 页面是否仍然有效
+        """
+        params = {"pageId": page_id}
+        if owner:
+            params["owner"] = owner
+        try:
+            result = self._request("GET", "/heartbeat", timeout=10, params=params)
+            return result.get("success", False)
+        except requests.RequestException as e:
+            print(f"页面 {page_id} 续约失败: {str(e)}")
+            return False
+    
+    def reset_page(self, page_id: int) -> bool:
+        """
+        在页面上开始新对话，清空聊天记录，以便同一页面处理下一个请求
+        :param page_id: 页面ID
+        :return: 是否成功重置
+        """
+        data = {
+            "pageId": page_id
+        }
+        try:
+            result = self._request("POST", "/resetConversation", timeout=60, data=data)
+            return result.get("success", False)
+        except requests.RequestException as e:
+            print(f"重置页面 {page_id} 失败: {str(e)}")
+            return False
+    
     def close_all_pages(self) -> bool:
         """
         关闭所有页面
         :return: 是否成功关闭
         """
-        url = f"{self.server_url}/closeAllPages"
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            result = response.json()
+            result = self._request("GET", "/closeAllPages", timeout=10)
             return result.get("success", False)
         except requests.RequestException as e:
             print(f"关闭所有页面失败: {str(e)}")
@@ -99,15 +452,12 @@ class DoubaoBrowserClient:
         :param message: 消息内容
         :return: 是否发送成功
         """
-        url = f"{self.server_url}/sendMessage"
         data = {
             "pageId": page_id,
             "message": message
         }
         try:
-            response = self.session.post(url, json=data, timeout=30)
-            response.raise_for_status()
-            result = response.json()
+            result = self._request("POST", "/sendMessage", timeout=30, data=data)
             return result.get("success", False)
         except requests.RequestException as e:
             print(f"发送消息失败: {str(e)}")
@@ -128,15 +478,12 @@ class DoubaoBrowserClient:
         # 转换为绝对路径
         file_path = os.path.abspath(file_path)
         
-        url = f"{self.server_url}/uploadFile"
         data = {
             "pageId": page_id,
             "filePath": file_path
         }
         try:
-            response = self.session.post(url, json=data, timeout=60)
-            response.raise_for_status()
-            result = response.json()
+            result = self._request("POST", "/uploadFile", timeout=60, data=data)
             return result.get("success", False)
         except requests.RequestException as e:
             print(f"上传文件失败: {str(e)}")
@@ -158,16 +505,13 @@ class DoubaoBrowserClient:
         # 转换为绝对路径
         file_path = os.path.abspath(file_path)
         
-        url = f"{self.server_url}/sendMessageWithFile"
         data = {
             "pageId": page_id,
             "message": message,
             "filePath": file_path
         }
         try:
-            response = self.session.post(url, json=data, timeout=60)
-            response.raise_for_status()
-            result = response.json()
+            result = self._request("POST", "/sendMessageWithFile", timeout=60, data=data)
             return result.get("success", False)
         except requests.RequestException as e:
             print(f"发送包含文件的消息失败: {str(e)}")
@@ -179,14 +523,11 @@ class DoubaoBrowserClient:
         :param page_id: 页面ID
         :return: AI回复内容，如果失败返回None
         """
-        url = f"{self.server_url}/getAIResponse"
         data = {
             "pageId": page_id
         }
         try:
-            response = self.session.post(url, json=data, timeout=60)
-            response.raise_for_status()
-            result = response.json()
+            result = self._request("POST", "/getAIResponse", timeout=60, data=data)
             if result.get("success"):
                 return result.get("response")
             return None
@@ -194,20 +535,24 @@ class DoubaoBrowserClient:
             print(f"获取AI回复失败: {str(e)}")
             return None
     
-    def extract_chat_history(self, page_id: int) -> List[Dict]:
+    def extract_chat_history(self, page_id: int, since: Optional[int] = None,
+                             latest_only: bool = False) -> List[Dict]:
         """
         提取聊天记录
         :param page_id: 页面ID
+        :param since: 只提取该序号之后的消息（上次响应中的 historyIndex）
+        :param latest_only: 只提取最新一轮回复
         :return: 聊天记录列表
         """
-        url = f"{self.server_url}/extractChatHistory"
         data = {
             "pageId": page_id
         }
+        if since:
+            data["since"] = since
+        if latest_only:
+            data["latestOnly"] = True
         try:
-            response = self.session.post(url, json=data, timeout=30)
-            response.raise_for_status()
-            result = response.json()
+            result = self._request("POST", "/extractChatHistory", timeout=30, data=data)
             if result.get("success"):
                 return result.get("chatHistory", [])
             return []
@@ -215,12 +560,14 @@ class DoubaoBrowserClient:
             print(f"提取聊天记录失败: {str(e)}")
             return []
     
-    def ocr(self, page_id: int, image_path: str, question: str = "图里有什么内容？") -> Dict:
+    def ocr(self, page_id: int, image_path: str, question: str = "图里有什么内容？",
+            latest_only: bool = False) -> Dict:
         """
         执行OCR识别
         :param page_id: 页面ID
         :param image_path: 图片路径
         :param question: 提问内容，默认为"图里有什么内容？"
+        :param latest_only: chatHistory 只包含最新一轮回复（多轮对话中使用）
         :return: OCR识别结果
         """
         # 验证文件路径
@@ -233,44 +580,121 @@ class DoubaoBrowserClient:
         # 转换为绝对路径
         image_path = os.path.abspath(image_path)
         
-        url = f"{self.server_url}/ocr"
         data = {
             "pageId": page_id,
             "imagePath": image_path,
             "question": question
         }
+        if latest_only:
+            data["latestOnly"] = True
         try:
-            response = self.session.post(url, json=data, timeout=120)
-            response.raise_for_status()
-            return response.json()
+            return self._request("POST", "/ocr", timeout=120, data=data)
         except requests.RequestException as e:
             return {
                 "success": False,
                 "error": f"OCR识别失败: {str(e)}"
             }
     
-    def text_chat(self, page_id: int, message: str) -> Dict:
+    def text_chat(self, page_id: int, message: str, latest_only: bool = False) -> Dict:
         """
         纯文本聊天
         :param page_id: 页面ID
         :param message: 聊天消息
+        :param latest_only: chatHistory 只包含最新一轮回复（多轮对话中使用）
         :return: 聊天结果
         """
-        url = f"{self.server_url}/textChat"
         data = {
             "pageId": page_id,
             "message": message
         }
+        if latest_only:
+            data["latestOnly"] = True
         try:
-            response = self.session.post(url, json=data, timeout=60)
-            response.raise_for_status()
-            return response.json()
+            return self._request("POST", "/textChat", timeout=60, data=data)
         except requests.RequestException as e:
             return {
                 "success": False,
                 "error": f"纯文本聊天失败: {str(e)}"
             }
     
+    def text_chat_stream(self, page_id: int, message: str, timeout: float = 60) -> Iterator[Dict]:
+        """
+        流式纯文本聊天，回复文本随生成逐段返回
+        :param page_id: 页面ID
+        :param message: 聊天消息
+        :param timeout: 超时时间（秒），在 deadline() 内时不超过剩余时间
+        :return: 服务器事件迭代器：若干个 {"type": "delta", "text": ...}，
+                 最后是 {"type": "done", "success", "response", "responseSource", "timings"} 或 {"type": "error", "error"}
+        :raises requests.RequestException: 请求失败或已超过截止时间
+        """
+        route = "/textChatStream"
+        data = {"pageId": page_id, "message": message}
+        request_id = getattr(self._deadline_state, "request_id", None) or uuid.uuid4().hex
+        deadline = getattr(self._deadline_state, "deadline", None)
+        self.last_request_id = request_id
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic() if deadline is not None else timeout
+            if remaining <= 0:
+                raise requests.Timeout(f"请求 {route} 已超过截止时间")
+            phases = {"connect": 0.0, "send": 0.0, "wait": 0.0}
+            _timing_state.timings = phases
+            started = time.perf_counter()
+            try:
+                response = self.session.post(f"{self.server_url}{route}", json=data,
+                                             headers=self._deadline_headers(request_id, remaining),
+                                             timeout=min(timeout, remaining), stream=True)
+            except requests.RequestException as e:
+                self._record_timings("POST", route, None, data, attempt, None, None, str(e), phases,
+                                     (time.perf_counter() - started) * 1000)
+                if isinstance(e, requests.Timeout):
+                    self.cancel(request_id)
+                raise
+            finally:
+                _timing_state.timings = None
+            if response.status_code != 429 or attempt >= self.max_retries:
+                break
+
+            # 开始流式输出前服务器队列已满，与 _request 相同地退避重试
+            try:
+                result = response.json()
+            except ValueError:
+                result = None
+            finally:
+                response.close()
+            self._record_timings("POST", route, None, data, attempt, response, result,
+                                 (result or {}).get("error"), phases, (time.perf_counter() - started) * 1000)
+            delay = self._retry_delay(response, result, attempt)
+            if deadline is not None:
+                delay = min(delay, max(deadline - time.monotonic(), 0.0))
+            print(f"服务器请求队列已满（排队请求数: {(result or {}).get('queueDepth')}），"
+                  f"{delay:.2f} 秒后重试 {route}")
+            time.sleep(delay)
+            attempt += 1
+
+        # 流结束（或出错、调用方提前停止读取）时记录耗时，服务器耗时取自结束事件的 timings
+        result = None
+        error = None
+        try:
+            response.raise_for_status()
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    event = json.loads(line)
+                    if event.get("type") in ("done", "error"):
+                        result = event
+                        error = event.get("error")
+                    yield event
+        except requests.RequestException as e:
+            error = str(e)
+            if isinstance(e, requests.Timeout):
+                # 客户端已放弃等待，通知服务器停止处理，尽快释放页面
+                self.cancel(request_id)
+            raise
+        finally:
+            response.close()
+            self._record_timings("POST", route, None, data, attempt, response, result, error, phases,
+                                 (time.perf_counter() - started) * 1000)
+    
     def is_server_running(self) -> bool:
         """
         检查服务器是否正在运行
@@ -8,14 +8,17 @@
 import os
 from doubao_browser_client import DoubaoBrowserClient
 from doubao_common import validate_file_path
+from singleflight import default_group, file_digest
 
 class DoubaoOCR:
-    def __init__(self, server_url="http://localhost:3000"):
+    def __init__(self, server_url="http://localhost:3000", coalesce=True):
         """
         初始化豆包OCR识别类
         :param server_url: 浏览器服务器地址，默认为 http://localhost:3000
+        :param coalesce: 是否合并同时进行中的相同请求（图片内容和问题都相同），合并后只执行一次
         """
         self.client = DoubaoBrowserClient(server_url)
+        self.single_flight = default_group if coalesce else None
     
     def recognize_image(self, image_path, question="图里有什么内容？", headless=True):
         """
@@ -28,6 +31,12 @@ class DoubaoOCR:
         # 验证并获取绝对路径
         image_path = validate_file_path(image_path)
         
+        if self.single_flight is None:
+            return self._recognize_image(image_path, question)
+        key = ("ocr", self.client.server_url, file_digest(image_path), question)
+        return self.single_flight.do(key, self._recognize_image, image_path, question)
+    
+    def _recognize_image(self, image_path, question):
         print(f"开始识别图片: {image_path}")
         print(f"提问内容: {question}")
         
@@ -6,6 +6,7 @@
 1. 图片OCR识别
 2. 屏幕截图OCR识别  
 3. 是/否判断（支持纯文本、文件、图片）
+4. 常驻工作进程模式（worker），通过标准输入输出逐行处理JSON请求
 """
 
 import os
@@ -14,6 +15,7 @@ import argparse
 import tempfile
 import json
 import time
+import contextlib
 from datetime import datetime
 from PIL import ImageGrab
 import requests
@@ -643,6 +645,82 @@ class DoubaoYesNo:
             return self.judge_text(question, debug)
 
 
+# ========== 常驻工作进程 ==========
+
+class OCRWorker:
+    """
+    常驻工作进程，复用各工具实例（及其HTTP连接），避免每次请求启动Python进程和导入模块
+    协议：标准输入每行一个JSON请求 {"id": ..., "op": "ocr|screenshot|yesno", ...参数}，
+    标准输出每行一个JSON响应 {"id": ..., "ok": true, "result": ...} 或 {"id": ..., "ok": false, "error": ...}
+    处理过程中的日志输出到标准错误，不影响协议输出
+    """
+
+    def __init__(self, server_url="http://localhost:3000"):
+        """
+        初始化工作进程
+        :param server_url: 浏览器服务器地址
+        """
+        self.server_url = server_url
+        self.ocr = DoubaoOCR(server_url)
+        self.screenshot_ocr = ScreenshotOCR(server_url)
+        self.yes_no = DoubaoYesNo(server_url)
+
+    def handle(self, request):
+        """
+        处理一个请求
+        :param request: 请求字典
+        :return: 结果，ocr/screenshot 为识别结果字典，yesno 为 {"answer": "yes"/"no"/None}
+        """
+        op = request.get("op")
+        question = request.get("question") or "图里有什么内容？"
+        if op == "ocr":
+            result = self.ocr.recognize_image(request["image_path"], question)
+            if result is None:
+                raise RuntimeError("识别失败")
+            return result
+        if op == "screenshot":
+            result = self.screenshot_ocr.recognize_screen(request.get("output"), question)
+            if result is None:
+                raise RuntimeError("识别失败")
+            return result
+        if op == "yesno":
+            answer = self.yes_no.judge(
+                question=request.get("question"),
+                file_path=request.get("file"),
+                image_path=request.get("image"),
+                debug=request.get("debug", False)
+            )
+            return {"answer": answer}
+        if op == "ping":
+            return {"pid": os.getpid()}
+        raise ValueError(f"不支持的操作: {op}")
+
+    def serve(self, input_stream=None, output_stream=None):
+        """
+        逐行读取请求并写出响应，输入结束时退出
+        :param input_stream: 请求输入流，默认标准输入
+        :param output_stream: 响应输出流，默认标准输出
+        """
+        input_stream = input_stream or sys.stdin
+        output_stream = output_stream or sys.stdout
+        for line in input_stream:
+            line = line.strip()
+            if not line:
+                continue
+            request_id = None
+            try:
+                request = json.loads(line)
+                request_id = request.get("id")
+                # 各工具类直接print日志，处理期间重定向到标准错误
+                with contextlib.redirect_stdout(sys.stderr):
+                    result = self.handle(request)
+                response = {"id": request_id, "ok": True, "result": result}
+            except Exception as e:
+                response = {"id": request_id, "ok": False, "error": str(e)}
+            output_stream.write(json.dumps(response, ensure_ascii=False) + "\n")
+            output_stream.flush()
+
+
 # ========== 命令行入口 ==========
 
 def main():
@@ -674,10 +752,19 @@ def main():
     yes_no_parser.add_argument("--server", default="http://localhost:3000", help="浏览器服务器地址")
     yes_no_parser.add_argument("--debug", action="store_true", help="输出调试信息")
     
+    # 4. 常驻工作进程
+    worker_parser = subparsers.add_parser("worker", help="常驻工作进程，通过标准输入输出处理JSON请求")
+    worker_parser.add_argument("--server", default="http://localhost:3000", help="浏览器服务器地址")
+    
     args = parser.parse_args()
     
     # 根据命令执行不同功能
-    if args.command == "ocr":
+    if args.command == "worker":
+        # 常驻工作进程
+        print(f"工作进程已启动（PID {os.getpid()}），浏览器服务器: {args.server}", file=sys.stderr)
+        OCRWorker(args.server).serve()
+    
+    elif args.command == "ocr":
         # 图片OCR识别
         ocr = DoubaoOCR(args.server)
         result = ocr.recognize_image(args.image_path, args.question)
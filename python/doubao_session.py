@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+豆包多轮对话会话
+DoubaoOCR、DoubaoTextChat 每次调用都创建新页面并重新上传图片；DoubaoSession 持有一个页面，
+附带的图片或文件只在第一次提问时上传，之后的提问在同一对话中继续，服务器只提取最新一轮回复，
+每轮只需等待回复本身的时间。
+"""
+
+from doubao_browser_client import DoubaoBrowserClient
+from doubao_common import validate_file_path
+
+
+class DoubaoSession:
+    """
+    多轮对话会话，作为上下文管理器使用：
+
+        with DoubaoSession(attachment="image.png") as session:
+            session.ask("图里有什么内容？")
+            session.ask("图中有几个人？")
+    """
+
+    def __init__(self, server_url="http://localhost:3000", attachment=None, owner=None, lease=None):
+        """
+        初始化会话
+        :param server_url: 浏览器服务器地址，默认为 http://localhost:3000
+        :param attachment: 随第一次提问上传的图片或文件路径
+        :param owner: 页面所有者标识，服务器按所有者回收页面
+        :param lease: 页面租约（秒），两次提问间隔超过租约时页面可能被服务器回收
+        """
+        self.client = DoubaoBrowserClient(server_url)
+        self.attachment = validate_file_path(attachment) if attachment else None
+        self.owner = owner
+        self.lease = lease
+        self.page_id = None
+        self.turns = []
+        self._attachment_sent = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def open(self):
+        """
+        创建会话使用的页面
+        :return: 页面ID
+        :raises RuntimeError: 服务器未运行或创建页面失败
+        """
+        if self.page_id is not None:
+            return self.page_id
+        if not self.client.is_server_running():
+            raise RuntimeError("浏览器服务器未运行，请先启动服务器")
+        self.page_id = self.client.create_page(owner=self.owner, lease=self.lease)
+        if not self.page_id:
+            self.page_id = None
+            raise RuntimeError("创建页面失败")
+        return self.page_id
+
+    def ask(self, question, attachment=None):
+        """
+        在当前对话中提问
+        :param question: 提问内容
+        :param attachment: 本轮附带的图片或文件路径；不提供时，会话的附件在第一次提问时上传
+        :return: 结果字典，与 DoubaoBrowserClient.text_chat/ocr 相同，chatHistory 只包含本轮回复
+        :raises RuntimeError: 会话未打开
+        """
+        if not question:
+            raise ValueError("问题不能为空")
+        if self.page_id is None:
+            raise RuntimeError("会话未打开，请先调用 open() 或使用 with 语句")
+
+        if attachment:
+            attachment = validate_file_path(attachment)
+        elif self.attachment and not self._attachment_sent:
+            attachment = self.attachment
+
+        if attachment:
+            result = self.client.ocr(self.page_id, attachment, question, latest_only=True)
+            if result.get("success") and attachment == self.attachment:
+                self._attachment_sent = True
+        else:
+            result = self.client.text_chat(self.page_id, question, latest_only=True)
+
+        self.turns.append({"question": question, "attachment": attachment, "response": result.get("response")})
+        return result
+
+    def reset(self):
+        """
+        开始新对话，继续使用当前页面；会话的附件在下一次提问时重新上传
+        :return: 是否成功
+        """
+        if self.page_id is None:
+            return False
+        self._attachment_sent = False
+        self.turns = []
+        return self.client.reset_page(self.page_id)
+
+    def close(self):
+        """
+        关闭会话使用的页面
+        """
+        if self.page_id is not None:
+            self.client.close_page(self.page_id)
+            self.page_id = None
@@ -54,6 +54,35 @@ class DoubaoTextChat:
             print(f"调用服务器时发生错误: {e}")
             return None
     
+    def stream_message(self, message):
+        """
+        通过浏览器服务器发送纯文字消息，回复文本随生成逐段返回
+        :param message: 要发送的消息
+        :return: 回复文本片段的迭代器，所有片段拼接即为完整回复
+        :raises RuntimeError: 服务器未运行、创建页面失败或聊天失败
+        """
+        if not message:
+            raise ValueError("消息不能为空")
+        
+        if not self.client.is_server_running():
+            raise RuntimeError("浏览器服务器未运行，请先启动服务器")
+        
+        page_id = self.client.create_page()
+        if not page_id:
+            raise RuntimeError("创建页面失败")
+        
+        try:
+            for event in self.client.text_chat_stream(page_id, message):
+                if event.get("type") == "delta":
+                    yield event.get("text", "")
+                elif event.get("type") == "error":
+                    raise RuntimeError(f"聊天失败: {event.get('error')}")
+                elif event.get("type") == "done" and not event.get("success"):
+                    raise RuntimeError("聊天失败")
+        finally:
+            # 关闭页面（调用方提前停止迭代时也会关闭）
+            self.client.close_page(page_id)
+    
     def get_response(self, message, headless=True):
         """
         获取纯文字消息的回复
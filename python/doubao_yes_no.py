@@ -7,21 +7,108 @@
 2. 支持文件内容的是/否判断
 3. 支持图片内容的是/否判断
 4. 解析豆包的回答，仅输出是或否
+5. 大文件分块并发判断，按规则合并各块结论，结论确定后不再判断剩余的块
+6. 多次提问投票，分批并发提问，票数差距已无法被剩余提问改变时提前结束
 """
 
 import os
 import sys
+import uuid
+import threading
 import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from doubao_browser_client import DoubaoBrowserClient
 from doubao_common import validate_file_path
+from singleflight import default_group, file_digest
+
+# 分块判断时合并各块结论的规则
+COMBINE_RULES = ("any", "all", "majority")
+
+
+def iter_file_chunks(file_path, chunk_size=4000, encoding="utf-8"):
+    """
+    按块读取文本文件，不把整个文件读入内存
+    尽量在行边界处分块，超过 chunk_size 的单行被切成多块
+    :param file_path: 文件路径
+    :param chunk_size: 每块的最大字符数
+    :param encoding: 文件编码
+    :return: 文本块迭代器
+    """
+    buffer = []
+    size = 0
+    with open(file_path, "r", encoding=encoding) as f:
+        while True:
+            line = f.readline(chunk_size)
+            if not line:
+                break
+            if buffer and size + len(line) > chunk_size:
+                yield "".join(buffer)
+                buffer = []
+                size = 0
+            buffer.append(line)
+            size += len(line)
+    if buffer:
+        yield "".join(buffer)
+
+
+def combine_verdicts(verdicts, rule="any", total=None):
+    """
+    合并各块的结论
+    :param verdicts: 已完成的块的结论列表（yes/no，无法判断为None）
+    :param rule: any（任一块为yes即为yes）、all（所有块都为yes才为yes）、majority（超过半数的块的结论）
+    :param total: 总块数，None表示尚未读完文件；已完成的块数达到总块数时返回最终结论
+    :return: 结论已经确定时返回yes/no，尚不确定或无法判断时返回None
+    """
+    if rule not in COMBINE_RULES:
+        raise ValueError(f"不支持的合并规则: {rule}")
+    yes = verdicts.count("yes")
+    no = verdicts.count("no")
+    finished = total is not None and len(verdicts) >= total
+
+    if rule == "any":
+        if yes:
+            return "yes"
+        return "no" if finished and no == len(verdicts) else None
+    if rule == "all":
+        if no:
+            return "no"
+        return "yes" if finished and yes == len(verdicts) else None
+
+    # 剩余的块无论结论如何都无法改变多数时提前确定
+    if total is not None:
+        if yes * 2 > total:
+            return "yes"
+        if no * 2 > total:
+            return "no"
+    if finished and yes != no:
+        return "yes" if yes > no else "no"
+    return None
+
+
+def vote_outcome(yes, no, remaining):
+    """
+    判断投票结果是否已经确定
+    :param yes: yes的票数
+    :param no: no的票数
+    :param remaining: 剩余可用的提问次数
+    :return: 剩余提问全部投给落后一方也无法改变结果时返回yes/no，否则返回None
+    """
+    if yes > no + remaining:
+        return "yes"
+    if no > yes + remaining:
+        return "no"
+    return None
+
 
 class DoubaoYesNo:
-    def __init__(self, server_url="http://localhost:3000"):
+    def __init__(self, server_url="http://localhost:3000", coalesce=True):
         """
         初始化豆包是/否判断工具
         :param server_url: 浏览器服务器地址，默认为 http://localhost:3000
+        :param coalesce: 是否合并同时进行中的相同请求（问题和文件/图片内容都相同），合并后只执行一次
         """
         self.client = DoubaoBrowserClient(server_url)
+        self.single_flight = default_group if coalesce else None
         
     def read_file_content(self, file_path):
         """
@@ -75,30 +162,36 @@ class DoubaoYesNo:
         # 无法判断时返回None
         return None
     
-    def judge_text(self, question, debug=False):
+    def _ask(self, full_question, image_path=None, debug=False, client=None):
         """
-        判断纯文字问题
-        :param question: 问题
+        在新页面上提问并把回答解析为yes或no
+        :param full_question: 完整问题
+        :param image_path: 随问题上传的图片路径
         :param debug: 是否输出调试信息
-        :return: yes/no
+        :param client: 使用的客户端，默认为 self.client；judge_file_chunked 的每个工作线程传入自己的客户端
+        :return: yes/no，无法判断返回None
         """
-        # 构建完整问题，引导豆包仅回答yes或no
-        full_question = f"{question} Please answer with only 'yes' or 'no'."
-        
-        if debug:
-            print(f"向豆包提问: {full_question}")
+        client = client or self.client
         
         try:
+            if image_path:
+                # 验证并获取绝对路径
+                image_path = validate_file_path(image_path)
+            
             # 创建新页面
-            page_id = self.client.create_page()
+            page_id = client.create_page()
             if not page_id:
                 if debug:
                     print("创建页面失败")
                 return None
             
             try:
-                # 执行纯文本聊天
-                result = self.client.text_chat(page_id, full_question)
+                if image_path:
+                    # 执行OCR识别
+                    result = client.ocr(page_id, image_path, full_question)
+                else:
+                    # 执行纯文本聊天
+                    result = client.text_chat(page_id, full_question)
                 
                 if not result or not result.get("success"):
                     if debug:
@@ -152,13 +245,28 @@ class DoubaoYesNo:
                 return self.parse_yes_no(response, debug)
             finally:
                 # 关闭页面
-                self.client.close_page(page_id)
+                client.close_page(page_id)
                 
         except Exception as e:
             if debug:
                 print(f"判断失败: {str(e)}")
             return None
     
+    def judge_text(self, question, debug=False):
+        """
+        判断纯文字问题
+        :param question: 问题
+        :param debug: 是否输出调试信息
+        :return: yes/no
+        """
+        # 构建完整问题，引导豆包仅回答yes或no
+        full_question = f"{question} Please answer with only 'yes' or 'no'."
+        
+        if debug:
+            print(f"向豆包提问: {full_question}")
+        
+        return self._ask(full_question, debug=debug)
+    
     def judge_file(self, question, file_path, debug=False):
         """
         判断文件内容相关问题
@@ -179,76 +287,135 @@ class DoubaoYesNo:
         if debug:
             print(f"向豆包提问: {full_question}")
         
-        try:
-            # 创建新页面
-            page_id = self.client.create_page()
-            if not page_id:
-                if debug:
-                    print("创建页面失败")
-                return None
-            
-            try:
-                # 执行纯文本聊天
-                result = self.client.text_chat(page_id, full_question)
+        return self._ask(full_question, debug=debug)
+    
+    def judge_file_chunked(self, question, file_path, chunk_size=4000, rule="any", max_workers=4,
+                           chunk_timeout=120, debug=False):
+        """
+        分块判断大文件：逐块读取文件，每块在单独的页面上并发提问，按规则合并各块结论；
+        结论确定后不再提交剩余的块，并取消服务器上仍在处理的块
+        :param question: 问题
+        :param file_path: 文件路径
+        :param chunk_size: 每块的最大字符数
+        :param rule: 合并规则，见 combine_verdicts
+        :param max_workers: 同时判断的块数
+        :param chunk_timeout: 每块的超时时间（秒）
+        :param debug: 是否输出调试信息
+        :return: 字典 {"answer": yes/no/None, "rule", "chunks": 总块数（提前结束时为None）,
+                 "evaluated": 已得到结论的块数, "verdicts": 各块序号到结论的字典}
+        """
+        if rule not in COMBINE_RULES:
+            raise ValueError(f"不支持的合并规则: {rule}")
+        file_path = validate_file_path(file_path)
+        # 多数规则需要总块数才能提前确定结论，先数一遍块数（只读文件，不提问）
+        total = sum(1 for _ in iter_file_chunks(file_path, chunk_size)) if rule == "majority" else None
+        
+        # 每个工作线程使用自己的客户端（HTTP连接、耗时记录），取消按请求ID发送，用哪个客户端都可以
+        local = threading.local()
+        
+        def evaluate(index, chunk, request_id):
+            client = getattr(local, "client", None)
+            if client is None:
+                client = local.client = DoubaoBrowserClient(self.client.server_url)
+            full_question = (f"{question} 以下是文件的第{index + 1}部分内容：\n{chunk}\n"
+                             f"Please answer with only 'yes' or 'no'.")
+            with client.deadline(chunk_timeout, request_id=request_id):
+                return self._ask(full_question, debug=debug, client=client)
+        
+        chunks = enumerate(iter_file_chunks(file_path, chunk_size))
+        verdicts = {}
+        in_flight = {}
+        submitted = 0
+        exhausted = False
+        answer = None
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                # 保持最多 max_workers 个块在判断中，按需读取下一块
+                while not exhausted and len(in_flight) < max_workers:
+                    item = next(chunks, None)
+                    if item is None:
+                        exhausted = True
+                        total = submitted
+                        break
+                    request_id = uuid.uuid4().hex
+                    in_flight[executor.submit(evaluate, item[0], item[1], request_id)] = (item[0], request_id)
+                    submitted += 1
+                if not in_flight:
+                    break
                 
-                if not result or not result.get("success"):
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, _ = in_flight.pop(future)
+                    verdicts[index] = future.result()
                     if debug:
-                        print("获取回答失败")
-                    return None
-                
-                # 获取原始响应
-                response = result.get("response", "")
-                
-                # 处理response为null的情况，从chatHistory中提取回答
-                chat_history = result.get("chatHistory", [])
-                if response is None or response == "":
-                    # 遍历chatHistory，找到包含实际回答的AI消息
-                    for message in chat_history:
-                        if message.get("type") == "ai" and message.get("content"):
-                            content = message.get("content")
-                            # 跳过无意义内容
-                            if content in ["分享", "编辑分享"]:
-                                continue
-                            
-                            # 检查是否是重复的问题
-                            lower_content = content.lower()
-                            lower_question = full_question.lower()
-                            if lower_content.startswith(lower_question):
-                                continue
-                            
-                            # 检查是否包含实际回答（yes/no）
-                            if 'yes' in lower_content or 'no' in lower_content:
-                                response = content
-                                break
-                    
-                    # 如果没有找到包含yes/no的消息，尝试找到最长的AI回答
-                    if response is None or response == "":
-                        longest_ai_response = ""
-                        for message in chat_history:
-                            if message.get("type") == "ai" and message.get("content"):
-                                content = message.get("content")
-                                if content not in ["分享", "编辑分享"] and len(content) > len(longest_ai_response):
-                                    longest_ai_response = content
-                        
-                        if longest_ai_response:
-                            # 提取"分享"或"编辑分享"之前的内容
-                            if "编辑分享" in longest_ai_response:
-                                response = longest_ai_response.split("编辑分享")[0].strip()
-                            elif "分享" in longest_ai_response:
-                                response = longest_ai_response.split("分享")[0].strip()
-                            else:
-                                response = longest_ai_response
+                        print(f"第 {index + 1} 块: {verdicts[index]}")
                 
-                # 解析回答为yes或no
-                return self.parse_yes_no(response, debug)
-            finally:
-                # 关闭页面
-                self.client.close_page(page_id)
+                answer = combine_verdicts(list(verdicts.values()), rule, total)
+                if answer is not None:
+                    # 结论已确定，取消仍在处理的块，其结论不再计入
+                    for future, (_, request_id) in in_flight.items():
+                        if not future.cancel():
+                            self.client.cancel(request_id)
+                    break
+        
+        return {
+            "answer": answer,
+            "rule": rule,
+            "chunks": total,
+            "evaluated": len(verdicts),
+            "verdicts": verdicts
+        }
+    
+    def judge_vote(self, question, file_path=None, image_path=None, max_calls=5, debug=False):
+        """
+        多次独立提问并投票（每次使用新页面），分批并发提问：
+        第一批的次数刚好足以形成多数，之后每批只补充确定结果所需的最少次数，结果确定后立即停止
+        :param question: 问题
+        :param file_path: 文件路径
+        :param image_path: 图片路径
+        :param max_calls: 最多提问次数
+        :param debug: 是否输出调试信息
+        :return: 字典 {"answer": yes/no/None, "confidence": 多数一方占有效票的比例,
+                 "calls": 实际提问次数, "votes": {"yes", "no", "invalid"}}
+        """
+        if max_calls < 1:
+            raise ValueError("提问次数至少为1")
+        full_question = f"{question} Please answer with only 'yes' or 'no'."
+        if file_path:
+            file_content = self.read_file_content(file_path)
+            full_question = f"{question} 文件内容如下：\n{file_content}\nPlease answer with only 'yes' or 'no'."
+        
+        votes = {"yes": 0, "no": 0, "invalid": 0}
+        calls = 0
+        answer = None
+        wave = max_calls // 2 + 1
+        with ThreadPoolExecutor(max_workers=wave) as executor:
+            while calls < max_calls:
+                futures = [executor.submit(self._ask, full_question, image_path, debug) for _ in range(wave)]
+                calls += wave
+                for future in futures:
+                    votes[future.result() or "invalid"] += 1
+                if debug:
+                    print(f"已提问 {calls} 次，投票: {votes}")
                 
-        except Exception as e:
-            if debug:
-                print(f"判断失败: {str(e)}")
-            return None
+                remaining = max_calls - calls
+                answer = vote_outcome(votes["yes"], votes["no"], remaining)
+                if answer is not None:
+                    break
+                # 下一批假设全部投给领先一方，补充到恰好能确定结果的次数
+                leader, trailer = max(votes["yes"], votes["no"]), min(votes["yes"], votes["no"])
+                wave = min((trailer + remaining - leader) // 2 + 1, remaining)
+        
+        if answer is None and votes["yes"] != votes["no"]:
+            # 提问次数用完仍未确定（存在无效回答），取多数一方
+            answer = "yes" if votes["yes"] > votes["no"] else "no"
+        valid = votes["yes"] + votes["no"]
+        return {
+            "answer": answer,
+            "confidence": round(votes[answer] / valid, 3) if answer else 0.0,
+            "calls": calls,
+            "votes": votes
+        }
     
     def judge_image(self, question, image_path, debug=False):
         """
@@ -264,87 +431,19 @@ class DoubaoYesNo:
         if debug:
             print(f"向豆包提问: {full_question}")
         
-        try:
-            # 验证并获取绝对路径
-            image_path = validate_file_path(image_path)
-            
-            # 创建新页面
-            page_id = self.client.create_page()
-            if not page_id:
-                if debug:
-                    print("创建页面失败")
-                return None
-            
-            try:
-                # 执行OCR识别
-                result = self.client.ocr(page_id, image_path, full_question)
-                
-                if not result or not result.get("success"):
-                    if debug:
-                        print("获取回答失败")
-                    return None
-                
-                # 获取原始响应
-                response = result.get("response", "")
-                
-                # 处理response为null的情况，从chatHistory中提取回答
-                chat_history = result.get("chatHistory", [])
-                if response is None or response == "":
-                    # 遍历chatHistory，找到包含实际回答的AI消息
-                    for message in chat_history:
-                        if message.get("type") == "ai" and message.get("content"):
-                            content = message.get("content")
-                            # 跳过无意义内容
-                            if content in ["分享", "编辑分享"]:
-                                continue
-                            
-                            # 检查是否是重复的问题
-                            lower_content = content.lower()
-                            lower_question = full_question.lower()
-                            if lower_content.startswith(lower_question):
-                                continue
-                            
-                            # 检查是否包含实际回答（yes/no）
-                            if 'yes' in lower_content or 'no' in lower_content:
-                                response = content
-                                break
-                    
-                    # 如果没有找到包含yes/no的消息，尝试找到最长的AI回答
-                    if response is None or response == "":
-                        longest_ai_response = ""
-                        for message in chat_history:
-                            if message.get("type") == "ai" and message.get("content"):
-                                content = message.get("content")
-                                if content not in ["分享", "编辑分享"] and len(content) > len(longest_ai_response):
-                                    longest_ai_response = content
-                        
-                        if longest_ai_response:
-                            # 提取"分享"或"编辑分享"之前的内容
-                            if "编辑分享" in longest_ai_response:
-                                response = longest_ai_response.split("编辑分享")[0].strip()
-                            elif "分享" in longest_ai_response:
-                                response = longest_ai_response.split("分享")[0].strip()
-                            else:
-                                response = longest_ai_response
-                
-                # 解析回答为yes或no
-                return self.parse_yes_no(response, debug)
-            finally:
-                # 关闭页面
-                self.client.close_page(page_id)
-                
-        except Exception as e:
-            if debug:
-                print(f"判断失败: {str(e)}")
-            return None
+        return self._ask(full_question, image_path=image_path, debug=debug)
     
-    def judge(self, question=None, file_path=None, image_path=None, debug=False):
+    def judge(self, question=None, file_path=None, image_path=None, debug=False, chunk_size=None, rule="any",
+              votes=None):
         """
         统一的判断方法
         :param question: 问题
         :param file_path: 文件路径
         :param image_path: 图片路径
         :param debug: 是否输出调试信息
+        :param chunk_size: 提供时对文件分块判断（每块的最大字符数），见 judge_file_chunked
+        :param rule: 分块判断时的合并规则：any、all、majority
+        :param votes: 提供时多次提问投票（最多提问次数），见 judge_vote
         :return: yes/no
         """
         # 参数验证
@@ -354,13 +453,32 @@ class DoubaoYesNo:
         if file_path and image_path:
             raise ValueError("文件和图片不能同时提供")
         
+        if chunk_size and votes:
+            raise ValueError("分块判断和投票不能同时使用")
+        
+        if self.single_flight is None:
+            return self._judge(question, file_path, image_path, debug, chunk_size, rule, votes)
+        path = file_path or image_path
+        digest = file_digest(validate_file_path(path)) if path else None
+        key = ("yesno", self.client.server_url, "file" if file_path else "image" if image_path else "text",
+               digest, question, chunk_size if file_path else None, rule if file_path and chunk_size else None, votes)
+        return self.single_flight.do(key, self._judge, question, file_path, image_path, debug, chunk_size, rule,
+                                     votes)
+    
+    def _judge(self, question, file_path, image_path, debug, chunk_size=None, rule="any", votes=None):
         # 检查服务器状态
         if not self.client.is_server_running():
             print("浏览器服务器未运行，请先启动服务器")
             print("启动命令: node browser_server.js")
             return None
         
-        if file_path:
+        if votes:
+            # 多次提问投票
+            return self.judge_vote(question, file_path, image_path, votes, debug)["answer"]
+        elif file_path and chunk_size:
+            # 大文件分块判断
+            return self.judge_file_chunked(question, file_path, chunk_size, rule, debug=debug)["answer"]
+        elif file_path:
             # 文件判断
             return self.judge_file(question, file_path, debug)
         elif image_path:
@@ -380,6 +498,10 @@ def main():
     parser.add_argument("--image", help="图片路径")
     parser.add_argument("--server", default="http://localhost:3000", help="浏览器服务器地址")
     parser.add_argument("--debug", action="store_true", help="输出调试信息")
+    parser.add_argument("--chunk-size", type=int, help="对文件分块判断，每块的最大字符数")
+    parser.add_argument("--rule", choices=COMBINE_RULES, default="any",
+                        help="分块判断时合并各块结论的规则：any 任一块为yes、all 所有块为yes、majority 多数块")
+    parser.add_argument("--votes", type=int, help="多次提问投票的最多提问次数，结果确定后提前结束")
     
     args = parser.parse_args()
     
@@ -397,7 +519,10 @@ def main():
             question=args.question,
             file_path=args.file,
             image_path=args.image,
-            debug=args.debug
+            debug=args.debug,
+            chunk_size=args.chunk_size,
+            rule=args.rule,
+            votes=args.votes
         )
         
         # 输出结果
@@ -0,0 +1,689 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+豆包浏览器服务器本地替身
+实现与 js/browser_server.js 相同的HTTP接口，不启动浏览器、不访问豆包，
+用于离线测试和基准测试Python客户端层的开销
+功能：
+1. 按接口配置延迟分布（固定、均匀、正态、对数正态、指数）
+2. 按比例注入失败和验证码
+3. 返回预置的 chatHistory 数据
+4. 与真实服务器一致返回各阶段耗时（timings 字段和 Server-Timing 头）
+5. 模拟全局并发上限和排队上限，队列满时返回429
+6. 与真实服务器一致支持请求截止时间（X-Request-Timeout）和取消（/cancel），中止的请求返回504/499
+"""
+
+import sys
+import json
+import math
+import time
+import random
+import socket
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# 默认的AI回复
+DEFAULT_RESPONSE = "这是本地替身服务器返回的回复。"
+
+# 响应中返回各阶段耗时的接口
+TIMED_ROUTES = (
+    "/createPage", "/sendMessage", "/uploadFile", "/sendMessageWithFile",
+    "/getAIResponse", "/extractChatHistory", "/resetConversation", "/ocr", "/textChat",
+    "/textChatStream"
+)
+
+# 流式聊天每个增量片段的字符数
+STREAM_CHUNK_CHARS = 4
+
+# 受并发上限和排队限制的接口，与真实服务器的请求调度器一致
+SCHEDULED_ROUTES = TIMED_ROUTES + ("/closePage",)
+
+
+class _RequestState:
+    """
+    单次请求的截止时间和取消状态
+    """
+
+    def __init__(self, request_id=None, timeout_ms=None):
+        self.request_id = request_id
+        self.deadline = time.monotonic() + timeout_ms / 1000 if timeout_ms else None
+        self.cancelled = threading.Event()
+
+    def remaining(self):
+        """
+        :return: 剩余秒数，未设置截止时间时返回None
+        """
+        return None if self.deadline is None else max(self.deadline - time.monotonic(), 0.0)
+
+    def abort_reason(self):
+        """
+        :return: 'cancelled'、'deadline'，未中止时返回None
+        """
+        if self.cancelled.is_set():
+            return "cancelled"
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            return "deadline"
+        return None
+
+
+def _now_iso():
+    """
+    获取与Node.js toISOString一致格式的当前时间
+    :return: ISO格式时间字符串
+    """
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
+
+
+class LatencyModel:
+    """
+    延迟分布模型
+    规格字符串格式（单位毫秒）：
+    - fixed:50
+    - uniform:20,80
+    - normal:100,20        （均值, 标准差）
+    - lognormal:100,0.5    （中位数, 形状参数sigma）
+    - exp:100              （均值）
+    """
+
+    def __init__(self, spec="fixed:0"):
+        """
+        初始化延迟分布模型
+        :param spec: 延迟分布规格字符串
+        """
+        self.spec = spec
+        kind, _, params = spec.partition(":")
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",")] if params else []
+
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"延迟分布格式错误: {spec}")
+
+    def sample(self, rng):
+        """
+        采样一次延迟
+        :param rng: random.Random 实例
+        :return: 延迟秒数
+        """
+        if self.kind == "fixed":
+            value = self.params[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(*self.params)
+        elif self.kind == "normal":
+            value = rng.gauss(*self.params)
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(max(self.params[0], 1e-9)), self.params[1])
+        else:
+            value = rng.expovariate(1.0 / self.params[0]) if self.params[0] > 0 else 0.0
+        return max(0.0, value) / 1000.0
+
+
+class FakeBrowserServer:
+    """
+    豆包浏览器服务器本地替身
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, default_latency="fixed:0",
+                 failure_rate=0.0, captcha_rate=0.0, chat_history=None, response=DEFAULT_RESPONSE,
+                 seed=None, max_concurrency=None, max_queue=64, retry_after=1.0, yes_no_answer=None):
+        """
+        初始化本地替身服务器
+        :param host: 监听地址
+        :param port: 监听端口，0表示自动分配
+        :param latency: 接口路径到延迟分布规格的字典，如 {"/ocr": "lognormal:3000,0.4"}
+        :param default_latency: 未单独配置的接口使用的延迟分布规格
+        :param failure_rate: 注入HTTP 500失败的比例
+        :param captcha_rate: 注入验证码的比例（仅对话类接口）
+        :param chat_history: 预置的聊天记录列表，默认根据提问生成
+        :param response: 预置的AI回复文本，或按提问生成回复的函数 response(提问) -> 回复文本
+        :param seed: 随机种子，便于复现
+        :param max_concurrency: 同时处理的最大请求数，None表示不限制
+        :param max_queue: 最大排队请求数，超过时返回429
+        :param retry_after: 429响应中提示的重试等待秒数
+        :param yes_no_answer: 是/否类提问的回答函数 yes_no_answer(提问) -> 回复文本，默认总是回答 yes
+        """
+        self.host = host
+        self.port = port
+        self.latency = {path: LatencyModel(spec) for path, spec in (latency or {}).items()}
+        self.default_latency = LatencyModel(default_latency)
+        self.failure_rate = failure_rate
+        self.captcha_rate = captcha_rate
+        self.chat_history = chat_history
+        self.response = response
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self.yes_no_answer = yes_no_answer
+        # 为False时模拟聊天接口响应未捕获到回复，与真实服务器一样回退到从页面提取
+        self.network_capture = True
+        self.slots = threading.Semaphore(max_concurrency) if max_concurrency else None
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self.aborted = {"deadline": 0, "cancelled": 0}
+        self.active_requests = {}
+        self.cancelled_requests = set()
+
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.pages = set()
+        self.page_owners = {}
+        self.page_histories = {}
+        self.page_counter = 0
+        self.request_counts = {}
+
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        服务器地址
+        """
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        """
+        在后台线程中启动服务器
+        :return: 服务器地址
+        """
+        server = self
+
+        class Handler(FakeBrowserRequestHandler):
+            fake_server = server
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        """
+        停止服务器
+        """
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _random(self):
+        with self.lock:
+            return self.rng.random()
+
+    def _delay(self, pathname, state=None):
+        """
+        按接口的延迟分布休眠，请求被取消或到达截止时间时提前结束
+        :param pathname: 接口路径
+        :param state: 请求状态（_RequestState）
+        :return: 休眠时间（秒）
+        """
+        model = self.latency.get(pathname, self.default_latency)
+        with self.lock:
+            delay = model.sample(self.rng)
+        if delay > 0:
+            if state is None:
+                time.sleep(delay)
+            else:
+                remaining = state.remaining()
+                state.cancelled.wait(delay if remaining is None else min(delay, remaining))
+        return delay
+
+    def _aborted_response(self, reason):
+        with self.lock:
+            self.aborted[reason] += 1
+        if reason == "deadline":
+            return 504, {"success": False, "error": "请求已超过截止时间", "aborted": reason}
+        return 499, {"success": False, "error": "请求已被取消", "aborted": reason}
+
+    def cancel(self, request_id):
+        """
+        取消指定请求ID的请求
+        :param request_id: 请求ID
+        :return: 被取消的请求数
+        """
+        with self.lock:
+            self.cancelled_requests.add(request_id)
+            states = list(self.active_requests.get(request_id, ()))
+        for state in states:
+            state.cancelled.set()
+        return len(states)
+
+    def _require_page(self, page_id):
+        with self.lock:
+            if page_id not in self.pages:
+                raise KeyError(f"页面 {page_id} 不存在")
+
+    def _build_history(self, message, page_id=None, since=0, latest_only=False, reply=None):
+        """
+        生成聊天记录：预置的记录，或页面上累积的多轮对话
+        :param message: 本轮提问，None表示只读取不追加
+        :param page_id: 页面ID，提供时在该页面的记录上追加本轮对话
+        :param since: 只返回该序号之后的消息
+        :param latest_only: 只返回最新一轮回复
+        :param reply: 本轮的回复，默认根据提问生成
+        :return: 聊天记录列表
+        """
+        if self.chat_history is not None:
+            return [dict(item, timestamp=_now_iso()) for item in self.chat_history]
+        turn = [] if message is None else [
+            {"type": "user", "content": message, "timestamp": _now_iso()},
+            {"type": "ai", "content": f"{reply or self._reply_for(message)}编辑分享", "timestamp": _now_iso()}
+        ]
+        if page_id is None:
+            return turn
+        with self.lock:
+            history = self.page_histories.setdefault(page_id, [])
+            history.extend(turn)
+            history = list(history)
+        if latest_only:
+            user_indexes = [i for i, item in enumerate(history) if item["type"] == "user"]
+            since = max(since, user_indexes[-1] + 1 if user_indexes else 0)
+        return history[since:]
+
+    def _reply_for(self, message):
+        # 是/否类提问返回可被解析的回答，便于测试是/否判断包装器
+        if message and "answer with only 'yes' or 'no'" in message:
+            return self.yes_no_answer(message) if self.yes_no_answer else "yes"
+        return self.response(message) if callable(self.response) else self.response
+
+    def _dom_reply(self, page_id):
+        """
+        与真实服务器的页面提取回退一致：只看最新一轮回复，取最长的一条并去掉"编辑"之后的内容
+        :param page_id: 页面ID
+        :return: 回复文本，没有回复时返回None
+        """
+        history = self._build_history(None, page_id, latest_only=True)
+        replies = [item["content"] for item in history if item["type"] == "ai"]
+        return max(replies, key=len).split("编辑")[0].strip() if replies else None
+
+    def _chat(self, message, page_id=None, latest_only=False):
+        """
+        模拟一次对话
+        :param message: 提问内容
+        :param page_id: 页面ID，同一页面上的多次对话累积在聊天记录中
+        :param latest_only: chatHistory 只包含最新一轮回复
+        :return: 与 /textChat、/ocr 相同结构的响应字典
+        """
+        if self._random() < self.captcha_rate:
+            return {
+                "success": True,
+                "message": message,
+                "response": "[CAPTCHA_DETECTED]",
+                "responseSource": None,
+                "chatHistory": [{
+                    "type": "error",
+                    "content": "检测到验证码，请手动处理后重试",
+                    "timestamp": _now_iso()
+                }],
+                "timestamp": _now_iso()
+            }
+
+        reply = self._reply_for(message)
+        chat_history = self._build_history(message, page_id, latest_only=latest_only, reply=reply)
+        with self.lock:
+            history_index = len(self.page_histories.get(page_id, ())) if page_id is not None else None
+        source = "network"
+        if not self.network_capture and page_id is not None:
+            reply, source = self._dom_reply(page_id), "dom"
+        return {
+            "success": True,
+            "message": message,
+            "response": reply,
+            "responseSource": source,
+            "chatHistory": chat_history,
+            "historyIndex": history_index,
+            "timestamp": _now_iso()
+        }
+
+    def handle(self, method, pathname, query, body, headers=None):
+        """
+        处理一次请求
+        :param method: 请求方法
+        :param pathname: 接口路径
+        :param query: GET查询参数字典
+        :param body: POST请求体字典
+        :param headers: 请求头字典，X-Request-Id 和 X-Request-Timeout 用于取消和截止时间
+        :return: (状态码, 响应字典)
+        """
+        headers = headers or {}
+        with self.lock:
+            self.request_counts[pathname] = self.request_counts.get(pathname, 0) + 1
+
+        try:
+            timeout_ms = int(headers.get("X-Request-Timeout") or 0)
+        except ValueError:
+            timeout_ms = 0
+        state = _RequestState(headers.get("X-Request-Id"), timeout_ms)
+        if state.request_id:
+            with self.lock:
+                if state.request_id in self.cancelled_requests:
+                    state.cancelled.set()
+                self.active_requests.setdefault(state.request_id, []).append(state)
+        try:
+            return self._handle_scheduled(method, pathname, query, body, state)
+        finally:
+            if state.request_id:
+                with self.lock:
+                    states = self.active_requests.get(state.request_id, [])
+                    states.remove(state)
+                    if not states:
+                        self.active_requests.pop(state.request_id, None)
+
+    def _handle_scheduled(self, method, pathname, query, body, state):
+        if self.slots is None or pathname not in SCHEDULED_ROUTES:
+            return self._handle_admitted(method, pathname, query, body, state)
+
+        with self.lock:
+            if self.active >= self.max_concurrency and self.queued >= self.max_queue:
+                self.rejected += 1
+                return 429, {
+                    "success": False,
+                    "error": "请求队列已满，请稍后重试",
+                    "queueDepth": self.queued,
+                    "retryAfter": self.retry_after
+                }
+            self.queued += 1
+        self.slots.acquire()
+        with self.lock:
+            self.queued -= 1
+            self.active += 1
+        try:
+            return self._handle_admitted(method, pathname, query, body, state)
+        finally:
+            with self.lock:
+                self.active -= 1
+            self.slots.release()
+
+    def _handle_admitted(self, method, pathname, query, body, state):
+        started = time.perf_counter()
+        aborted = state.abort_reason() if pathname in SCHEDULED_ROUTES else None
+        delay = 0.0
+        if not aborted:
+            delay = self._delay(pathname, state)
+            aborted = state.abort_reason() if pathname in SCHEDULED_ROUTES else None
+
+        if aborted:
+            status, data = self._aborted_response(aborted)
+        elif pathname != "/status" and self._random() < self.failure_rate:
+            status, data = 500, {"success": False, "error": "注入的失败"}
+        else:
+            try:
+                if method == "GET":
+                    status, data = self._handle_get(pathname, query)
+                else:
+                    status, data = self._handle_post(pathname, body)
+            except KeyError as e:
+                status, data = 500, {"success": False, "error": str(e.args[0])}
+
+        # 与真实服务器一致，在涉及页面操作的响应中返回各阶段耗时（毫秒）
+        if pathname in TIMED_ROUTES:
+            data["timings"] = {
+                "latency": round(delay * 1000, 2),
+                "total": round((time.perf_counter() - started) * 1000, 2)
+            }
+        return status, data
+
+    def _handle_get(self, pathname, query):
+        if pathname == "/status":
+            with self.lock:
+                pages = sorted(self.pages)
+                page_details = [{"pageId": page_id, "owner": self.page_owners.get(page_id)}
+                                for page_id in pages]
+            return 200, {
+                "success": True,
+                "running": True,
+                "browserOpen": True,
+                "pageCount": len(pages),
+                "pages": pages,
+                "pageDetails": page_details
+            }
+
+        if pathname == "/createPage":
+            with self.lock:
+                self.page_counter += 1
+                page_id = self.page_counter
+                self.pages.add(page_id)
+                self.page_owners[page_id] = query.get("owner", [None])[0]
+            return 200, {"success": True, "pageId": page_id}
+
+        if pathname == "/cancel":
+            request_id = query.get("requestId", [None])[0]
+            if not request_id:
+                return 400, {"success": False, "error": "缺少 requestId 参数"}
+            return 200, {"success": True, "cancelled": self.cancel(request_id)}
+
+        if pathname == "/heartbeat":
+            page_id = int(query.get("pageId", ["0"])[0])
+            owner = query.get("owner", [None])[0]
+            with self.lock:
+                known_owner = self.page_owners.get(page_id)
+                alive = page_id in self.pages and not (owner and known_owner and owner != known_owner)
+            return 200, {"success": alive}
+
+        if pathname == "/closePage":
+            page_id = int(query.get("pageId", ["0"])[0])
+            with self.lock:
+                closed = page_id in self.pages
+                self.pages.discard(page_id)
+                self.page_owners.pop(page_id, None)
+                self.page_histories.pop(page_id, None)
+            return 200, {"success": closed}
+
+        if pathname == "/closeAllPages":
+            with self.lock:
+                self.pages.clear()
+                self.page_owners.clear()
+                self.page_histories.clear()
+                self.page_counter = 0
+            return 200, {"success": True}
+
+        return 404, {"success": False, "error": "Not Found"}
+
+    def _handle_post(self, pathname, body):
+        page_id = body.get("pageId")
+
+        if pathname in ("/sendMessage", "/uploadFile", "/sendMessageWithFile"):
+            self._require_page(page_id)
+            return 200, {"success": True}
+
+        if pathname == "/resetConversation":
+            self._require_page(page_id)
+            with self.lock:
+                self.page_histories.pop(page_id, None)
+            return 200, {"success": True, "method": "newChat"}
+
+        if pathname == "/getAIResponse":
+            self._require_page(page_id)
+            return 200, {"success": True, "response": self.response, "responseSource": "network"}
+
+        if pathname == "/extractChatHistory":
+            self._require_page(page_id)
+            history = self._build_history(None, page_id, body.get("since") or 0, bool(body.get("latestOnly")))
+            with self.lock:
+                history_index = len(self.page_histories.get(page_id, ()))
+            return 200, {"success": True, "chatHistory": history, "historyIndex": history_index}
+
+        if pathname == "/ocr":
+            self._require_page(page_id)
+            return 200, self._chat(body.get("question"), page_id, bool(body.get("latestOnly")))
+
+        if pathname in ("/textChat", "/textChatStream"):
+            self._require_page(page_id)
+            return 200, self._chat(body.get("message"), page_id, bool(body.get("latestOnly")))
+
+        return 404, {"success": False, "error": "Not Found"}
+
+
+class FakeBrowserRequestHandler(BaseHTTPRequestHandler):
+    """
+    本地替身服务器的HTTP请求处理器
+    """
+
+    fake_server = None
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # 与Node.js的http服务器一致关闭Nagle算法，避免响应头和响应体分包导致的40ms延迟确认
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        # 基准测试时不输出访问日志
+        pass
+
+    def _send_json(self, status, data):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if "timings" in data:
+            self.send_header("Server-Timing", ", ".join(
+                f"{name};dur={ms}" for name, ms in data["timings"].items()))
+        if status == 429:
+            self.send_header("Retry-After", str(max(1, math.ceil(data["retryAfter"]))))
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_stream(self, data):
+        """
+        以NDJSON格式分段写出流式聊天响应，与真实服务器的 /textChatStream 一致
+        :param data: 完整的聊天响应字典
+        """
+        response = data["response"]
+        events = []
+        if response != "[CAPTCHA_DETECTED]":
+            events = [{"type": "delta", "text": response[i:i + STREAM_CHUNK_CHARS]}
+                      for i in range(0, len(response), STREAM_CHUNK_CHARS)]
+        events.append({
+            "type": "done",
+            "success": data["success"],
+            "message": data["message"],
+            "response": response,
+            "responseSource": data["responseSource"],
+            "timestamp": data["timestamp"],
+            "timings": data.get("timings")
+        })
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        for event in events:
+            line = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+            self.wfile.flush()
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        status, data = self.fake_server.handle("GET", parsed.path, parse_qs(parsed.query), {}, self.headers)
+        self._send_json(status, data)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"success": False, "error": "Invalid JSON"})
+            return
+        status, data = self.fake_server.handle("POST", parsed.path, {}, body, self.headers)
+        if parsed.path == "/textChatStream" and status == 200:
+            self._send_stream(data)
+        else:
+            self._send_json(status, data)
+
+    def do_OPTIONS(self):
+        self.send_response(200)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, X-Request-Id, X-Request-Timeout")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+def parse_latency_args(values):
+    """
+    解析命令行中的接口延迟配置
+    :param values: 形如 "/ocr=lognormal:3000,0.4" 的字符串列表
+    :return: 接口路径到延迟分布规格的字典
+    """
+    latency = {}
+    for value in values or []:
+        path, _, spec = value.partition("=")
+        if not spec:
+            raise ValueError(f"接口延迟格式错误: {value}，应为 路径=分布")
+        LatencyModel(spec)
+        latency[path if path.startswith("/") else f"/{path}"] = spec
+    return latency
+
+
+def main():
+    """
+    主函数，用于命令行启动本地替身服务器
+    """
+    parser = argparse.ArgumentParser(description="豆包浏览器服务器本地替身")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=3000, help="监听端口")
+    parser.add_argument("--latency", action="append", help="接口延迟分布，如 /ocr=lognormal:3000,0.4，可多次指定")
+    parser.add_argument("--default-latency", default="fixed:0", help="默认延迟分布，如 uniform:20,80（毫秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="注入HTTP 500失败的比例")
+    parser.add_argument("--captcha-rate", type=float, default=0.0, help="注入验证码的比例")
+    parser.add_argument("--history-file", help="预置chatHistory的JSON文件")
+    parser.add_argument("--response", default=DEFAULT_RESPONSE, help="预置的AI回复文本")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    parser.add_argument("--max-concurrency", type=int, help="同时处理的最大请求数，默认不限制")
+    parser.add_argument("--max-queue", type=int, default=64, help="最大排队请求数，超过时返回429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429响应提示的重试等待秒数")
+
+    args = parser.parse_args()
+
+    chat_history = None
+    if args.history_file:
+        with open(args.history_file, "r", encoding="utf-8") as f:
+            chat_history = json.load(f)
+
+    server = FakeBrowserServer(
+        host=args.host,
+        port=args.port,
+        latency=parse_latency_args(args.latency),
+        default_latency=args.default_latency,
+        failure_rate=args.failure_rate,
+        captcha_rate=args.captcha_rate,
+        chat_history=chat_history,
+        response=args.response,
+        seed=args.seed,
+        max_concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+        retry_after=args.retry_after
+    )
+    server.start()
+    print(f"豆包浏览器服务器本地替身已启动: {server.url}")
+    print("按 Ctrl+C 停止服务")
+
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+        print("\n服务已停止")
+        sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
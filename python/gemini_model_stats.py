@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gemini 模型实时统计
+按任务类型记录每个模型的延迟（指数加权移动平均）、错误率和最近一次配额超限的时间，
+保存到本地文件，下次运行继续使用。选择模型时取预期完成时间最短的可用模型，
+并以一定概率尝试其他模型，使统计数据跟上模型速度的变化。
+"""
+
+import json
+import os
+import random
+import threading
+import time
+
+DEFAULT_STATS_FILE = os.path.join(os.path.dirname(__file__), "gemini_model_stats.json")
+
+# 错误率上限，避免一直失败的模型预期时间变成无穷大后再也没有机会恢复
+MAX_ERROR_RATE = 0.95
+
+
+class ModelStats:
+    """
+    模型延迟、错误率统计与选择
+    """
+
+    def __init__(self, path=DEFAULT_STATS_FILE, alpha=0.3, explore=0.1, prior_latency=10.0,
+                 cooldown=60, rng=None):
+        """
+        :param path: 统计文件路径，None表示只在内存中统计
+        :param alpha: 移动平均的权重，越大越偏重最近的请求
+        :param explore: 每次选择时尝试非最优模型的概率
+        :param prior_latency: 没有统计数据的模型的假定延迟（秒）
+        :param cooldown: 配额超限后暂停使用该模型的秒数
+        :param rng: 随机数生成器，默认为 random 模块
+        """
+        self.path = path
+        self.alpha = alpha
+        self.explore = explore
+        self.prior_latency = prior_latency
+        self.cooldown = cooldown
+        self.rng = rng or random
+        self.lock = threading.Lock()
+        self.data = self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, json.JSONDecodeError):
+            print(f"警告: {self.path} 文件格式错误，将重新统计")
+            return {}
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"警告: 无法保存模型统计到 {self.path}: {e}")
+
+    def record(self, model, task_type, latency=None, success=True, rate_limited=False):
+        """
+        记录一次请求的结果
+        :param model: 模型名称
+        :param task_type: 任务类型，如 text_only、image_supported、document_supported
+        :param latency: 请求耗时（秒），只有成功的请求计入延迟
+        :param success: 是否成功
+        :param rate_limited: 是否因配额超限失败，超限后在 cooldown 秒内不再选择该模型
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.data.setdefault(task_type, {}).setdefault(model, {
+                "latency": None, "error_rate": 0.0, "requests": 0, "errors": 0,
+            })
+            entry["requests"] += 1
+            if success:
+                if latency is not None:
+                    previous = entry["latency"]
+                    entry["latency"] = latency if previous is None else \
+                        previous + self.alpha * (latency - previous)
+            else:
+                entry["errors"] += 1
+            entry["error_rate"] += self.alpha * ((0.0 if success else 1.0) - entry["error_rate"])
+            if rate_limited:
+                entry["cooldown_until"] = now + self.cooldown
+            entry["updated"] = now
+            self._save()
+
+    def expected_time(self, model, task_type):
+        """
+        预期完成时间：平均延迟除以成功率（失败后重试的次数服从几何分布）
+        :return: 秒
+        """
+        with self.lock:
+            entry = self.data.get(task_type, {}).get(model)
+        if not entry:
+            return self.prior_latency
+        latency = entry["latency"] if entry["latency"] is not None else self.prior_latency
+        return latency / (1.0 - min(entry["error_rate"], MAX_ERROR_RATE))
+
+    def cooling_down(self, model, task_type):
+        """
+        :return: 模型是否还在配额超限后的暂停期内
+        """
+        with self.lock:
+            entry = self.data.get(task_type, {}).get(model)
+        return bool(entry) and entry.get("cooldown_until", 0) > time.time()
+
+    def choose(self, candidates, task_type, available=None):
+        """
+        从候选模型中选择预期完成时间最短的模型，预期时间相同时按候选顺序；
+        以 explore 的概率随机选择另一个可用模型
+        :param candidates: 候选模型列表（按静态优先级排序）
+        :param task_type: 任务类型
+        :param available: 判断模型是否还有配额的函数，None表示都可用
+        :return: 模型名称，没有可用模型时返回None
+        """
+        usable = [m for m in candidates
+                  if not self.cooling_down(m, task_type) and (available is None or available(m))]
+        if not usable:
+            return None
+        best = min(usable, key=lambda m: self.expected_time(m, task_type))
+        others = [m for m in usable if m != best]
+        if others and self.rng.random() < self.explore:
+            return self.rng.choice(others)
+        return best
+
+    def snapshot(self, task_type=None):
+        """
+        :param task_type: 只返回该任务类型的统计，None表示全部
+        :return: 统计数据的副本
+        """
+        with self.lock:
+            data = json.loads(json.dumps(self.data))
+        return data.get(task_type, {}) if task_type else data
+
+
+_default_stats = None
+_default_lock = threading.Lock()
+
+
+def default_stats():
+    """
+    进程内共享的统计实例，多个 GeminiOCR 实例写同一个文件时不会互相覆盖
+    """
+    global _default_stats
+    with _default_lock:
+        if _default_stats is None:
+            _default_stats = ModelStats()
+        return _default_stats
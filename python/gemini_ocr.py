@@ -10,16 +10,32 @@ import argparse
 import json
 import datetime
 import random
+import time
 import google.genai as genai
 from gemini_config import GEMINI_API_KEYS
+from singleflight import default_group, file_digest
+from gemini_model_stats import default_stats
 
 class GeminiOCR:
-    def __init__(self):
+    def __init__(self, key_index=None, coalesce=True, model_stats=None, model=None):
         """
         初始化Gemini OCR识别类
+        :param key_index: 使用的API密钥序号（按密钥数取模），None表示随机选择；
+                          多个实例依次传入递增的序号即可把请求轮流分摊到各个密钥
+        :param coalesce: 是否合并同时进行中的相同请求（内容和问题都相同），合并后只调用一次API
+        :param model_stats: 模型延迟和错误率统计（gemini_model_stats.ModelStats），默认使用进程内共享的实例
+        :param model: 固定使用的模型，配额超限时不切换其他模型；None表示自动选择
         """
-        # 随机选择一个API密钥
-        self.current_key_index = random.randint(0, len(GEMINI_API_KEYS) - 1)
+        self.single_flight = default_group if coalesce else None
+        self.model_stats = model_stats or default_stats()
+        self.pinned_model = model
+        # 最近一次请求失败的错误信息，方法返回None时调用方可据此判断失败原因（如配额超限）
+        self.last_error = None
+        
+        if key_index is None:
+            # 随机选择一个API密钥
+            key_index = random.randint(0, len(GEMINI_API_KEYS) - 1)
+        self.current_key_index = key_index % len(GEMINI_API_KEYS)
         self.api_key = GEMINI_API_KEYS[self.current_key_index]
         
         # 创建客户端实例
@@ -125,12 +141,49 @@ class GeminiOCR:
         self.model_name = self.select_best_model(task_type="text_only")
         print(f"使用模型: {self.model_name}")
     
+    def _coalesce(self, key, fn, *args):
+        """
+        合并同时进行中的相同请求
+        """
+        if self.single_flight is None:
+            return fn(*args)
+        return self.single_flight.do(key, fn, *args)
+    
+    def _generate(self, task_type, contents):
+        """
+        调用Gemini API，并把耗时和结果记入模型统计
+        :param task_type: 任务类型
+        :param contents: 请求内容
+        :return: API响应
+        """
+        started = time.monotonic()
+        try:
+            response = self.client.models.generate_content(
+                model=self.model_name,
+                contents=contents
+            )
+        except Exception as e:
+            self._record_failure(task_type, str(e))
+            raise
+        self.model_stats.record(self.model_name, task_type, time.monotonic() - started)
+        return response
+    
+    def _record_failure(self, task_type, error_msg):
+        """
+        记录一次失败的请求，配额超限的模型暂停使用一段时间
+        """
+        rate_limited = "quota exceeded" in error_msg.lower() or "429" in error_msg
+        self.model_stats.record(self.model_name, task_type, success=False, rate_limited=rate_limited)
+    
     def ask_question(self, question):
         """
         直接向Gemini提问
         :param question: 提问内容
         :return: 提问结果对象
         """
+        return self._coalesce(("gemini-ask", self.pinned_model, question), self._ask_question, question)
+    
+    def _ask_question(self, question):
         # 选择适合文本提问的模型
         self.model_name = self.select_best_model(task_type="text_only")
         print(f"开始提问: {question}")
@@ -146,10 +199,7 @@ class GeminiOCR:
                 contents = [question]
                 
                 # 调用Gemini API
-                response = self.client.models.generate_content(
-                    model=self.model_name,
-                    contents=contents
-                )
+                response = self._generate("text_only", contents)
                 
                 # 估算使用的令牌数（简单估算）
                 tokens_used = len(response.text) * 1.5  # 粗略估算：每个汉字约1.5个令牌
@@ -173,6 +223,7 @@ class GeminiOCR:
                 
             except Exception as e:
                 error_msg = str(e)
+                self.last_error = error_msg
                 print(f"调用Gemini API时发生错误: {error_msg}")
                 
                 # 检查是否是配额超限错误
@@ -206,6 +257,70 @@ class GeminiOCR:
         print(f"尝试了 {current_attempt} 次后仍无法完成提问")
         return None
     
+    def ask_question_stream(self, question):
+        """
+        直接向Gemini提问，回复文本随生成逐段返回
+        收到第一段回复前遇到配额超限时切换API密钥和模型重试，之后的错误直接抛出
+        :param question: 提问内容
+        :return: 回复文本片段的迭代器
+        :raises RuntimeError: 多次尝试后仍无法完成提问
+        """
+        self.model_name = self.select_best_model(task_type="text_only")
+        print(f"开始流式提问: {question}")
+        print(f"当前使用模型: {self.model_name}")
+        
+        max_attempts = 3
+        current_attempt = 0
+        
+        while current_attempt < max_attempts:
+            received = 0
+            started = time.monotonic()
+            try:
+                for chunk in self.client.models.generate_content_stream(
+                    model=self.model_name,
+                    contents=[question]
+                ):
+                    text = chunk.text or ""
+                    if text:
+                        received += len(text)
+                        yield text
+                
+                self.model_stats.record(self.model_name, "text_only", time.monotonic() - started)
+                tokens_used = int(received * 1.5)  # 粗略估算：每个汉字约1.5个令牌
+                self.update_usage(self.model_name, tokens_used)
+                print(f"使用量更新: {self.model_name} - RPM: +1, TPM: +{tokens_used}")
+                return
+                
+            except Exception as e:
+                error_msg = str(e)
+                self.last_error = error_msg
+                print(f"调用Gemini API时发生错误: {error_msg}")
+                self._record_failure("text_only", error_msg)
+                
+                # 已经返回部分回复时无法透明地重试，只有配额超限且尚未收到回复时才切换
+                if received or not ("quota exceeded" in error_msg.lower() or "429" in error_msg):
+                    raise
+                print(f"模型 {self.model_name} 配额已用完，尝试切换模型或API密钥...")
+                current_attempt += 1
+                
+                if len(GEMINI_API_KEYS) > 1:
+                    self.current_key_index = (self.current_key_index + 1) % len(GEMINI_API_KEYS)
+                    self.api_key = GEMINI_API_KEYS[self.current_key_index]
+                    self.client = genai.Client(api_key=self.api_key)
+                    print(f"已切换到新API密钥: {self.api_key[:10]}...")
+                
+                if self.model_name in self.model_priority.get("text_only", []):
+                    self.model_priority["text_only"].remove(self.model_name)
+                
+                new_model = self.select_best_model(task_type="text_only")
+                if new_model == self.model_name:
+                    print("没有可用的替代模型")
+                    break
+                self.model_name = new_model
+                print(f"已切换到新模型: {self.model_name}")
+        
+        raise RuntimeError(f"尝试了 {current_attempt} 次后仍无法完成提问")
+    
     def recognize_image(self, image_path, question="图里有什么内容？"):
         """
         通过Gemini API识别图片内容
@@ -215,7 +330,12 @@ class GeminiOCR:
         """
         # 验证并获取绝对路径
         image_path = os.path.abspath(image_path)
-        
+        if not os.path.exists(image_path):
+            return self._recognize_image(image_path, question)
+        key = ("gemini-image", self.pinned_model, file_digest(image_path), question)
+        return self._coalesce(key, self._recognize_image, image_path, question)
+    
+    def _recognize_image(self, image_path, question):
         if not os.path.exists(image_path):
             print(f"图片文件不存在: {image_path}")
             return None
@@ -247,10 +367,7 @@ class GeminiOCR:
                 ]
                 
                 # 调用Gemini API
-                response = self.client.models.generate_content(
-                    model=self.model_name,
-                    contents=contents
-                )
+                response = self._generate("image_supported", contents)
                 
                 # 估算使用的令牌数（简单估算）
                 tokens_used = len(response.text) * 1.5  # 粗略估算：每个汉字约1.5个令牌
@@ -274,6 +391,7 @@ class GeminiOCR:
                 
             except Exception as e:
                 error_msg = str(e)
+                self.last_error = error_msg
                 print(f"调用Gemini API时发生错误: {error_msg}")
                 
                 # 检查是否是配额超限错误
@@ -316,7 +434,12 @@ class GeminiOCR:
         """
         # 验证并获取绝对路径
         document_path = os.path.abspath(document_path)
-        
+        if not os.path.exists(document_path):
+            return self._process_document(document_path, question)
+        key = ("gemini-document", self.pinned_model, file_digest(document_path), question)
+        return self._coalesce(key, self._process_document, document_path, question)
+    
+    def _process_document(self, document_path, question):
         if not os.path.exists(document_path):
             print(f"文档文件不存在: {document_path}")
             return None
@@ -348,10 +471,7 @@ class GeminiOCR:
                 ]
                 
                 # 调用Gemini API
-                response = self.client.models.generate_content(
-                    model=self.model_name,
-                    contents=contents
-                )
+                response = self._generate("document_supported", contents)
                 
                 # 估算使用的令牌数（简单估算）
                 tokens_used = len(response.text) * 1.5  # 粗略估算：每个汉字约1.5个令牌
@@ -375,6 +495,7 @@ class GeminiOCR:
                 
             except Exception as e:
                 error_msg = str(e)
+                self.last_error = error_msg
                 print(f"调用Gemini API时发生错误: {error_msg}")
                 
                 # 检查是否是配额超限错误
@@ -538,17 +659,19 @@ class GeminiOCR:
             if minute_time < cutoff_time:
                 del minute_stats[minute_str]
     
-    def get_today_usage(self, model_name):
+    def get_today_usage(self, model_name, usage_data=None):
         """
         获取今天的使用量
         :param model_name: 模型名称
+        :param usage_data: 已加载的使用量数据，None表示从文件加载
         :return: 使用量字典 {"rpm_used": 0, "tpm_used": 0, "rpd_used": 0}
         """
         today = datetime.date.today().isoformat()
         now = datetime.datetime.now()
         current_minute = now.strftime("%Y-%m-%d %H:%M")
         
-        usage_data = self.load_usage_data()
+        if usage_data is None:
+            usage_data = self.load_usage_data()
         
         # 初始化返回值
         rpm_used = 0
@@ -569,13 +692,22 @@ class GeminiOCR:
         
         return {"rpm_used": rpm_used, "tpm_used": tpm_used, "rpd_used": rpd_used}
     
-    def is_model_available(self, model_name):
+    def is_model_available(self, model_name, usage_data=None):
         """
-        检查模型是否可用（不再进行限额检查，所有模型都可用）
+        检查模型今天和当前分钟是否还有剩余配额
+        本地使用量按模型记录、不区分密钥，限额按密钥数放大；没有限额数据的模型视为可用
         :param model_name: 模型名称
+        :param usage_data: 已加载的使用量数据，None表示从文件加载
         :return: 是否可用
         """
-        return True
+        limits = self.rate_limits.get(model_name)
+        if not limits:
+            return True
+        usage = self.get_today_usage(model_name, usage_data)
+        keys = len(GEMINI_API_KEYS)
+        return (usage["rpd_used"] < limits["rpd_limit"] * keys
+                and usage["rpm_used"] < limits["rpm_limit"] * keys
+                and usage["tpm_used"] < limits["tpm_limit"] * keys)
     
     def load_model_capabilities(self):
         """
@@ -726,24 +858,41 @@ class GeminiOCR:
     
     def select_best_model(self, task_type="text_only"):
         """
-        根据优先级选择最优模型
+        选择预期完成时间最短的可用模型
+        预期时间由模型统计的延迟和错误率计算，相同时按优先级列表的顺序；偶尔尝试其他可用模型
         :param task_type: 任务类型，可选值：text_only, image_supported, document_supported
         :return: 最优模型名称
         """
+        if self.pinned_model:
+            return self.pinned_model
+        
         # 获取对应任务类型的模型优先级列表
         priority_list = self.model_priority.get(task_type, [])
         
         # 如果没有对应任务类型的模型列表，使用默认的text_only列表
         if not priority_list:
             priority_list = self.model_priority.get("text_only", [])
+            task_type = "text_only"
         
-        # 遍历优先级列表，选择第一个可用的模型
-        for model_name in priority_list:
-            if self.is_model_available(model_name):
-                return model_name
+        # 只加载一次使用量，避免逐个模型读文件
+        usage_data = self.load_usage_data()
+        model_name = self.model_stats.choose(
+            priority_list, task_type, lambda m: self.is_model_available(m, usage_data))
         
         # 如果没有可用模型，默认使用gemma-3-27b-it
-        return "gemma-3-27b-it"
+        return model_name or "gemma-3-27b-it"
+    
+    def show_model_stats(self):
+        """
+        显示各任务类型下模型的统计数据，按预期完成时间排序
+        """
+        for task_type, models in self.model_stats.snapshot().items():
+            print(f"\n=== {task_type} ===")
+            for model_name in sorted(models, key=lambda m: self.model_stats.expected_time(m, task_type)):
+                entry = models[model_name]
+                latency = f"{entry['latency']:.2f}s" if entry["latency"] is not None else "-"
+                print(f"{model_name}: 延迟 {latency}, 错误率 {entry['error_rate']:.1%}, "
+                      f"请求 {entry['requests']} 次, 预期 {self.model_stats.expected_time(model_name, task_type):.2f}s")
     
     def check_quota(self, show_details=False):
         """
@@ -840,6 +989,7 @@ def main():
     parser.add_argument("--verbose", action="store_true", help="显示详细日志")
     parser.add_argument("--check-quota", action="store_true", help="检查Gemini API限额")
     parser.add_argument("--quota-details", action="store_true", help="显示详细的速率限制信息")
+    parser.add_argument("--model-stats", action="store_true", help="显示各模型的延迟和错误率统计")
     parser.add_argument("--type", choices=['image', 'document', 'auto'], default='auto', help="文件类型，默认为自动检测")
     
     args = parser.parse_args()
@@ -852,6 +1002,10 @@ def main():
         ocr.check_quota(args.quota_details)
         return
     
+    if args.model_stats:
+        ocr.show_model_stats()
+        return
+    
     # 检查参数：直接提问时必须提供question
     if not args.file_path and args.question == "图里有什么内容？":
         parser.error("直接提问时必须使用--question参数提供问题内容")
@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+按配额调度的Gemini批量任务
+直接用 GeminiOCR 处理成千上万个文档时，几分钟内就会用完所有模型的每日限额，之后的请求全部失败。
+QuotaPlanner 按每个模型、每个API密钥的每分钟和每日限额安排发送时间：预留一部分配额给交互式请求，
+剩余的配额均匀分摊到当天余下的时间里；当天的配额用完后，任务排到配额重置（太平洋时间零点）之后继续。
+同样的计算在虚拟时钟上运行即可根据当前使用量预测完成时间。
+
+任务文件为JSONL，每行一个任务：
+    {"custom_id": "doc-1", "file": "/path/to/a.pdf", "question": "文档内容是什么？"}
+没有 file 时为直接提问（question 必填）；结果逐行写入输出目录的 output.jsonl 和 errors.jsonl，
+重新运行时跳过已经完成的任务。
+"""
+
+import os
+import re
+import sys
+import copy
+import json
+import time
+import argparse
+import datetime
+import threading
+from collections import deque
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Gemini的每日配额在太平洋时间零点重置
+QUOTA_TIMEZONE = "America/Los_Angeles"
+
+# 各任务类型的默认提问
+DEFAULT_QUESTIONS = {
+    "image_supported": "图里有什么内容？",
+    "document_supported": "文档内容是什么？",
+}
+
+
+class QuotaExceededError(RuntimeError):
+    """
+    模型（当前密钥）的配额已用完
+    daily 为真表示每日限额用完，要等到配额重置；否则只是每分钟限额，稍后即可继续
+    """
+
+    def __init__(self, message, daily=False):
+        super().__init__(message)
+        self.daily = daily
+
+
+def quota_error_scope(error_msg):
+    """
+    判断错误是否为配额超限，以及超出的是每日还是每分钟限额
+    Gemini的429错误信息中包含超限的配额ID，如 GenerateRequestsPerDayPerProjectPerModel-FreeTier
+    :param error_msg: 错误信息
+    :return: "day"、"minute"，不是配额超限时返回None；无法判断时按每分钟处理
+    """
+    if not error_msg:
+        return None
+    lowered = error_msg.lower()
+    if not ("quota exceeded" in lowered or "429" in error_msg or "resource_exhausted" in lowered):
+        return None
+    return "day" if "perday" in re.sub(r"[\s_-]", "", lowered) else "minute"
+
+
+def _zone(timezone):
+    try:
+        return ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"未知的时区: {timezone}（Windows上需要先安装 tzdata）")
+
+
+def next_reset(now=None, timezone=QUOTA_TIMEZONE):
+    """
+    下一次每日配额重置的时间（配额时区的零点）
+    :param now: 时间戳，默认为当前时间
+    :param timezone: 配额重置所在的时区
+    :return: 时间戳
+    """
+    now = time.time() if now is None else now
+    zone = _zone(timezone)
+    tomorrow = datetime.datetime.fromtimestamp(now, zone).date() + datetime.timedelta(days=1)
+    return datetime.datetime.combine(tomorrow, datetime.time(), tzinfo=zone).timestamp()
+
+
+def _day(timestamp, timezone=QUOTA_TIMEZONE):
+    return datetime.datetime.fromtimestamp(timestamp, _zone(timezone)).date().isoformat()
+
+
+def job_task_type(job):
+    """
+    根据任务的文件类型确定任务类型
+    :param job: 任务字典
+    :return: text_only、image_supported 或 document_supported
+    """
+    if not job.get("file"):
+        return "text_only"
+    if os.path.splitext(job["file"])[1].lower() == ".pdf":
+        return "document_supported"
+    return "image_supported"
+
+
+def parse_jobs(lines):
+    """
+    解析并校验任务列表
+    :param lines: JSONL文本、文本行列表或任务字典列表
+    :return: 任务字典列表
+    :raises ValueError: 任务格式错误，错误信息包含行号
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+
+    jobs = []
+    custom_ids = set()
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, str):
+            if not line.strip():
+                continue
+            try:
+                line = json.loads(line)
+            except ValueError:
+                raise ValueError(f"第 {line_number} 行不是有效的JSON")
+        if not isinstance(line, dict):
+            raise ValueError(f"第 {line_number} 行必须是JSON对象")
+
+        custom_id = line.get("custom_id")
+        if not custom_id or not isinstance(custom_id, str):
+            raise ValueError(f"第 {line_number} 行缺少 custom_id")
+        if custom_id in custom_ids:
+            raise ValueError(f"第 {line_number} 行的 custom_id 重复: {custom_id}")
+        if not line.get("file") and not line.get("question"):
+            raise ValueError(f"第 {line_number} 行没有 file 时必须提供 question")
+        custom_ids.add(custom_id)
+        jobs.append(line)
+    return jobs
+
+
+class QuotaPlanner:
+    """
+    按模型和API密钥分配发送时间
+    每个（模型，密钥）组合的可用配额为限额乘以 (1 - reserve)，余下部分留给交互式请求。
+    没有限额数据的模型不参与调度
+    """
+
+    def __init__(self, rate_limits, model_priority, keys=1, reserve=0.2, spread=True, used_today=None, now=None,
+                 timezone=QUOTA_TIMEZONE):
+        """
+        :param rate_limits: 模型速率限制 {模型: {"rpm_limit", "rpd_limit", ...}}，即 GeminiOCR.rate_limits
+        :param model_priority: 各任务类型的候选模型 {任务类型: [模型, ...]}，即 GeminiOCR.model_priority
+        :param keys: API密钥数，限额按每个密钥计算
+        :param reserve: 为交互式请求预留的配额比例
+        :param spread: 是否把当天的剩余配额均匀分摊到配额重置前，否则按每分钟限额尽快发送
+        :param used_today: 今天已使用的请求数 {模型: 次数}，不区分密钥，平均分摊到各个密钥
+        :param now: 当前时间戳，默认为当前时间
+        :param timezone: 每日配额重置所在的时区，"今天"按该时区计算
+        :raises ValueError: 没有可调度的模型或时区无效
+        """
+        if not 0 <= reserve < 1:
+            raise ValueError(f"预留比例必须在0到1之间: {reserve}")
+        _zone(timezone)
+        now = time.time() if now is None else now
+        self.timezone = timezone
+        self.model_priority = model_priority
+        self.keys = keys
+        self.spread = spread
+        self.lock = threading.Lock()
+        self.slots = []
+
+        models = []
+        for candidates in model_priority.values():
+            models.extend(m for m in candidates if m not in models)
+        for model in models:
+            limits = rate_limits.get(model)
+            if not limits:
+                continue
+            per_minute = limits["rpm_limit"] * (1 - reserve)
+            daily = limits["rpd_limit"] * (1 - reserve)
+            if per_minute <= 0 or daily < 1:
+                continue
+            for key_index in range(keys):
+                self.slots.append({
+                    "model": model, "key_index": key_index, "per_minute": per_minute, "daily": daily,
+                    "day": _day(now, self.timezone), "used": 0.0, "last": None,
+                })
+        if not self.slots:
+            raise ValueError("没有可调度的模型")
+        if used_today:
+            self.sync(used_today, now)
+
+    def sync(self, used_today, now=None):
+        """
+        用共享的使用量记录更新今天已使用的请求数（包括交互式请求），只增不减
+        :param used_today: 今天已使用的请求数 {模型: 次数}
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            for slot in self.slots:
+                if slot["day"] != _day(now, self.timezone):
+                    slot["day"], slot["used"] = _day(now, self.timezone), 0.0
+                slot["used"] = max(slot["used"], used_today.get(slot["model"], 0) / self.keys)
+
+    def exhaust(self, model, key_index, now=None):
+        """
+        标记模型在该密钥上今天的配额已用完（收到配额超限错误时调用）
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            for slot in self.slots:
+                if slot["model"] == model and slot["key_index"] == key_index:
+                    slot["day"], slot["used"] = _day(now, self.timezone), slot["daily"]
+
+    def throttle(self, model, key_index, seconds=60, now=None):
+        """
+        模型在该密钥上超出每分钟限额（常因同一密钥上的交互式请求）时，暂停发送约一分钟，不影响当天的配额
+        """
+        now = time.time() if now is None else now
+        with self.lock:
+            for slot in self.slots:
+                if slot["model"] == model and slot["key_index"] == key_index:
+                    slot["last"] = max(slot["last"] or now, now) + seconds
+
+    def _next_time(self, slot, now):
+        """
+        该组合下一次可以发送的时间
+        """
+        used = slot["used"] if slot["day"] == _day(now, self.timezone) else 0.0
+        remaining = slot["daily"] - used
+        reset = next_reset(now, self.timezone)
+        if remaining < 1:
+            return reset
+        interval = 60.0 / slot["per_minute"]
+        if self.spread:
+            interval = max(interval, (reset - now) / remaining)
+        if slot["last"] is None:
+            return now
+        return max(now, slot["last"] + interval)
+
+    def acquire(self, task_type="text_only", now=None):
+        """
+        为一个任务分配发送时间、模型和密钥，并计入使用量
+        :param task_type: 任务类型
+        :param now: 当前时间戳，默认为当前时间
+        :return: (发送时间戳, 模型, 密钥序号)
+        :raises ValueError: 该任务类型没有可调度的模型
+        """
+        now = time.time() if now is None else now
+        candidates = self.model_priority.get(task_type) or self.model_priority.get("text_only", [])
+        with self.lock:
+            slots = [slot for slot in self.slots if slot["model"] in candidates]
+            if not slots:
+                raise ValueError(f"任务类型 {task_type} 没有可调度的模型")
+            # 时间相同时按候选模型的顺序
+            slot = min(slots, key=lambda s: (self._next_time(s, now), candidates.index(s["model"])))
+            at = self._next_time(slot, now)
+            if slot["day"] != _day(at, self.timezone):
+                slot["day"], slot["used"] = _day(at, self.timezone), 0.0
+            slot["used"] += 1
+            slot["last"] = at
+            return at, slot["model"], slot["key_index"]
+
+    def plan(self, task_types, now=None):
+        """
+        根据当前使用量预测任务的发送计划，不改变实际的使用量
+        :param task_types: 各任务的任务类型，按执行顺序
+        :param now: 当前时间戳，默认为当前时间
+        :return: {"jobs", "start_at", "finish_at"（最后一个任务的发送时间）, "today"（今天能发送的任务数）,
+                  "days"（跨越的天数）, "by_model": {模型: 任务数}}
+        """
+        now = time.time() if now is None else now
+        simulation = copy.copy(self)
+        simulation.lock = threading.Lock()
+        with self.lock:
+            simulation.slots = copy.deepcopy(self.slots)
+
+        today = _day(now, self.timezone)
+        summary = {"jobs": 0, "start_at": None, "finish_at": None, "today": 0, "days": 0, "by_model": {}}
+        days = set()
+        for task_type in task_types:
+            at, model, _ = simulation.acquire(task_type, now)
+            # 任务依次发送，下一个任务不会早于上一个
+            now = at
+            summary["jobs"] += 1
+            summary["start_at"] = at if summary["start_at"] is None else summary["start_at"]
+            summary["finish_at"] = at
+            summary["by_model"][model] = summary["by_model"].get(model, 0) + 1
+            summary["today"] += _day(at, self.timezone) == today
+            days.add(_day(at, self.timezone))
+        summary["days"] = len(days)
+        return summary
+
+
+class GeminiScheduler:
+    """
+    按 QuotaPlanner 分配的时间发送任务，配额用完时等到配额重置后自动继续
+    """
+
+    def __init__(self, planner, directory, execute=None, max_concurrency=4, usage=None, max_retries=3):
+        """
+        :param planner: QuotaPlanner 实例
+        :param directory: 结果目录，保存 output.jsonl 和 errors.jsonl
+        :param execute: 执行单个任务的函数 execute(job, model, key_index) -> 结果字典，
+                        配额用完时抛出 QuotaExceededError；默认使用 GeminiOCR
+        :param max_concurrency: 同时执行的任务数
+        :param usage: 返回今天共享使用量 {模型: 次数} 的函数，每次发送前同步，None表示不同步
+        :param max_retries: 单个任务因每分钟限额超限重试的最多次数；每日配额用完的任务总是重新安排到其他模型或配额重置之后
+        """
+        self.planner = planner
+        self.directory = directory
+        self.execute = execute or execute_gemini_job
+        self.max_concurrency = max_concurrency
+        self.usage = usage
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.attempts = {}
+
+    def _path(self, kind):
+        return os.path.join(self.directory, f"{kind}.jsonl")
+
+    def finished_ids(self):
+        """
+        已经写入结果的任务ID，重新运行时跳过
+        """
+        finished = set()
+        for kind in ("output", "errors"):
+            if not os.path.exists(self._path(kind)):
+                continue
+            with open(self._path(kind), encoding="utf-8") as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        finished.add(json.loads(line)["custom_id"])
+        return finished
+
+    def pending(self, jobs):
+        """
+        :param jobs: 任务列表，格式见 parse_jobs
+        :return: 尚未完成的任务列表
+        """
+        finished = self.finished_ids()
+        return [job for job in parse_jobs(jobs) if job["custom_id"] not in finished]
+
+    def stop(self):
+        """
+        停止发送新任务，正在执行的任务继续完成；未发送的任务在下次运行时继续
+        """
+        self.stopped.set()
+
+    def run(self, jobs):
+        """
+        执行所有未完成的任务，直到全部完成或调用 stop()
+        :param jobs: 任务列表，格式见 parse_jobs
+        :return: 本次运行的统计 {"completed", "failed", "remaining"}
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        queue = deque(self.pending(jobs))
+        counts = {"completed": 0, "failed": 0, "remaining": 0}
+        futures = set()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="gemini-scheduler") as executor:
+            while queue or futures:
+                done = {future for future in futures if future.done()}
+                if (not queue or len(futures) >= self.max_concurrency) and not done:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    futures.discard(future)
+                    outcome, job = future.result()
+                    if outcome == "retry":
+                        queue.appendleft(job)
+                    else:
+                        counts[outcome] += 1
+                if not queue or len(futures) >= self.max_concurrency or self.stopped.is_set():
+                    if self.stopped.is_set():
+                        counts["remaining"] = len(queue)
+                        queue.clear()
+                    continue
+
+                job = queue.popleft()
+                if self.usage is not None:
+                    self.planner.sync(self.usage())
+                at, model, key_index = self.planner.acquire(job_task_type(job))
+                delay = at - time.time()
+                if delay > 0:
+                    if at >= next_reset(timezone=self.planner.timezone):
+                        resume_at = datetime.datetime.fromtimestamp(at).isoformat(sep=" ", timespec="seconds")
+                        print(f"今天的配额已用完，{resume_at} 配额重置后继续")
+                    if self.stopped.wait(delay):
+                        queue.appendleft(job)
+                        continue
+                futures.add(executor.submit(self._execute_one, job, model, key_index))
+        return counts
+
+    def _execute_one(self, job, model, key_index):
+        """
+        执行单个任务，结果追加到 output.jsonl 或 errors.jsonl
+        :return: ("completed" | "failed" | "retry", 任务)
+        """
+        record = {"custom_id": job["custom_id"], "model": model, "key_index": key_index}
+        try:
+            record["response"] = self.execute(job, model, key_index)
+            kind, outcome = "output", "completed"
+        except QuotaExceededError as e:
+            if e.daily:
+                # 该模型在该密钥上等到配额重置后再用，任务不记为失败
+                self.planner.exhaust(model, key_index)
+                print(f"{job['custom_id']}: {e}，重新安排")
+                return "retry", job
+            self.planner.throttle(model, key_index)
+            with self.lock:
+                attempts = self.attempts[job["custom_id"]] = self.attempts.get(job["custom_id"], 0) + 1
+            if attempts <= self.max_retries:
+                print(f"{job['custom_id']}: {e}，重新安排")
+                return "retry", job
+            record["error"] = str(e)
+            kind, outcome = "errors", "failed"
+        except Exception as e:
+            record["error"] = str(e)
+            kind, outcome = "errors", "failed"
+
+        with self.lock:
+            with open(self._path(kind), "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return outcome, job
+
+
+def execute_gemini_job(job, model, key_index):
+    """
+    使用指定的模型和API密钥执行任务
+    :return: GeminiOCR 的结果字典
+    :raises QuotaExceededError: 模型配额已用完
+    :raises RuntimeError: 请求失败
+    """
+    from gemini_ocr import GeminiOCR
+
+    task_type = job_task_type(job)
+    question = job.get("question") or DEFAULT_QUESTIONS.get(task_type)
+    ocr = GeminiOCR(key_index=key_index, coalesce=False, model=model)
+    if task_type == "document_supported":
+        result = ocr.process_document(job["file"], question)
+    elif task_type == "image_supported":
+        result = ocr.recognize_image(job["file"], question)
+    else:
+        result = ocr.ask_question(question)
+    if result is None:
+        # 按本次请求的错误判断，而不是按模型共享的统计（其他密钥上的超限不影响本任务）
+        scope = quota_error_scope(ocr.last_error)
+        if scope == "day":
+            raise QuotaExceededError(f"模型 {model} 今天的配额已用完: {ocr.last_error}", daily=True)
+        if scope == "minute":
+            raise QuotaExceededError(f"模型 {model} 超出每分钟限额: {ocr.last_error}")
+        raise RuntimeError(ocr.last_error or "Gemini请求失败")
+    return result
+
+
+def _format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).isoformat(sep=" ", timespec="seconds")
+
+
+def _print_plan(summary):
+    if not summary["jobs"]:
+        print("没有未完成的任务")
+        return
+    print(f"任务数: {summary['jobs']}  今天可发送: {summary['today']}  跨越天数: {summary['days']}")
+    print(f"开始时间: {_format_time(summary['start_at'])}")
+    print(f"预计最后一个任务的发送时间: {_format_time(summary['finish_at'])}")
+    for model, count in summary["by_model"].items():
+        print(f"  {model}: {count}")
+
+
+def main():
+    """
+    主函数，批量任务调度命令行工具
+    """
+    parser = argparse.ArgumentParser(description="按配额调度的Gemini批量任务工具")
+    parser.add_argument("command", choices=["plan", "run"], help="plan: 预测完成时间；run: 执行任务")
+    parser.add_argument("jobs_path", help="JSONL任务文件")
+    parser.add_argument("-o", "--output-dir", help="结果目录（run 必填），重新运行时跳过已完成的任务")
+    parser.add_argument("--reserve", type=float, default=0.2, help="为交互式请求预留的配额比例，默认0.2")
+    parser.add_argument("--no-spread", action="store_true", help="不把配额分摊到全天，按每分钟限额尽快发送")
+    parser.add_argument("--concurrency", type=int, default=4, help="同时执行的任务数")
+    parser.add_argument("--timezone", default=QUOTA_TIMEZONE, help=f"每日配额重置所在的时区，默认{QUOTA_TIMEZONE}")
+    args = parser.parse_args()
+
+    if args.command == "run" and not args.output_dir:
+        parser.error("run 必须使用 --output-dir 指定结果目录")
+
+    try:
+        from gemini_ocr import GeminiOCR
+        from gemini_config import GEMINI_API_KEYS
+
+        ocr = GeminiOCR()
+
+        def usage():
+            usage_data = ocr.load_usage_data()
+            return {model: ocr.get_today_usage(model, usage_data)["rpd_used"] for model in ocr.rate_limits}
+
+        planner = QuotaPlanner(ocr.rate_limits, ocr.model_priority, keys=len(GEMINI_API_KEYS),
+                               reserve=args.reserve, spread=not args.no_spread, used_today=usage(),
+                               timezone=args.timezone)
+        with open(args.jobs_path, encoding="utf-8") as f:
+            jobs = parse_jobs(f.read())
+
+        if args.command == "plan":
+            if args.output_dir:
+                jobs = GeminiScheduler(planner, args.output_dir).pending(jobs)
+            _print_plan(planner.plan([job_task_type(job) for job in jobs]))
+            return
+
+        scheduler = GeminiScheduler(planner, args.output_dir, max_concurrency=args.concurrency, usage=usage)
+        pending = scheduler.pending(jobs)
+        _print_plan(planner.plan([job_task_type(job) for job in pending]))
+        try:
+            counts = scheduler.run(pending)
+        except KeyboardInterrupt:
+            scheduler.stop()
+            print("已停止，重新运行时继续执行未完成的任务")
+            return
+        print(f"完成: {counts['completed']}  失败: {counts['failed']}")
+        print(f"结果已保存到: {args.output_dir}")
+    except (RuntimeError, ValueError, OSError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+豆包浏览器服务器压力测试工具
+基于 DoubaoBrowserClient，在逐级提高的并发下运行OCR、纯文本和是/否混合负载，
+统计吞吐量、p50/p95/p99延迟、错误率、验证码率和各阶段耗时，
+结果写入JSON文件，便于跨版本对比。可对接真实服务器或本地替身服务器
+"""
+
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from doubao_browser_client import DoubaoBrowserClient
+from doubao_yes_no import DoubaoYesNo
+from benchmark_client import percentile, summarize_latencies
+from fake_browser_server import FakeBrowserServer, parse_latency_args
+
+# 默认的负载配比：操作名称 -> 权重
+DEFAULT_MIX = {"ocr": 1, "text": 2, "yesno": 1}
+
+CAPTCHA_MARKER = "[CAPTCHA_DETECTED]"
+
+
+def parse_mix(mix_text):
+    """
+    解析负载配比
+    :param mix_text: 形如 "ocr=1,text=2,yesno=1" 的字符串
+    :return: 操作名称到权重的字典
+    """
+    mix = {}
+    for item in mix_text.split(","):
+        name, _, weight = item.strip().partition("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"不支持的负载类型: {name}")
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError("负载配比的权重不能全为0")
+    return mix
+
+
+def is_captcha_result(result):
+    """
+    判断响应是否遇到了验证码
+    :param result: /ocr 或 /textChat 的响应字典
+    :return: 是否遇到验证码
+    """
+    if result.get("response") == CAPTCHA_MARKER:
+        return True
+    return any(
+        message.get("type") == "error" and "验证码" in (message.get("content") or "")
+        for message in result.get("chatHistory") or []
+    )
+
+
+class LoadTester:
+    """
+    压力测试执行器
+    """
+
+    def __init__(self, server_url, mix=None, image_path=None, seed=None):
+        """
+        初始化压力测试执行器
+        :param server_url: 浏览器服务器地址
+        :param mix: 负载配比字典，默认 DEFAULT_MIX
+        :param image_path: OCR负载使用的图片路径
+        :param seed: 负载选择的随机种子
+        """
+        self.server_url = server_url
+        self.mix = mix or dict(DEFAULT_MIX)
+        self.image_path = image_path
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.yes_no = DoubaoYesNo(server_url)
+
+        if self.mix.get("ocr") and not image_path:
+            raise ValueError("OCR负载需要提供图片路径")
+
+    def _pick_operation(self):
+        names = list(self.mix)
+        with self.rng_lock:
+            return self.rng.choices(names, weights=[self.mix[name] for name in names])[0]
+
+    def run_once(self, client, operation):
+        """
+        执行一次请求：创建页面 -> 发送请求 -> 关闭页面
+        :param client: DoubaoBrowserClient 实例
+        :param operation: 操作名称
+        :return: 单次请求的记录字典
+        """
+        record = {"operation": operation, "success": False, "captcha": False, "stages": {}}
+        started = time.perf_counter()
+
+        stage_started = time.perf_counter()
+        page_id = client.create_page()
+        record["stages"]["create_page"] = (time.perf_counter() - stage_started) * 1000
+
+        if page_id:
+            try:
+                stage_started = time.perf_counter()
+                if operation == "ocr":
+                    result = client.ocr(page_id, self.image_path, "图里有什么内容？")
+                elif operation == "yesno":
+                    result = client.text_chat(page_id, "地球是圆的吗？ Please answer with only 'yes' or 'no'.")
+                else:
+                    result = client.text_chat(page_id, "你好，请简单介绍一下自己")
+                record["stages"]["request"] = (time.perf_counter() - stage_started) * 1000
+
+                record["captcha"] = is_captcha_result(result)
+                record["success"] = bool(result.get("success")) and not record["captcha"]
+                if record["success"] and operation == "yesno":
+                    record["success"] = self.yes_no.parse_yes_no(result.get("response")) is not None
+
+                # 服务器返回的分阶段耗时（如有）
+                for stage, value in (result.get("timings") or {}).items():
+                    if isinstance(value, (int, float)):
+                        record["stages"][f"server.{stage}"] = value
+            finally:
+                stage_started = time.perf_counter()
+                client.close_page(page_id)
+                record["stages"]["close_page"] = (time.perf_counter() - stage_started) * 1000
+
+        record["latency_ms"] = (time.perf_counter() - started) * 1000
+        return record
+
+    def run_level(self, concurrency, duration=None, requests_per_level=None):
+        """
+        在指定并发下运行负载（闭环：每个工作线程完成一个请求后立即发起下一个）
+        :param concurrency: 并发数
+        :param duration: 运行时长（秒）
+        :param requests_per_level: 总请求数，提供时优先于运行时长
+        :return: 该并发级别的汇总结果字典
+        """
+        records = []
+        records_lock = threading.Lock()
+        remaining = [requests_per_level]
+        deadline = time.perf_counter() + (duration or 0)
+
+        def take_ticket():
+            if requests_per_level is None:
+                return time.perf_counter() < deadline
+            with records_lock:
+                if remaining[0] <= 0:
+                    return False
+                remaining[0] -= 1
+                return True
+
+        def worker():
+            client = DoubaoBrowserClient(self.server_url)
+            while take_ticket():
+                operation = self._pick_operation()
+                request_started = time.perf_counter()
+                try:
+                    record = self.run_once(client, operation)
+                except Exception as e:
+                    # 单次请求的异常（如200响应不是JSON）计为错误，工作线程继续运行，保持设定的并发数
+                    record = {"operation": operation, "success": False, "captcha": False, "stages": {},
+                              "error": str(e), "latency_ms": (time.perf_counter() - request_started) * 1000}
+                with records_lock:
+                    records.append(record)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(worker) for _ in range(concurrency)]
+            # 工作线程本身出错时抛出，而不是静默地以更低的并发完成这一级别
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        return self.summarize(concurrency, records, elapsed)
+
+    @staticmethod
+    def summarize(concurrency, records, elapsed):
+        """
+        汇总一个并发级别的记录
+        :param concurrency: 并发数
+        :param records: 单次请求记录列表
+        :param elapsed: 运行耗时（秒）
+        :return: 汇总结果字典
+        """
+        total = len(records)
+        errors = sum(1 for r in records if not r["success"])
+        captchas = sum(1 for r in records if r["captcha"])
+
+        summary = {
+            "concurrency": concurrency,
+            "requests": total,
+            "elapsed_s": round(elapsed, 3),
+            "throughput_rps": round(total / elapsed, 3) if elapsed > 0 else None,
+            "error_rate": round(errors / total, 4) if total else None,
+            "captcha_rate": round(captchas / total, 4) if total else None
+        }
+        summary.update(summarize_latencies([r["latency_ms"] for r in records]))
+
+        # 按操作类型统计
+        operations = {}
+        for name in sorted({r["operation"] for r in records}):
+            subset = [r for r in records if r["operation"] == name]
+            operations[name] = {
+                "requests": len(subset),
+                "error_rate": round(sum(1 for r in subset if not r["success"]) / len(subset), 4)
+            }
+            operations[name].update(summarize_latencies([r["latency_ms"] for r in subset]))
+        summary["operations"] = operations
+
+        # 按阶段统计
+        stages = {}
+        for name in sorted({stage for r in records for stage in r["stages"]}):
+            values = [r["stages"][name] for r in records if name in r["stages"]]
+            stages[name] = {
+                "p50_ms": round(percentile(values, 50), 3),
+                "p95_ms": round(percentile(values, 95), 3)
+            }
+        summary["stages"] = stages
+        return summary
+
+
+def add_queueing_estimates(levels):
+    """
+    以最低并发级别的延迟为基线，估算各级别的排队延迟
+    :param levels: 各并发级别的汇总结果列表（按并发升序）
+    """
+    if not levels or levels[0]["p50_ms"] is None:
+        return
+    baseline = levels[0]["p50_ms"]
+    for level in levels:
+        if level["p50_ms"] is not None:
+            level["queue_delay_p50_ms"] = round(max(0.0, level["p50_ms"] - baseline), 3)
+
+
+def compare_results(previous, current):
+    """
+    对比两次压测结果
+    :param previous: 上一次的结果字典
+    :param current: 本次的结果字典
+    :return: 对比行列表
+    """
+    previous_levels = {level["concurrency"]: level for level in previous.get("levels", [])}
+    lines = []
+    for level in current.get("levels", []):
+        old = previous_levels.get(level["concurrency"])
+        if not old:
+            continue
+        parts = [f"并发 {level['concurrency']:>3}:"]
+        for key, label in (("throughput_rps", "吞吐量"), ("p50_ms", "p50"), ("p95_ms", "p95"),
+                           ("p99_ms", "p99"), ("error_rate", "错误率")):
+            if old.get(key) and level.get(key) is not None:
+                change = (level[key] - old[key]) / old[key] * 100
+                parts.append(f"{label} {old[key]} -> {level[key]} ({change:+.1f}%)")
+        lines.append("  ".join(parts))
+    return lines
+
+
+def main():
+    """
+    主函数，用于命令行运行压力测试
+    """
+    parser = argparse.ArgumentParser(description="豆包浏览器服务器压力测试工具")
+    parser.add_argument("--server", default="http://localhost:3000", help="浏览器服务器地址")
+    parser.add_argument("--fake", action="store_true", help="在进程内启动本地替身服务器作为测试目标")
+    parser.add_argument("--latency", action="append", help="替身服务器接口延迟分布，如 /ocr=lognormal:3000,0.4")
+    parser.add_argument("--default-latency", default="fixed:0", help="替身服务器默认延迟分布（毫秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="替身服务器注入失败的比例")
+    parser.add_argument("--captcha-rate", type=float, default=0.0, help="替身服务器注入验证码的比例")
+    parser.add_argument("--mix", default="ocr=1,text=2,yesno=1", help="负载配比，如 ocr=1,text=2,yesno=1")
+    parser.add_argument("--levels", default="1,2,4,8", help="逐级提高的并发数，逗号分隔")
+    parser.add_argument("--duration", type=float, default=60, help="每个并发级别的运行时长（秒）")
+    parser.add_argument("--requests", type=int, help="每个并发级别的请求数，提供时忽略运行时长")
+    parser.add_argument("--image", help="OCR负载使用的图片路径")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--output", default="load_test_result.json", help="结果JSON输出路径")
+    parser.add_argument("--compare", help="与之前的结果JSON进行对比")
+
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    levels = sorted(int(level) for level in args.levels.split(","))
+
+    fake_server = None
+    server_url = args.server
+    image_path = args.image
+    temp_image = None
+
+    if args.fake:
+        fake_server = FakeBrowserServer(
+            latency=parse_latency_args(args.latency),
+            default_latency=args.default_latency,
+            failure_rate=args.failure_rate,
+            captcha_rate=args.captcha_rate,
+            seed=args.seed
+        )
+        server_url = fake_server.start()
+        print(f"已启动本地替身服务器: {server_url}")
+        if not image_path:
+            temp_image = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+            temp_image.write(b"\x89PNG\r\n\x1a\n")
+            temp_image.close()
+            image_path = temp_image.name
+
+    if mix.get("ocr") and not image_path:
+        parser.error("OCR负载需要使用 --image 提供图片路径")
+
+    tester = LoadTester(server_url, mix, image_path, seed=args.seed)
+    results = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "server": "fake" if args.fake else server_url,
+        "mix": mix,
+        "duration_s": None if args.requests else args.duration,
+        "requests_per_level": args.requests,
+        "levels": []
+    }
+
+    try:
+        for concurrency in levels:
+            print(f"\n=== 并发 {concurrency} ===")
+            level = tester.run_level(concurrency, duration=args.duration, requests_per_level=args.requests)
+            results["levels"].append(level)
+            print(f"吞吐量: {level['throughput_rps']} 次/秒  p50: {level['p50_ms']} ms  "
+                  f"p95: {level['p95_ms']} ms  p99: {level['p99_ms']} ms  "
+                  f"错误率: {level['error_rate']}  验证码率: {level['captcha_rate']}")
+    finally:
+        if fake_server:
+            fake_server.stop()
+        if temp_image:
+            os.remove(temp_image.name)
+
+    add_queueing_estimates(results["levels"])
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\n测试结果已保存到: {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        print("\n=== 与之前结果对比 ===")
+        for line in compare_results(previous, results):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
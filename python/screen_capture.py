@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+屏幕截图后端
+功能：
+1. 统一的截图后端接口，截图结果直接保存在内存中
+2. 支持 PIL ImageGrab、X11共享内存（MIT-SHM）和固定区域截图
+3. 支持快速的 PNG/JPEG 编码参数
+4. 基准测试：比较各后端的截图与编码耗时，可在Xvfb下运行
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import ctypes
+import ctypes.util
+import argparse
+import statistics
+from PIL import Image, ImageGrab
+
+# 编码预设：名称 -> (图片格式, 编码参数, 文件扩展名)
+ENCODING_PRESETS = {
+    "png": ("png", {"compress_level": 6}, ".png"),
+    "png-fast": ("png", {"compress_level": 1}, ".png"),
+    "jpeg": ("jpeg", {"quality": 85}, ".jpg"),
+    "jpeg-fast": ("jpeg", {"quality": 70, "subsampling": 2}, ".jpg")
+}
+
+
+def encode_image(image, preset="png-fast"):
+    """
+    将图片编码为内存中的字节串
+    :param image: PIL图片对象
+    :param preset: 编码预设名称，见 ENCODING_PRESETS
+    :return: 编码后的字节串
+    """
+    if preset not in ENCODING_PRESETS:
+        raise ValueError(f"不支持的编码预设: {preset}")
+
+    image_format, options, _ = ENCODING_PRESETS[preset]
+    if image_format == "jpeg" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def parse_region(region_text):
+    """
+    解析区域参数
+    :param region_text: 形如 "x1,y1,x2,y2" 的字符串
+    :return: (x1, y1, x2, y2) 元组
+    """
+    parts = [int(part) for part in region_text.split(",")]
+    if len(parts) != 4 or parts[0] >= parts[2] or parts[1] >= parts[3]:
+        raise ValueError(f"区域格式错误: {region_text}，应为 x1,y1,x2,y2")
+    return tuple(parts)
+
+
+def get_preset_extension(preset):
+    """
+    获取编码预设对应的文件扩展名
+    :param preset: 编码预设名称
+    :return: 文件扩展名，如 ".png"
+    """
+    return ENCODING_PRESETS[preset][2]
+
+
+class CaptureBackend:
+    """
+    截图后端基类
+    子类实现 grab() 返回PIL图片，capture() 负责编码为内存缓冲区
+    """
+
+    name = "base"
+
+    def grab(self, region=None):
+        """
+        截取屏幕
+        :param region: 截取区域 (x1, y1, x2, y2)，默认整个屏幕
+        :return: PIL图片对象
+        """
+        raise NotImplementedError
+
+    def capture(self, region=None, preset="png-fast"):
+        """
+        截取屏幕并编码
+        :param region: 截取区域 (x1, y1, x2, y2)，默认整个屏幕
+        :param preset: 编码预设名称
+        :return: 编码后的字节串
+        """
+        return encode_image(self.grab(region), preset)
+
+    def close(self):
+        """
+        释放后端持有的资源
+        """
+        pass
+
+
+class ImageGrabBackend(CaptureBackend):
+    """
+    基于 PIL.ImageGrab 的截图后端，跨平台
+    """
+
+    name = "imagegrab"
+
+    def grab(self, region=None):
+        return ImageGrab.grab(bbox=region)
+
+
+class _XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int)
+    ]
+
+
+class _XImage(ctypes.Structure):
+    # 只声明需要读取的前部字段，结构体其余部分由Xlib管理
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int)
+    ]
+
+
+class X11ShmBackend(CaptureBackend):
+    """
+    基于X11共享内存扩展（MIT-SHM）的截图后端
+    X服务器直接把像素写入共享内存段，省去XGetImage经由套接字传输整帧的开销，
+    适合Linux上的大分辨率和多显示器桌面
+    """
+
+    name = "xshm"
+
+    _ZPIXMAP = 2
+    _IPC_PRIVATE = 0
+    _IPC_CREAT = 0o1000
+    _IPC_RMID = 0
+
+    def __init__(self, display_name=None):
+        """
+        初始化X11共享内存截图后端
+        :param display_name: X显示名称，默认使用 DISPLAY 环境变量
+        """
+        if not sys.platform.startswith("linux"):
+            raise RuntimeError("X11共享内存截图仅支持Linux")
+
+        x11_path = ctypes.util.find_library("X11")
+        xext_path = ctypes.util.find_library("Xext")
+        if not x11_path or not xext_path:
+            raise RuntimeError("未找到 libX11 或 libXext")
+
+        self._x11 = ctypes.CDLL(x11_path)
+        self._xext = ctypes.CDLL(xext_path)
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._declare_functions()
+
+        name = display_name.encode() if display_name else None
+        self._display = self._x11.XOpenDisplay(name)
+        if not self._display:
+            raise RuntimeError(f"无法连接X显示: {display_name or os.environ.get('DISPLAY')}")
+
+        if not self._xext.XShmQueryExtension(self._display):
+            self._x11.XCloseDisplay(self._display)
+            self._display = None
+            raise RuntimeError("X服务器不支持MIT-SHM扩展")
+
+        screen = self._x11.XDefaultScreen(self._display)
+        self._root = self._x11.XDefaultRootWindow(self._display)
+        self._visual = self._x11.XDefaultVisual(self._display, screen)
+        self._depth = self._x11.XDefaultDepth(self._display, screen)
+        self.screen_size = (
+            self._x11.XDisplayWidth(self._display, screen),
+            self._x11.XDisplayHeight(self._display, screen)
+        )
+
+        # 共享内存图像按尺寸缓存，区域尺寸不变时重复使用
+        self._image = None
+        self._image_size = None
+        self._shminfo = _XShmSegmentInfo()
+
+    def _declare_functions(self):
+        """
+        声明需要用到的Xlib/XShm/libc函数签名
+        """
+        x11, xext, libc = self._x11, self._xext, self._libc
+
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        x11.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDefaultVisual.restype = ctypes.c_void_p
+        x11.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        x11.XFree.argtypes = [ctypes.c_void_p]
+
+        xext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+        xext.XShmCreateImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+            ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint
+        ]
+        xext.XShmCreateImage.restype = ctypes.POINTER(_XImage)
+        xext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(_XShmSegmentInfo)]
+        xext.XShmGetImage.argtypes = [
+            ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XImage),
+            ctypes.c_int, ctypes.c_int, ctypes.c_ulong
+        ]
+
+        libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+        libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+        libc.shmat.restype = ctypes.c_void_p
+        libc.shmdt.argtypes = [ctypes.c_void_p]
+        libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+    def _ensure_image(self, width, height):
+        """
+        确保存在指定尺寸的共享内存图像
+        :param width: 宽度
+        :param height: 高度
+        """
+        if self._image_size == (width, height):
+            return
+
+        self._release_image()
+
+        image = self._xext.XShmCreateImage(
+            self._display, self._visual, self._depth, self._ZPIXMAP,
+            None, ctypes.byref(self._shminfo), width, height
+        )
+        if not image:
+            raise RuntimeError("XShmCreateImage 失败")
+        if image.contents.bits_per_pixel != 32:
+            self._x11.XFree(image)
+            raise RuntimeError(f"不支持的像素位数: {image.contents.bits_per_pixel}")
+
+        size = image.contents.bytes_per_line * height
+        shmid = self._libc.shmget(self._IPC_PRIVATE, size, self._IPC_CREAT | 0o600)
+        if shmid < 0:
+            self._x11.XFree(image)
+            raise OSError(ctypes.get_errno(), "shmget 失败")
+
+        address = self._libc.shmat(shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            self._libc.shmctl(shmid, self._IPC_RMID, None)
+            self._x11.XFree(image)
+            raise OSError(ctypes.get_errno(), "shmat 失败")
+
+        self._shminfo.shmid = shmid
+        self._shminfo.shmaddr = address
+        self._shminfo.readOnly = 0
+        image.contents.data = address
+
+        self._xext.XShmAttach(self._display, ctypes.byref(self._shminfo))
+        self._x11.XSync(self._display, 0)
+        # 附加完成后立即标记删除，进程退出时内核会自动回收共享内存段
+        self._libc.shmctl(shmid, self._IPC_RMID, None)
+
+        self._image = image
+        self._image_size = (width, height)
+
+    def _release_image(self):
+        """
+        释放当前的共享内存图像
+        """
+        if self._image is None:
+            return
+
+        self._xext.XShmDetach(self._display, ctypes.byref(self._shminfo))
+        self._x11.XSync(self._display, 0)
+        self._libc.shmdt(self._shminfo.shmaddr)
+        # 数据区属于共享内存，置空后仅释放XImage结构体本身
+        self._image.contents.data = None
+        self._x11.XFree(self._image)
+        self._image = None
+        self._image_size = None
+
+    def grab(self, region=None):
+        if region is None:
+            region = (0, 0) + self.screen_size
+
+        x1, y1, x2, y2 = region
+        width, height = x2 - x1, y2 - y1
+        self._ensure_image(width, height)
+
+        if not self._xext.XShmGetImage(self._display, self._root, self._image, x1, y1, ctypes.c_ulong(-1).value):
+            raise RuntimeError("XShmGetImage 失败")
+
+        stride = self._image.contents.bytes_per_line
+        data = ctypes.string_at(self._shminfo.shmaddr, stride * height)
+        return Image.frombytes("RGB", (width, height), data, "raw", "BGRX", stride)
+
+    def close(self):
+        if self._display:
+            self._release_image()
+            self._x11.XCloseDisplay(self._display)
+            self._display = None
+
+
+class RegionCaptureBackend(CaptureBackend):
+    """
+    固定区域截图后端，只截取配置的区域，避免整屏截图后再裁剪
+    """
+
+    name = "region"
+
+    def __init__(self, region, backend=None):
+        """
+        初始化固定区域截图后端
+        :param region: 截取区域 (x1, y1, x2, y2)
+        :param backend: 实际执行截图的后端，默认使用 ImageGrabBackend
+        """
+        self.region = tuple(region)
+        self.backend = backend or ImageGrabBackend()
+
+    def grab(self, region=None):
+        return self.backend.grab(region or self.region)
+
+    def close(self):
+        self.backend.close()
+
+
+# 可选的截图后端
+CAPTURE_BACKENDS = {
+    ImageGrabBackend.name: ImageGrabBackend,
+    X11ShmBackend.name: X11ShmBackend
+}
+
+
+def create_capture_backend(name="imagegrab", region=None):
+    """
+    创建截图后端
+    :param name: 后端名称，imagegrab、xshm，或auto（优先使用X11共享内存，不可用时回退到ImageGrab）
+    :param region: 固定截取区域 (x1, y1, x2, y2)，提供时包装为区域截图后端
+    :return: 截图后端实例
+    """
+    if name == "auto":
+        try:
+            backend = X11ShmBackend()
+        except (RuntimeError, OSError) as e:
+            print(f"X11共享内存截图不可用，回退到ImageGrab: {e}", file=sys.stderr)
+            backend = ImageGrabBackend()
+    elif name in CAPTURE_BACKENDS:
+        backend = CAPTURE_BACKENDS[name]()
+    else:
+        raise ValueError(f"不支持的截图后端: {name}")
+
+    if region:
+        backend = RegionCaptureBackend(region, backend)
+    return backend
+
+
+def benchmark_backends(backend_names, presets, runs=10, region=None):
+    """
+    对截图后端和编码预设进行基准测试
+    :param backend_names: 后端名称列表
+    :param presets: 编码预设名称列表
+    :param runs: 每个组合的重复次数
+    :param region: 截取区域 (x1, y1, x2, y2)，默认整个屏幕
+    :return: 结果字典列表，每个后端一条
+    """
+    results = []
+
+    for backend_name in backend_names:
+        try:
+            backend = create_capture_backend(backend_name, region)
+        except (RuntimeError, OSError, ValueError) as e:
+            results.append({"backend": backend_name, "available": False, "error": str(e)})
+            continue
+
+        try:
+            # 预热一次，排除首次建立共享内存等一次性开销
+            image = backend.grab()
+            grab_times = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                image = backend.grab()
+                grab_times.append((time.perf_counter() - started) * 1000)
+
+            encodings = {}
+            for preset in presets:
+                encode_times = []
+                size = 0
+                for _ in range(runs):
+                    started = time.perf_counter()
+                    size = len(encode_image(image, preset))
+                    encode_times.append((time.perf_counter() - started) * 1000)
+                encodings[preset] = {
+                    "encode_ms_median": round(statistics.median(encode_times), 2),
+                    "bytes": size
+                }
+
+            results.append({
+                "backend": backend_name,
+                "available": True,
+                "size": list(image.size),
+                "grab_ms_median": round(statistics.median(grab_times), 2),
+                "grab_ms_min": round(min(grab_times), 2),
+                "encodings": encodings
+            })
+        finally:
+            backend.close()
+
+    return results
+
+
+def main():
+    """
+    主函数，用于命令行运行截图基准测试
+    在无显示器的机器上可通过Xvfb运行，例如：
+    xvfb-run -s "-screen 0 3840x2160x24 +extension MIT-SHM" python screen_capture.py --benchmark
+    """
+    parser = argparse.ArgumentParser(description="屏幕截图后端基准测试工具")
+    parser.add_argument("--benchmark", action="store_true", help="运行截图后端基准测试")
+    parser.add_argument("--backends", default="imagegrab,xshm", help="参与测试的后端，逗号分隔")
+    parser.add_argument("--presets", default=",".join(ENCODING_PRESETS), help="参与测试的编码预设，逗号分隔")
+    parser.add_argument("--runs", type=int, default=10, help="每个组合的重复次数")
+    parser.add_argument("--region", type=parse_region, help="截取区域，格式：x1,y1,x2,y2")
+    parser.add_argument("--json", help="测试结果JSON输出路径")
+
+    args = parser.parse_args()
+
+    if not args.benchmark:
+        parser.print_help()
+        return
+
+    results = benchmark_backends(
+        [name.strip() for name in args.backends.split(",") if name.strip()],
+        [name.strip() for name in args.presets.split(",") if name.strip()],
+        runs=args.runs,
+        region=args.region
+    )
+
+    print(f"{'后端':<12} {'尺寸':<12} {'截图(ms)':<10} {'编码预设':<10} {'编码(ms)':<10} {'大小(KB)':<10}")
+    print("-" * 70)
+    for result in results:
+        if not result["available"]:
+            print(f"{result['backend']:<12} 不可用: {result['error']}")
+            continue
+        size = "x".join(str(v) for v in result["size"])
+        for preset, encoding in result["encodings"].items():
+            print(f"{result['backend']:<12} {size:<12} {result['grab_ms_median']:<10} "
+                  f"{preset:<10} {encoding['encode_ms_median']:<10} {encoding['bytes'] // 1024:<10}")
+
+    available = [r for r in results if r["available"]]
+    if available:
+        fastest = min(available, key=lambda r: r["grab_ms_median"])
+        print(f"\n最快的截图后端: {fastest['backend']}（中位数 {fastest['grab_ms_median']} ms）")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"测试结果已保存到: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
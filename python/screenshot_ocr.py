@@ -6,60 +6,144 @@
 1. 截取当前屏幕
 2. 调用豆包API询问屏幕内容
 3. 将结果输出到指定文件
+4. 监视模式：按间隔截屏，仅在屏幕（或指定区域）变化时识别，结果以JSONL输出
 """
 
 import os
 import sys
+import json
+import time
 import argparse
+import contextlib
 import tempfile
 from datetime import datetime
-from PIL import ImageGrab
+from PIL import Image
 from doubao_ocr import DoubaoOCR
+from screen_capture import (ENCODING_PRESETS, create_capture_backend, encode_image,
+                            get_preset_extension, parse_region)
+
+# 各比较方式的默认变化阈值（差异比例，0~1）
+DEFAULT_DIFF_THRESHOLDS = {
+    "pixel": 0.02,
+    "phash": 0.1
+}
+
+
+def compute_frame_signature(image, method="pixel", size=32):
+    """
+    计算帧签名，用于判断两帧之间是否发生变化
+    :param image: PIL图片对象
+    :param method: 比较方式，pixel为缩略灰度像素，phash为差值感知哈希
+    :param size: 缩略图边长
+    :return: 帧签名（pixel为灰度像素字节串，phash为整数哈希）
+    """
+    if method == "pixel":
+        thumbnail = image.convert("L").resize((size, size), Image.BILINEAR)
+        return thumbnail.tobytes()
+    
+    if method == "phash":
+        # 差值哈希：比较相邻像素亮度，对缩放和轻微噪声不敏感
+        thumbnail = image.convert("L").resize((size + 1, size), Image.BILINEAR)
+        pixels = thumbnail.tobytes()
+        signature = 0
+        for row in range(size):
+            offset = row * (size + 1)
+            for col in range(size):
+                signature = (signature << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+        return signature
+    
+    raise ValueError(f"不支持的比较方式: {method}")
+
+
+def frame_difference(signature_a, signature_b, method="pixel", size=32):
+    """
+    计算两个帧签名之间的差异比例
+    :param signature_a: 帧签名A
+    :param signature_b: 帧签名B
+    :param method: 比较方式，需与计算签名时一致
+    :param size: 缩略图边长，需与计算签名时一致
+    :return: 差异比例，0表示完全相同，1表示完全不同
+    """
+    if method == "pixel":
+        total = sum(abs(a - b) for a, b in zip(signature_a, signature_b))
+        return total / (255 * len(signature_a))
+    
+    if method == "phash":
+        return bin(signature_a ^ signature_b).count("1") / (size * size)
+    
+    raise ValueError(f"不支持的比较方式: {method}")
+
+
 
 class ScreenshotOCR:
-    def __init__(self, node_script_path):
+    def __init__(self, node_script_path, capture_backend=None, preset="png-fast"):
         """
         初始化截图OCR工具
         :param node_script_path: Node.js脚本路径
+        :param capture_backend: 截图后端实例，默认使用ImageGrab
+        :param preset: 截图编码预设，见 screen_capture.ENCODING_PRESETS
         """
         self.ocr = DoubaoOCR(node_script_path)
+        self.capture_backend = capture_backend or create_capture_backend("imagegrab")
+        self.preset = preset
     
-    def capture_screen(self, output_path=None):
+    def capture_screen(self, output_path=None, region=None):
         """
         截取当前屏幕
         :param output_path: 截图保存路径，默认使用临时文件
+        :param region: 截取区域 (x1, y1, x2, y2)，默认整个屏幕
         :return: 截图文件路径
         """
         print("正在截取屏幕...")
         
-        # 截取屏幕
-        screenshot = ImageGrab.grab()
+        # 截取屏幕并在内存中编码
+        image_data = self.capture_backend.capture(region, self.preset)
         
-        # 保存截图
+        return self.write_screenshot(image_data, output_path)
+    
+    def save_screenshot(self, screenshot, output_path=None):
+        """
+        编码并保存截图
+        :param screenshot: PIL图片对象
+        :param output_path: 截图保存路径，默认使用临时文件
+        :return: 截图文件路径
+        """
+        return self.write_screenshot(encode_image(screenshot, self.preset), output_path)
+    
+    def write_screenshot(self, image_data, output_path=None):
+        """
+        将编码后的截图写入文件
+        :param image_data: 编码后的图片字节串
+        :param output_path: 截图保存路径，默认使用临时文件
+        :return: 截图文件路径
+        """
         if not output_path:
             # 使用临时文件
             temp_dir = tempfile.gettempdir()
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_path = os.path.join(temp_dir, f"screenshot_{timestamp}.png")
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            extension = get_preset_extension(self.preset)
+            output_path = os.path.join(temp_dir, f"screenshot_{timestamp}{extension}")
         
         # 确保目录存在
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
         
         # 保存图片
-        screenshot.save(output_path)
+        with open(output_path, "wb") as f:
+            f.write(image_data)
         print(f"屏幕截图已保存到: {output_path}")
         
         return output_path
     
-    def recognize_screen(self, output_file=None, question="图里有什么内容？"):
+    def recognize_screen(self, output_file=None, question="图里有什么内容？", region=None):
         """
         截取屏幕并识别内容
         :param output_file: 结果输出文件路径
         :param question: 向豆包提问的问题
+        :param region: 截取区域 (x1, y1, x2, y2)，默认整个屏幕
         :return: 识别结果
         """
         # 1. 截取屏幕
-        screenshot_path = self.capture_screen()
+        screenshot_path = self.capture_screen(region=region)
         
         try:
             # 2. 调用豆包OCR识别
@@ -87,6 +171,89 @@ class ScreenshotOCR:
             if os.path.exists(screenshot_path):
                 os.remove(screenshot_path)
                 print(f"临时截图已删除: {screenshot_path}")
+    
+    def watch(self, interval=5.0, question="图里有什么内容？", region=None, method="pixel",
+              threshold=None, jsonl_path=None, max_iterations=None):
+        """
+        监视屏幕，仅在画面变化时进行识别
+        :param interval: 截屏间隔（秒）
+        :param question: 向豆包提问的问题
+        :param region: 监视区域 (x1, y1, x2, y2)，默认整个屏幕
+        :param method: 帧比较方式，pixel或phash
+        :param threshold: 变化阈值（差异比例），默认按比较方式取值
+        :param jsonl_path: JSONL结果输出路径，"-"或None表示输出到标准输出
+        :param max_iterations: 最大截屏次数，默认一直运行直到中断
+        :return: 执行识别的次数
+        """
+        if threshold is None:
+            threshold = DEFAULT_DIFF_THRESHOLDS[method]
+        
+        to_stdout = jsonl_path in (None, "-")
+        output = sys.stdout if to_stdout else open(jsonl_path, "a", encoding="utf-8")
+        # 结果写到标准输出时，把识别过程中的日志转到标准错误，保证JSONL流干净
+        log_redirect = contextlib.redirect_stdout(sys.stderr) if to_stdout else contextlib.nullcontext()
+        last_signature = None
+        iterations = 0
+        recognized = 0
+        
+        print(f"开始监视屏幕，间隔 {interval} 秒，比较方式 {method}，阈值 {threshold}", file=sys.stderr)
+        
+        try:
+            with log_redirect:
+                while max_iterations is None or iterations < max_iterations:
+                    started = time.monotonic()
+                    iterations += 1
+                    
+                    frame = self.capture_backend.grab(region)
+                    signature = compute_frame_signature(frame, method)
+                    
+                    # 第一帧总是识别，之后仅在差异超过阈值时识别
+                    diff = 1.0 if last_signature is None else frame_difference(last_signature, signature, method)
+                    if diff >= threshold:
+                        record = self.recognize_frame(frame, question)
+                        # 识别失败时不更新参照帧，下一次截屏即使画面未再变化也会重新识别
+                        if record["success"]:
+                            last_signature = signature
+                        record["diff"] = round(diff, 4)
+                        record["region"] = list(region) if region else None
+                        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                        output.flush()
+                        recognized += 1
+                    
+                    # 扣除本轮耗时，保持固定的截屏节奏
+                    if max_iterations is None or iterations < max_iterations:
+                        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            print("\n监视已停止", file=sys.stderr)
+        finally:
+            if not to_stdout:
+                output.close()
+        
+        return recognized
+    
+    def recognize_frame(self, frame, question="图里有什么内容？"):
+        """
+        识别单帧截图
+        :param frame: PIL图片对象
+        :param question: 向豆包提问的问题
+        :return: 带时间戳的结果记录字典
+        """
+        timestamp = datetime.now().isoformat(timespec="seconds")
+        screenshot_path = self.save_screenshot(frame)
+        
+        try:
+            result = self.ocr.recognize_image(screenshot_path, question)
+        finally:
+            if os.path.exists(screenshot_path):
+                os.remove(screenshot_path)
+        
+        success = bool(result and result.get("success"))
+        return {
+            "timestamp": timestamp,
+            "question": question,
+            "success": success,
+            "response": result.get("response", "") if success else None
+        }
 
 def main():
     """
@@ -97,6 +264,14 @@ def main():
     parser = argparse.ArgumentParser(description="豆包屏幕截图OCR识别工具")
     parser.add_argument("--output", help="结果输出文件路径")
     parser.add_argument("--question", default="图里有什么内容？", help="向豆包提问的问题")
+    parser.add_argument("--watch", action="store_true", help="监视模式：按间隔截屏，仅在画面变化时识别")
+    parser.add_argument("--interval", type=float, default=5.0, help="监视模式截屏间隔（秒）")
+    parser.add_argument("--region", type=parse_region, help="截取/监视区域，格式：x1,y1,x2,y2")
+    parser.add_argument("--diff-method", choices=["pixel", "phash"], default="pixel", help="帧比较方式：缩略像素差或感知哈希")
+    parser.add_argument("--threshold", type=float, help="变化阈值（0~1的差异比例），默认pixel为0.02，phash为0.1")
+    parser.add_argument("--jsonl", help="监视模式结果输出的JSONL文件路径，默认输出到标准输出")
+    parser.add_argument("--backend", choices=["auto", "imagegrab", "xshm"], default="imagegrab", help="截图后端，auto优先使用X11共享内存")
+    parser.add_argument("--preset", choices=list(ENCODING_PRESETS), default="png-fast", help="截图编码预设")
     # 获取默认Node.js脚本路径
     default_node_script = get_default_node_script("test_upload_image.js")
     parser.add_argument("--node_script", default=default_node_script, help="Node.js脚本路径")
@@ -104,10 +279,26 @@ def main():
     args = parser.parse_args()
     
     # 创建截图OCR实例
-    screenshot_ocr = ScreenshotOCR(args.node_script)
+    screenshot_ocr = ScreenshotOCR(
+        args.node_script,
+        capture_backend=create_capture_backend(args.backend),
+        preset=args.preset
+    )
+    
+    # 监视模式
+    if args.watch:
+        screenshot_ocr.watch(
+            interval=args.interval,
+            question=args.question,
+            region=args.region,
+            method=args.diff_method,
+            threshold=args.threshold,
+            jsonl_path=args.jsonl
+        )
+        return
     
     # 执行屏幕识别
-    result = screenshot_ocr.recognize_screen(args.output, args.question)
+    result = screenshot_ocr.recognize_screen(args.output, args.question, region=args.region)
     
     if result:
         print("\n识别成功！")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+相同请求合并（single-flight）
+多个线程同时发起相同的请求（相同的操作、相同内容的图片或文件、相同的问题）时，
+只有第一个线程真正执行，其余线程等待并共享它的结果，避免重复创建页面、上传和等待回复。
+只合并同时进行中的请求，执行结束后不缓存结果。
+"""
+
+import copy
+import hashlib
+import threading
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """
+    计算文件内容的SHA-256摘要
+    :param path: 文件路径
+    :param chunk_size: 每次读取的字节数
+    :return: 十六进制摘要
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class _Call:
+    """
+    一次进行中的执行
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    按键合并同时进行中的相同调用
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.stats = {"executions": 0, "shared": 0}
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        执行 fn(*args, **kwargs)；相同的键已有执行在进行中时等待并共享其结果
+        :param key: 可哈希的请求键，如 ("ocr", 服务器地址, 图片摘要, 问题)
+        :param fn: 实际执行的函数
+        :return: 结果的深拷贝，每个调用方各自一份，修改时互不影响
+        :raises Exception: fn 抛出的异常，所有等待的调用方都会收到
+        """
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = _Call()
+                self.stats["executions"] += 1
+            else:
+                call.waiters += 1
+                self.stats["shared"] += 1
+
+        if leader:
+            try:
+                call.result = fn(*args, **kwargs)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self.lock:
+                    del self.calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return copy.deepcopy(call.result)
+
+    def in_flight(self):
+        """
+        :return: 正在执行的不同请求数
+        """
+        with self.lock:
+            return len(self.calls)
+
+
+# 进程内共享的默认实例，不同的包装器实例之间也能合并
+default_group = SingleFlight()
@@ -5,19 +5,38 @@
 用于测试各个功能模块的正确性
 """
 
+import io
 import os
 import sys
+import json
+import shutil
+import time
 import tempfile
+import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import patch, MagicMock
 
 # 添加项目根目录到Python路径
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from doubao_ocr import DoubaoOCR
-from screenshot_ocr import ScreenshotOCR
+from screenshot_ocr import ScreenshotOCR, compute_frame_signature, frame_difference, parse_region
 from doubao_text_chat import DoubaoTextChat
-from doubao_yes_no import DoubaoYesNo
+from doubao_yes_no import DoubaoYesNo, combine_verdicts, iter_file_chunks, vote_outcome
+from doubao_browser_client import DoubaoBrowserClient, parse_server_timing
+from doubao_ocr_all import OCRWorker
+from ai_gateway import AIGateway
+from doubao_session import DoubaoSession
+from doubao_batch import BatchClient, BatchManager, parse_batch_input
+from singleflight import SingleFlight
+from gemini_model_stats import ModelStats
+from gemini_scheduler import (GeminiScheduler, QuotaExceededError, QuotaPlanner, next_reset, parse_jobs,
+                              quota_error_scope)
+from fake_browser_server import FakeBrowserServer, LatencyModel
+from benchmark_client import percentile, run_benchmark
+from load_test import LoadTester, parse_mix, compare_results
+from screen_capture import CaptureBackend, RegionCaptureBackend, benchmark_backends, encode_image
 
 class TestDoubaoAPI(unittest.TestCase):
     """测试豆包API调用工具集"""
@@ -145,6 +164,835 @@ class TestDoubaoAPI(unittest.TestCase):
         # 由于ScreenshotOCR需要node_script_path参数，且依赖DoubaoOCR的旧版本实现，
         # 这里暂时跳过测试，后续需要重新设计ScreenshotOCR类
         pass
+    
+    def test_frame_difference(self):
+        """测试帧签名差异计算"""
+        from PIL import Image, ImageDraw
+        
+        base = Image.new('RGB', (320, 240), 'white')
+        same = base.copy()
+        changed = base.copy()
+        draw = ImageDraw.Draw(changed)
+        for x in range(0, 320, 20):
+            draw.rectangle((x, 0, x + 9, 240), fill='black')
+        
+        for method in ('pixel', 'phash'):
+            sig_base = compute_frame_signature(base, method)
+            self.assertEqual(frame_difference(sig_base, compute_frame_signature(same, method), method), 0)
+            self.assertGreater(frame_difference(sig_base, compute_frame_signature(changed, method), method), 0.02)
+        
+        with self.assertRaises(ValueError):
+            compute_frame_signature(base, 'unknown')
+    
+    def test_parse_region(self):
+        """测试区域参数解析"""
+        self.assertEqual(parse_region('0,0,100,50'), (0, 0, 100, 50))
+        with self.assertRaises(ValueError):
+            parse_region('100,0,0,50')
+    
+    @patch('screenshot_ocr.time.sleep')
+    @patch('screen_capture.ImageGrab.grab')
+    def test_screenshot_ocr_watch(self, mock_grab, mock_sleep):
+        """测试监视模式仅在画面变化时识别"""
+        from PIL import Image
+        
+        black = Image.new('RGB', (64, 64), 'black')
+        white = Image.new('RGB', (64, 64), 'white')
+        mock_grab.side_effect = [black, black.copy(), white, white.copy()]
+        
+        screenshot_ocr = ScreenshotOCR(self.server_url)
+        screenshot_ocr.ocr = MagicMock()
+        screenshot_ocr.ocr.recognize_image.return_value = {"success": True, "response": "屏幕内容"}
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            jsonl_path = os.path.join(temp_dir, 'watch.jsonl')
+            recognized = screenshot_ocr.watch(interval=0, jsonl_path=jsonl_path, max_iterations=4)
+            
+            with open(jsonl_path, encoding='utf-8') as f:
+                records = [json.loads(line) for line in f]
+        
+        self.assertEqual(recognized, 2)
+        self.assertEqual(screenshot_ocr.ocr.recognize_image.call_count, 2)
+        self.assertEqual([r['response'] for r in records], ['屏幕内容', '屏幕内容'])
+        self.assertTrue(all('timestamp' in r for r in records))
+        
+        # 识别失败的画面在下一次截屏时重新识别，即使画面没有再变化
+        mock_grab.side_effect = [black, black.copy(), black.copy()]
+        screenshot_ocr.ocr.recognize_image.reset_mock()
+        screenshot_ocr.ocr.recognize_image.side_effect = [None, {"success": True, "response": "屏幕内容"}]
+        with tempfile.TemporaryDirectory() as temp_dir:
+            jsonl_path = os.path.join(temp_dir, 'watch.jsonl')
+            recognized = screenshot_ocr.watch(interval=0, jsonl_path=jsonl_path, max_iterations=3)
+            with open(jsonl_path, encoding='utf-8') as f:
+                records = [json.loads(line) for line in f]
+        
+        self.assertEqual(recognized, 2)
+        self.assertEqual([r['success'] for r in records], [False, True])
+    
+    def test_encode_image_presets(self):
+        """测试截图编码预设"""
+        from PIL import Image
+        
+        image = Image.new('RGBA', (40, 30), 'red')
+        self.assertTrue(encode_image(image, 'png-fast').startswith(b'\x89PNG'))
+        self.assertTrue(encode_image(image, 'jpeg').startswith(b'\xff\xd8'))
+        with self.assertRaises(ValueError):
+            encode_image(image, 'bmp')
+    
+    def test_region_capture_backend(self):
+        """测试固定区域截图后端只截取配置的区域"""
+        from PIL import Image
+        
+        inner = MagicMock(spec=CaptureBackend)
+        inner.grab.return_value = Image.new('RGB', (10, 10))
+        backend = RegionCaptureBackend((0, 0, 10, 10), inner)
+        
+        backend.grab()
+        inner.grab.assert_called_with((0, 0, 10, 10))
+        self.assertTrue(backend.capture().startswith(b'\x89PNG'))
+    
+    @patch('screen_capture.ImageGrab.grab')
+    def test_benchmark_backends(self, mock_grab):
+        """测试截图基准测试结果结构"""
+        from PIL import Image
+        
+        mock_grab.return_value = Image.new('RGB', (64, 48))
+        results = benchmark_backends(['imagegrab', 'unknown'], ['png', 'jpeg-fast'], runs=2)
+        
+        self.assertTrue(results[0]['available'])
+        self.assertEqual(results[0]['size'], [64, 48])
+        self.assertEqual(set(results[0]['encodings']), {'png', 'jpeg-fast'})
+        self.assertFalse(results[1]['available'])
+
+
+class TestFakeBrowserServer(unittest.TestCase):
+    """使用本地替身服务器测试客户端和包装器"""
+    
+    def setUp(self):
+        self.server = FakeBrowserServer(seed=0)
+        self.server_url = self.server.start()
+    
+    def tearDown(self):
+        self.server.stop()
+    
+    def test_client_page_lifecycle(self):
+        """测试页面创建、对话和关闭"""
+        client = DoubaoBrowserClient(self.server_url)
+        self.assertTrue(client.is_server_running())
+        
+        page_id = client.create_page()
+        self.assertEqual(page_id, 1)
+        result = client.text_chat(page_id, '你好')
+        self.assertTrue(result['success'])
+        self.assertEqual(result['chatHistory'][0]['content'], '你好')
+        self.assertTrue(client.reset_page(page_id))
+        self.assertEqual(self.server.request_counts['/resetConversation'], 1)
+        self.assertTrue(client.close_page(page_id))
+        self.assertFalse(client.reset_page(page_id))
+        self.assertFalse(client.close_page(page_id))
+        
+        # 不存在的页面返回服务器错误
+        self.assertFalse(client.text_chat(99, '你好')['success'])
+    
+    def test_page_lease_heartbeat(self):
+        """测试页面所有者和续约"""
+        client = DoubaoBrowserClient(self.server_url)
+        page_id = client.create_page(owner='worker-1', lease=60)
+        self.assertTrue(client.heartbeat(page_id, owner='worker-1'))
+        self.assertFalse(client.heartbeat(page_id, owner='worker-2'))
+        
+        details = client.get_status()['pageDetails']
+        self.assertEqual(details, [{'pageId': page_id, 'owner': 'worker-1'}])
+        
+        client.close_page(page_id)
+        self.assertFalse(client.heartbeat(page_id))
+    
+    def test_client_timings(self):
+        """测试客户端和服务器各阶段耗时回调"""
+        self.assertEqual(parse_server_timing('captchaCheck;dur=12.5, total;desc="x";dur=30'),
+                         {'captchaCheck': 12.5, 'total': 30.0})
+        self.assertEqual(parse_server_timing(None), {})
+        
+        client = DoubaoBrowserClient(self.server_url)
+        events = []
+        client.add_timing_hook(events.append)
+        page_id = client.create_page()
+        client.text_chat(page_id, '你好')
+        client.text_chat(99, '你好')
+        
+        self.assertEqual([event['route'] for event in events], ['/createPage', '/textChat', '/textChat'])
+        chat = events[1]
+        self.assertEqual(chat['page_id'], page_id)
+        self.assertEqual(set(chat['client']), {'connect', 'send', 'wait', 'read', 'total'})
+        self.assertIn('total', chat['server'])
+        self.assertIs(client.last_timings, events[-1])
+        
+        # 服务器错误时仍从 Server-Timing 头获取服务器耗时
+        self.assertEqual(events[2]['status'], 500)
+        self.assertIsNotNone(events[2]['error'])
+        self.assertIn('total', events[2]['server'])
+        
+        # 回调出错不影响请求
+        client.remove_timing_hook(events.append)
+        client.add_timing_hook(lambda timings: 1 / 0)
+        self.assertTrue(client.close_page(page_id))
+        self.assertEqual(len(events), 3)
+    
+    def test_wrappers(self):
+        """测试包装器在替身服务器上的完整流程"""
+        self.assertTrue(DoubaoTextChat(self.server_url).send_message('你好')['success'])
+        self.assertEqual(DoubaoYesNo(self.server_url).judge(question='地球是圆的吗？'), 'yes')
+        self.assertEqual(self.server.pages, set())
+    
+    def test_failure_and_captcha_injection(self):
+        """测试失败和验证码注入"""
+        self.server.failure_rate = 1.0
+        client = DoubaoBrowserClient(self.server_url)
+        self.assertIsNone(client.create_page())
+        
+        self.server.failure_rate = 0.0
+        self.server.captcha_rate = 1.0
+        page_id = client.create_page()
+        self.assertEqual(client.text_chat(page_id, '你好')['response'], '[CAPTCHA_DETECTED]')
+    
+    def test_queue_full_backoff(self):
+        """测试服务器队列已满时客户端按提示退避重试"""
+        self.server.stop()
+        self.server = FakeBrowserServer(seed=0, latency={'/textChat': 'fixed:100'},
+                                        max_concurrency=1, max_queue=0, retry_after=0.05)
+        self.server_url = self.server.start()
+        
+        clients = [DoubaoBrowserClient(self.server_url, backoff_base=0.01) for _ in range(3)]
+        page_ids = [client.create_page() for client in clients]
+        events = []
+        for client in clients:
+            client.add_timing_hook(events.append)
+        
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = list(executor.map(lambda args: args[0].text_chat(args[1], '你好'),
+                                        zip(clients, page_ids)))
+        self.assertTrue(all(result['success'] for result in results))
+        self.assertGreater(self.server.rejected, 0)
+        self.assertIn(429, [event['status'] for event in events])
+        
+        # 重试次数用尽后返回失败
+        self.server.max_concurrency = 0
+        self.server.rejected = 0
+        client = DoubaoBrowserClient(self.server_url, max_retries=1, backoff_base=0.01)
+        self.assertIsNone(client.create_page())
+        self.assertEqual(self.server.rejected, 2)
+    
+    def test_deadline_and_cancel(self):
+        """测试截止时间和取消请求"""
+        self.server.stop()
+        self.server = FakeBrowserServer(seed=0, latency={'/textChat': 'fixed:2000'})
+        self.server_url = self.server.start()
+        client = DoubaoBrowserClient(self.server_url)
+        page_id = client.create_page()
+        
+        # 超过截止时间：服务器在客户端超时前中止处理并返回504
+        started = time.perf_counter()
+        with client.deadline(0.3):
+            self.assertFalse(client.text_chat(page_id, '你好')['success'])
+        self.assertLess(time.perf_counter() - started, 1.5)
+        
+        # 其他线程按请求ID取消，之后使用同一请求ID的请求直接被拒绝
+        started = time.perf_counter()
+        with client.deadline(10) as request_id:
+            timer = threading.Timer(0.2, DoubaoBrowserClient(self.server_url).cancel, args=(request_id,))
+            timer.start()
+            result = client.text_chat(page_id, '你好')
+            timer.join()
+            self.assertFalse(result['success'])
+            self.assertIn('499', result['error'])
+            self.assertFalse(client.text_chat(page_id, '你好')['success'])
+        self.assertLess(time.perf_counter() - started, 1.5)
+        
+        self.assertEqual(self.server.aborted, {'deadline': 1, 'cancelled': 2})
+        self.assertTrue(client.close_page(page_id))
+    
+    def test_session(self):
+        """测试多轮对话会话复用页面、附件只上传一次、只提取最新一轮回复"""
+        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+        self.addCleanup(os.remove, f.name)
+        
+        with DoubaoSession(self.server_url, attachment=f.name) as session:
+            results = [session.ask(question) for question in ('图里有什么内容？', '图中有几个人？', '背景是什么颜色？')]
+            page_id = session.page_id
+            self.assertEqual(self.server.pages, {page_id})
+        self.assertEqual(self.server.pages, set())
+        self.assertEqual(self.server.request_counts['/createPage'], 1)
+        self.assertEqual(self.server.request_counts['/ocr'], 1)
+        self.assertEqual(self.server.request_counts['/textChat'], 2)
+        self.assertTrue(all(result['response'] == self.server.response for result in results))
+        # 每轮只返回最新的回复，historyIndex 随对话增长
+        self.assertEqual([item['type'] for item in results[2]['chatHistory']], ['ai'])
+        self.assertEqual([result['historyIndex'] for result in results], [2, 4, 6])
+        self.assertEqual(len(session.turns), 3)
+        
+        with self.assertRaises(RuntimeError):
+            session.ask('会话已关闭')
+    
+    def test_session_dom_fallback(self):
+        """测试未捕获到聊天接口响应时，页面提取只取最新一轮的回复，不会取到之前更长的回复"""
+        replies = {'第一个问题': '这是一个很长很长的回答，' * 5, '第二个问题': '简短回答'}
+        self.server.response = lambda message: replies[message]
+        self.server.network_capture = False
+        
+        with DoubaoSession(self.server_url) as session:
+            first = session.ask('第一个问题')
+            second = session.ask('第二个问题')
+        self.assertEqual(first['response'], replies['第一个问题'])
+        self.assertEqual(second['response'], '简短回答')
+        self.assertEqual(second['responseSource'], 'dom')
+    
+    def test_judge_file_chunked(self):
+        """测试大文件分块判断的合并规则和提前结束"""
+        self.server.stop()
+        self.server = FakeBrowserServer(seed=0, latency={'/textChat': 'fixed:20'},
+                                        yes_no_answer=lambda message: 'no' if 'FORBIDDEN' in message else 'yes')
+        self.server_url = self.server.start()
+        # 10块，每块10行，第3块包含标记
+        lines = [f'line {i:03d} {"FORBIDDEN" if i == 25 else "ok".ljust(9)}\n' for i in range(100)]
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False, encoding='utf-8') as f:
+            f.writelines(lines)
+        self.addCleanup(os.remove, f.name)
+        chunk_size = sum(len(line) for line in lines[:10]) + 5
+        
+        self.assertEqual(len(list(iter_file_chunks(f.name, chunk_size))), 10)
+        self.assertEqual(''.join(iter_file_chunks(f.name, 7)), ''.join(lines))
+        self.assertEqual(combine_verdicts(['yes', None], 'any'), 'yes')
+        self.assertIsNone(combine_verdicts(['no', None], 'any', total=2))
+        self.assertEqual(combine_verdicts(['no', 'no'], 'majority', total=3), 'no')
+        self.assertIsNone(combine_verdicts(['yes', 'no'], 'majority', total=2))
+        
+        yes_no = DoubaoYesNo(self.server_url)
+        with patch('sys.stdout', new_callable=io.StringIO):
+            result = yes_no.judge_file_chunked('都不违规吗？', f.name, chunk_size, rule='all', max_workers=1)
+            self.assertEqual((result['answer'], result['evaluated'], result['verdicts'][2]), ('no', 3, 'no'))
+            result = yes_no.judge_file_chunked('都不违规吗？', f.name, chunk_size, rule='majority', max_workers=1)
+            self.assertEqual((result['answer'], result['evaluated'], result['chunks']), ('yes', 7, 10))
+            # 每个工作线程使用自己的客户端
+            clients = set()
+            ask = yes_no._ask
+            
+            def recording_ask(full_question, image_path=None, debug=False, client=None):
+                clients.add((threading.get_ident(), id(client)))
+                return ask(full_question, image_path, debug, client)
+            
+            with patch.object(yes_no, '_ask', recording_ask):
+                result = yes_no.judge_file_chunked('都不违规吗？', f.name, chunk_size, rule='any', max_workers=4)
+            self.assertEqual(result['answer'], 'yes')
+            self.assertLess(result['evaluated'], 10)
+            self.assertEqual(len({client for _, client in clients}), len(clients))
+            self.assertNotIn(id(yes_no.client), {client for _, client in clients})
+            self.assertEqual(yes_no.judge('都不违规吗？', file_path=f.name, chunk_size=chunk_size, rule='all'), 'no')
+        # 被取消的块也会关闭页面
+        self.assertEqual(self.server.pages, set())
+    
+    def test_judge_vote(self):
+        """测试多次提问投票在结果确定后提前结束"""
+        self.assertEqual(vote_outcome(3, 0, 2), 'yes')
+        self.assertIsNone(vote_outcome(2, 1, 2))
+        self.assertEqual(vote_outcome(1, 3, 1), 'no')
+        
+        answers = iter(['yes', 'no', 'yes', 'yes', 'no'])
+        lock = threading.Lock()
+        
+        def next_answer(message):
+            with lock:
+                return next(answers)
+        
+        self.server.yes_no_answer = next_answer
+        yes_no = DoubaoYesNo(self.server_url)
+        with patch('sys.stdout', new_callable=io.StringIO):
+            # 第一批3次为2:1，再提问1次即可确定
+            result = yes_no.judge_vote('地球是圆的吗？', max_calls=5)
+            self.assertEqual(result, {'answer': 'yes', 'confidence': 0.75, 'calls': 4,
+                                      'votes': {'yes': 3, 'no': 1, 'invalid': 0}})
+            
+            # 答案一致时只需要多数所需的次数
+            self.server.yes_no_answer = None
+            result = yes_no.judge_vote('地球是圆的吗？', max_calls=5)
+            self.assertEqual((result['answer'], result['confidence'], result['calls']), ('yes', 1.0, 3))
+            self.assertEqual(yes_no.judge('地球是圆的吗？', votes=3), 'yes')
+            
+            # 不合并相同请求时同样投票
+            calls = []
+            
+            def counted_answer(message):
+                with lock:
+                    calls.append(message)
+                return 'yes'
+            
+            self.server.yes_no_answer = counted_answer
+            self.assertEqual(DoubaoYesNo(self.server_url, coalesce=False).judge('地球是圆的吗？', votes=5), 'yes')
+            self.assertEqual(len(calls), 3)
+        self.assertEqual(self.server.pages, set())
+    
+    def test_text_chat_stream(self):
+        """测试流式聊天的增量事件和结束事件"""
+        client = DoubaoBrowserClient(self.server_url)
+        page_id = client.create_page()
+        events = list(client.text_chat_stream(page_id, '你好'))
+        self.assertTrue(all(event['type'] == 'delta' for event in events[:-1]))
+        self.assertGreater(len(events), 2)
+        self.assertEqual(''.join(event['text'] for event in events[:-1]), self.server.response)
+        self.assertEqual(events[-1]['type'], 'done')
+        self.assertEqual(events[-1]['response'], self.server.response)
+        
+        with patch('sys.stdout', new_callable=io.StringIO):
+            chunks = list(DoubaoTextChat(self.server_url).stream_message('你好'))
+        self.assertEqual(''.join(chunks), self.server.response)
+        # 包装器在流结束后关闭自己创建的页面
+        self.assertEqual(self.server.pages, {page_id})
+        
+        # 开始输出前队列已满时按提示退避重试，流结束时记录耗时
+        self.server.stop()
+        self.server = FakeBrowserServer(seed=0, latency={'/textChatStream': 'fixed:100'},
+                                        max_concurrency=1, max_queue=0, retry_after=0.05)
+        self.server_url = self.server.start()
+        clients = [DoubaoBrowserClient(self.server_url, backoff_base=0.01) for _ in range(3)]
+        page_ids = [client.create_page() for client in clients]
+        records = []
+        for client in clients:
+            client.add_timing_hook(records.append)
+        with patch('sys.stdout', new_callable=io.StringIO), ThreadPoolExecutor(max_workers=3) as executor:
+            streams = list(executor.map(lambda args: list(args[0].text_chat_stream(args[1], '你好')),
+                                        zip(clients, page_ids)))
+        self.assertTrue(all(events[-1]['type'] == 'done' for events in streams))
+        self.assertGreater(self.server.rejected, 0)
+        stream_records = [record for record in records if record['route'] == '/textChatStream']
+        self.assertIn(429, [record['status'] for record in stream_records])
+        self.assertEqual(sum(record['status'] == 200 for record in stream_records), 3)
+        self.assertTrue(all(record['server'] for record in stream_records if record['status'] == 200))
+    
+    def test_ocr_worker(self):
+        """测试常驻工作进程的逐行JSON协议"""
+        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+        self.addCleanup(os.remove, f.name)
+        requests_in = io.StringIO('\n'.join([
+            json.dumps({'id': 1, 'op': 'ocr', 'image_path': f.name}),
+            json.dumps({'id': 2, 'op': 'yesno', 'question': '地球是圆的吗？'}),
+            json.dumps({'id': 3, 'op': 'ocr', 'image_path': '/nonexistent.png'}),
+            'not json',
+            ''
+        ]))
+        responses_out = io.StringIO()
+        with patch('sys.stderr', new_callable=io.StringIO):
+            OCRWorker(self.server_url).serve(requests_in, responses_out)
+        
+        responses = [json.loads(line) for line in responses_out.getvalue().splitlines()]
+        self.assertEqual([response['id'] for response in responses], [1, 2, 3, None])
+        self.assertTrue(responses[0]['ok'])
+        self.assertEqual(responses[0]['result']['response'], self.server.response)
+        self.assertEqual(responses[1]['result'], {'answer': 'yes'})
+        self.assertFalse(responses[2]['ok'])
+        self.assertIn('文件不存在', responses[2]['error'])
+        self.assertFalse(responses[3]['ok'])
+    
+    def test_ai_gateway(self):
+        """测试进程内网关的接口和响应格式"""
+        import base64
+        import requests
+        gateway = AIGateway(port=0, server_url=self.server_url, enable_gemini=False)
+        gateway_url = gateway.start()
+        self.addCleanup(gateway.stop)
+        session = requests.Session()
+        
+        with patch('sys.stdout', new_callable=io.StringIO):
+            chat = session.post(f'{gateway_url}/v1/chat/completions',
+                                json={'messages': [{'role': 'user', 'content': '你好'}]}).json()
+            ocr = session.post(f'{gateway_url}/v1/ocr/recognize',
+                               json={'image_base64': base64.b64encode(b'\x89PNG\r\n\x1a\n').decode()}).json()
+            moderation = session.post(f'{gateway_url}/v1/moderations',
+                                      json={'input': 'text', 'question': '地球是圆的吗？'}).json()
+        self.assertEqual(chat['object'], 'chat.completion')
+        self.assertEqual(chat['choices'][0]['message']['content'], self.server.response)
+        self.assertEqual(chat['usage']['prompt_tokens'], 2)
+        self.assertEqual(ocr['result']['text'], self.server.response)
+        self.assertTrue(ocr['result']['success'])
+        self.assertFalse(moderation['results'][0]['flagged'])
+        self.assertEqual(moderation['results'][0]['original_result'], 'yes')
+        
+        # 参数错误、未知接口和不可用的Gemini模型
+        response = session.post(f'{gateway_url}/v1/chat/completions', json={'messages': []})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error']['param'], 'messages')
+        self.assertEqual(session.get(f'{gateway_url}/v1/unknown').status_code, 404)
+        response = session.post(f'{gateway_url}/v1/chat/completions',
+                                json={'model': 'gemini-2.5-flash', 'messages': [{'role': 'user', 'content': 'hi'}]})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(session.get(f'{gateway_url}/health').json()['status'], 'ok')
+    
+    def test_ai_gateway_stream(self):
+        """测试网关以SSE格式返回流式聊天补全"""
+        import requests
+        gateway = AIGateway(port=0, server_url=self.server_url, enable_gemini=False)
+        gateway_url = gateway.start()
+        self.addCleanup(gateway.stop)
+        
+        with patch('sys.stdout', new_callable=io.StringIO):
+            response = requests.post(f'{gateway_url}/v1/chat/completions', stream=True,
+                                     json={'stream': True, 'messages': [{'role': 'user', 'content': '你好'}]})
+            self.assertEqual(response.headers['Content-Type'], 'text/event-stream; charset=utf-8')
+            lines = [line for line in response.iter_lines(decode_unicode=True) if line]
+        self.assertEqual(lines[-1], 'data: [DONE]')
+        chunks = [json.loads(line[len('data: '):]) for line in lines[:-1]]
+        self.assertTrue(all(chunk['object'] == 'chat.completion.chunk' for chunk in chunks))
+        self.assertEqual(chunks[0]['choices'][0]['delta']['role'], 'assistant')
+        content = ''.join(chunk['choices'][0]['delta'].get('content', '') for chunk in chunks)
+        self.assertEqual(content, self.server.response)
+        self.assertEqual(chunks[-1]['choices'][0]['finish_reason'], 'stop')
+        self.assertEqual(chunks[-1]['usage']['completion_tokens'], len(self.server.response))
+        self.assertEqual(self.server.pages, set())
+        
+        # 流式请求同样先校验参数，出错时返回普通的JSON错误
+        response = requests.post(f'{gateway_url}/v1/chat/completions', json={'stream': True, 'messages': []})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(gateway.stats['active'], 0)
+    
+    def test_batch(self):
+        """测试批量任务的提交、进度、结果下载和恢复执行"""
+        import base64
+        batch_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, batch_dir, True)
+        gateway = AIGateway(port=0, server_url=self.server_url, enable_gemini=False, batch_dir=batch_dir)
+        gateway_url = gateway.start()
+        self.addCleanup(gateway.stop)
+        
+        lines = [
+            {'custom_id': 'chat', 'method': 'POST', 'url': '/v1/chat/completions',
+             'body': {'messages': [{'role': 'user', 'content': '你好'}]}},
+            {'custom_id': 'ocr', 'method': 'POST', 'url': '/v1/ocr/recognize',
+             'body': {'image_base64': base64.b64encode(b'\x89PNG\r\n\x1a\n').decode()}},
+            {'custom_id': 'yesno', 'method': 'POST', 'url': '/v1/moderations',
+             'body': {'input': 'text', 'question': '地球是圆的吗？'}},
+            {'custom_id': 'invalid', 'method': 'POST', 'url': '/v1/chat/completions', 'body': {'messages': []}}
+        ]
+        input_path = os.path.join(batch_dir, 'input.jsonl')
+        with open(input_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(json.dumps(line, ensure_ascii=False) for line in lines))
+        
+        client = BatchClient(gateway_url)
+        with patch('sys.stdout', new_callable=io.StringIO):
+            batch = client.create(input_path, metadata={'job': 'test'})
+            output = io.BytesIO()
+            batch = client.follow(batch['id'], output, interval=0.05)
+        self.assertEqual(batch['status'], 'completed')
+        self.assertEqual(batch['request_counts'], {'total': 4, 'completed': 3, 'failed': 1})
+        self.assertEqual(batch['metadata'], {'job': 'test'})
+        results = {json.loads(line)['custom_id']: json.loads(line) for line in output.getvalue().splitlines()}
+        self.assertEqual(set(results), {'chat', 'ocr', 'yesno'})
+        self.assertEqual(results['chat']['response']['body']['choices'][0]['message']['content'],
+                         self.server.response)
+        errors = [json.loads(line) for line in client.download(batch['id'], 'errors').splitlines()]
+        self.assertEqual(errors[0]['custom_id'], 'invalid')
+        self.assertEqual(errors[0]['response']['status_code'], 400)
+        self.assertEqual(client.list()[0]['id'], batch['id'])
+        
+        # 格式错误的请求和不存在的任务
+        with self.assertRaises(RuntimeError):
+            BatchClient(gateway_url).retrieve('batch_missing')
+        with self.assertRaises(ValueError):
+            parse_batch_input('{"custom_id": "a", "url": "/v1/unknown", "body": {}}')
+        
+        # 中断后恢复：已写入结果的请求不再执行
+        manager = BatchManager(lambda url, body: (200, {}), batch_dir)
+        with open(os.path.join(batch_dir, batch['id'], 'batch.json'), encoding='utf-8') as f:
+            saved = json.load(f)
+        saved.update(status='in_progress', request_counts={'total': 4, 'completed': 3, 'failed': 0})
+        with open(os.path.join(batch_dir, batch['id'], 'batch.json'), 'w', encoding='utf-8') as f:
+            json.dump(saved, f)
+        os.remove(os.path.join(batch_dir, batch['id'], 'errors.jsonl'))
+        self.assertEqual(manager.resume(), [batch['id']])
+        for _ in range(100):
+            if manager.get(batch['id'])['status'] == 'completed':
+                break
+            time.sleep(0.02)
+        self.assertEqual(manager.get(batch['id'])['request_counts']['completed'], 4)
+        manager.shutdown()
+        
+        # 在执行线程开始之前取消：不能被 in_progress 覆盖，最终为 cancelled 而不是 expired
+        manager = BatchManager(lambda url, body: (200, {}), batch_dir)
+        self.addCleanup(manager.shutdown)
+        with patch.object(manager, '_start', lambda batch_id: manager.cancel_events.__setitem__(batch_id, threading.Event())):
+            pending = manager.create(lines[:1])
+        self.assertEqual(manager.cancel(pending['id'])['status'], 'cancelling')
+        manager._run(pending['id'])
+        self.assertEqual(manager.get(pending['id'])['status'], 'cancelled')
+        self.assertEqual(manager.get(pending['id'])['request_counts']['completed'], 0)
+    
+    def test_ai_gateway_concurrency(self):
+        """测试网关并发处理请求"""
+        import requests
+        self.server.stop()
+        self.server = FakeBrowserServer(seed=0, latency={'/textChat': 'fixed:200'})
+        self.server_url = self.server.start()
+        gateway = AIGateway(port=0, server_url=self.server_url, max_workers=20)
+        gateway_url = gateway.start()
+        self.addCleanup(gateway.stop)
+        
+        def chat(_):
+            return requests.post(f'{gateway_url}/v1/chat/completions',
+                                 json={'messages': [{'role': 'user', 'content': '你好'}]}).status_code
+        
+        started = time.perf_counter()
+        with patch('sys.stdout', new_callable=io.StringIO), ThreadPoolExecutor(max_workers=20) as executor:
+            statuses = list(executor.map(chat, range(20)))
+        self.assertEqual(statuses, [200] * 20)
+        self.assertLess(time.perf_counter() - started, 2.0)
+    
+    def test_ocr_single_flight(self):
+        """测试同时进行中的相同识别请求只发送一次并共享结果"""
+        self.server.stop()
+        self.server = FakeBrowserServer(seed=0, latency={'/ocr': 'fixed:300'})
+        self.server_url = self.server.start()
+        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+        self.addCleanup(os.remove, f.name)
+        
+        def recognize(coalesce):
+            with ThreadPoolExecutor(max_workers=5) as executor:
+                return list(executor.map(
+                    lambda _: DoubaoOCR(self.server_url, coalesce=coalesce).recognize_image(f.name),
+                    range(5)))
+        
+        with patch('sys.stdout', new_callable=io.StringIO):
+            results = recognize(True)
+            self.assertEqual(self.server.request_counts['/ocr'], 1)
+            self.assertTrue(all(result['response'] == self.server.response for result in results))
+            # 每个调用方得到独立的副本
+            results[0]['response'] = 'changed'
+            self.assertEqual(results[1]['response'], self.server.response)
+            
+            recognize(False)
+            self.assertEqual(self.server.request_counts['/ocr'], 6)
+    
+    def test_benchmark(self):
+        """测试基准测试结果"""
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2.5)
+        self.assertIsNone(percentile([], 50))
+        
+        result = run_benchmark(self.server_url, 'text_chat', iterations=6, concurrency=2)
+        self.assertEqual(result['errors'], 0)
+        self.assertEqual(result['iterations'], 6)
+        self.assertIsNotNone(result['p95_ms'])
+    
+    def test_load_test_level(self):
+        """测试压力测试单个并发级别的统计"""
+        self.server.captcha_rate = 0.5
+        self.assertEqual(parse_mix('text=2,yesno'), {'text': 2.0, 'yesno': 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix('video=1')
+        
+        tester = LoadTester(self.server_url, parse_mix('text=1,yesno=1'), seed=1)
+        level = tester.run_level(2, requests_per_level=20)
+        
+        self.assertEqual(level['requests'], 20)
+        self.assertGreater(level['captcha_rate'], 0)
+        self.assertEqual(level['error_rate'], level['captcha_rate'])
+        self.assertEqual(set(level['stages']), {'create_page', 'request', 'close_page',
+                                                'server.latency', 'server.total'})
+        
+        # 单次请求抛出异常时计为错误，工作线程继续完成剩余的请求
+        import itertools
+        run_once = tester.run_once
+        calls = itertools.count(1)
+        
+        def flaky(client, operation):
+            if next(calls) % 2:
+                raise ValueError('响应不是有效的JSON')
+            return run_once(client, operation)
+        
+        self.server.captcha_rate = 0
+        with patch.object(tester, 'run_once', side_effect=flaky):
+            flaky_level = tester.run_level(2, requests_per_level=10)
+        self.assertEqual(flaky_level['requests'], 10)
+        self.assertEqual(flaky_level['error_rate'], 0.5)
+        
+        previous = {'levels': [dict(level, throughput_rps=level['throughput_rps'] / 2)]}
+        self.assertIn('+100.0%', compare_results(previous, {'levels': [level]})[0])
+
+
+class TestSingleFlight(unittest.TestCase):
+    """测试相同请求的合并执行"""
+    
+    def test_shared_exception(self):
+        """测试异常同样传给所有等待的调用方"""
+        group = SingleFlight()
+        started = threading.Event()
+        
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError('upstream failed')
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(group.do, 'key', fail)
+            started.wait()
+            follower = executor.submit(group.do, 'key', fail)
+            for future in (leader, follower):
+                with self.assertRaises(RuntimeError):
+                    future.result()
+        self.assertEqual(group.stats, {'executions': 1, 'shared': 1})
+        self.assertEqual(group.in_flight(), 0)
+
+
+class TestLatencyModel(unittest.TestCase):
+    """测试替身服务器的延迟分布"""
+    
+    def test_latency_model(self):
+        """测试延迟分布规格解析和采样"""
+        import random
+        rng = random.Random(0)
+        self.assertEqual(LatencyModel('fixed:250').sample(rng), 0.25)
+        self.assertTrue(0.02 <= LatencyModel('uniform:20,80').sample(rng) <= 0.08)
+        self.assertGreaterEqual(LatencyModel('normal:10,50').sample(rng), 0)
+        with self.assertRaises(ValueError):
+            LatencyModel('uniform:20')
+
+
+class TestModelStats(unittest.TestCase):
+    """测试Gemini模型统计与选择"""
+    
+    def test_model_stats(self):
+        """测试按延迟和错误率选择模型、配额超限暂停和统计持久化"""
+        import random
+        path = os.path.join(tempfile.mkdtemp(), 'stats.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        stats = ModelStats(path, alpha=0.5, explore=0, prior_latency=10.0)
+        
+        stats.record('slow', 'text_only', 8.0)
+        stats.record('fast', 'text_only', 2.0)
+        stats.record('fast', 'text_only', 4.0)
+        self.assertEqual(stats.expected_time('fast', 'text_only'), 3.0)
+        self.assertEqual(stats.expected_time('unknown', 'text_only'), 10.0)
+        self.assertEqual(stats.choose(['slow', 'fast', 'unknown'], 'text_only'), 'fast')
+        
+        # 错误率提高预期时间，配额超限的模型暂停使用
+        stats.record('fast', 'text_only', success=False)
+        self.assertEqual(stats.expected_time('fast', 'text_only'), 6.0)
+        self.assertEqual(stats.choose(['slow', 'fast'], 'text_only'), 'fast')
+        stats.record('fast', 'text_only', success=False, rate_limited=True)
+        self.assertTrue(stats.cooling_down('fast', 'text_only'))
+        self.assertEqual(stats.choose(['slow', 'fast'], 'text_only'), 'slow')
+        self.assertIsNone(stats.choose(['slow', 'fast'], 'text_only', available=lambda m: m != 'slow'))
+        
+        # 统计按任务类型区分，重新加载后保留
+        self.assertEqual(stats.expected_time('fast', 'image_supported'), 10.0)
+        reloaded = ModelStats(path, explore=0)
+        self.assertEqual(reloaded.snapshot('text_only')['fast']['errors'], 2)
+        self.assertEqual(reloaded.choose(['slow', 'fast'], 'text_only'), 'slow')
+        
+        # 探索时选择最优以外的可用模型
+        explorer = ModelStats(None, explore=1.0, rng=random.Random(0))
+        explorer.record('a', 'text_only', 1.0)
+        self.assertEqual(explorer.choose(['a', 'b'], 'text_only'), 'b')
+        self.assertEqual(explorer.choose(['a'], 'text_only'), 'a')
+
+
+class TestGeminiScheduler(unittest.TestCase):
+    """测试按配额调度的Gemini批量任务"""
+    
+    def test_quota_planner(self):
+        """测试按配额安排发送时间、预留配额、零点重置和按当前使用量预测完成时间"""
+        import datetime
+        from zoneinfo import ZoneInfo
+        pacific, shanghai = ZoneInfo('America/Los_Angeles'), ZoneInfo('Asia/Shanghai')
+        now = datetime.datetime(2026, 1, 1, 23, 0, tzinfo=pacific).timestamp()
+        midnight = next_reset(now)
+        self.assertEqual(midnight, datetime.datetime(2026, 1, 2, tzinfo=pacific).timestamp())
+        # 配额在太平洋时间零点重置，即北京时间16点（夏令时15点），而不是本地零点
+        morning = datetime.datetime(2026, 1, 1, 9, 0, tzinfo=shanghai).timestamp()
+        self.assertEqual(next_reset(morning), datetime.datetime(2026, 1, 1, 16, 0, tzinfo=shanghai).timestamp())
+        self.assertEqual(next_reset(morning, 'Asia/Shanghai'),
+                         datetime.datetime(2026, 1, 2, tzinfo=shanghai).timestamp())
+        limits = {'a': {'rpm_limit': 5, 'rpd_limit': 10}, 'b': {'rpm_limit': 2, 'rpd_limit': 5}}
+        priority = {'text_only': ['a', 'b'], 'image_supported': ['b']}
+        
+        # 预留20%后 a 每天8次、每15秒1次，b 每天4次、每37.5秒1次；超出今天配额的任务排到零点之后
+        planner = QuotaPlanner(limits, priority, reserve=0.2, spread=False, now=now)
+        plan = planner.plan(['text_only'] * 15, now=now)
+        self.assertEqual((plan['today'], plan['days']), (12, 2))
+        self.assertEqual(plan['by_model'], {'a': 10, 'b': 5})
+        self.assertEqual(plan['finish_at'], midnight + 15)
+        self.assertEqual(planner.acquire('text_only', now), (now, 'a', 0))
+        self.assertEqual(planner.acquire('image_supported', now), (now, 'b', 0))
+        
+        # 今天已用完的模型不再分配，按密钥分别计算
+        planner = QuotaPlanner(limits, priority, keys=2, reserve=0.2, spread=False, used_today={'a': 16}, now=now)
+        plan = planner.plan(['text_only'] * 8, now=now)
+        self.assertEqual(plan['by_model'], {'b': 8})
+        self.assertEqual(plan['days'], 1)
+        
+        # 分摊到零点前：第一次发送后一小时内还剩7次，间隔约514秒
+        planner = QuotaPlanner({'a': limits['a']}, {'text_only': ['a']}, reserve=0.2, now=now)
+        self.assertAlmostEqual(planner.plan(['text_only'] * 2, now=now)['finish_at'], now + 3600 / 7)
+        with self.assertRaises(ValueError):
+            QuotaPlanner(limits, priority, reserve=1)
+        with self.assertRaises(ValueError):
+            QuotaPlanner(limits, priority, timezone='Mars/Olympus_Mons')
+        with self.assertRaises(ValueError):
+            parse_jobs('{"custom_id": "x"}')
+    
+    def test_gemini_scheduler(self):
+        """测试调度执行：配额超限时改用其他模型，重新运行时跳过已完成的任务"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        limits = {'a': {'rpm_limit': float('inf'), 'rpd_limit': 100},
+                  'b': {'rpm_limit': float('inf'), 'rpd_limit': 100}}
+        calls = []
+        
+        def execute(job, model, key_index):
+            calls.append((job['custom_id'], model))
+            if model == 'a' and job['custom_id'] == 'q2':
+                raise QuotaExceededError('配额已用完', daily=True)
+            if job['custom_id'] == 'q3':
+                raise RuntimeError('bad request')
+            return {'success': True, 'response': job['question'].upper()}
+        
+        jobs = [{'custom_id': f'q{i}', 'question': f'question {i}'} for i in range(1, 5)]
+        planner = QuotaPlanner(limits, {'text_only': ['a', 'b']}, spread=False)
+        scheduler = GeminiScheduler(planner, directory, execute=execute, max_concurrency=1)
+        self.assertEqual(scheduler.run(jobs), {'completed': 3, 'failed': 1, 'remaining': 0})
+        self.assertEqual(calls, [('q1', 'a'), ('q2', 'a'), ('q2', 'b'), ('q3', 'b'), ('q4', 'b')])
+        
+        with open(os.path.join(directory, 'output.jsonl'), encoding='utf-8') as f:
+            output = {record['custom_id']: record for record in map(json.loads, f)}
+        self.assertEqual(output['q2']['model'], 'b')
+        self.assertEqual(output['q4']['response']['response'], 'QUESTION 4')
+        self.assertEqual(scheduler.pending(jobs), [])
+        
+        calls.clear()
+        self.assertEqual(scheduler.run(jobs + [{'custom_id': 'q5', 'question': 'question 5'}]),
+                         {'completed': 1, 'failed': 0, 'remaining': 0})
+        self.assertEqual(calls, [('q5', 'b')])
+        
+        # 每日配额用完的任务不计入重试次数，重新安排而不是记为失败
+        calls.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        scheduler = GeminiScheduler(QuotaPlanner(limits, {'text_only': ['a', 'b']}, spread=False), directory,
+                                    execute=execute, max_concurrency=1, max_retries=0)
+        self.assertEqual(scheduler.run([{'custom_id': 'q2', 'question': 'again'}]),
+                         {'completed': 1, 'failed': 0, 'remaining': 0})
+        self.assertEqual(calls, [('q2', 'a'), ('q2', 'b')])
+        
+        # 每分钟限额超限只暂停约一分钟，不占用当天的配额
+        now = time.time()
+        planner = QuotaPlanner(limits, {'text_only': ['a', 'b']}, spread=False, now=now)
+        planner.throttle('a', 0, now=now)
+        self.assertEqual(planner.acquire('text_only', now)[1], 'b')
+        self.assertEqual(planner.acquire('text_only', now + 61), (now + 61, 'a', 0))
+        
+        self.assertEqual(quota_error_scope('429 RESOURCE_EXHAUSTED quotaId: GenerateRequestsPerDayPerProjectPerModel-FreeTier'), 'day')
+        self.assertEqual(quota_error_scope('429 RESOURCE_EXHAUSTED quotaId: GenerateRequestsPerMinutePerProjectPerModel'), 'minute')
+        self.assertIsNone(quota_error_scope('400 INVALID_ARGUMENT: unsupported file'))
+        self.assertIsNone(quota_error_scope(None))
+
 
 if __name__ == '__main__':
     # 运行所有测试